@@ -1,6 +1,175 @@
-from django.contrib import admin
-from .models import Category, Product
+# admin.py
+"""
+Admins that stay fast on tables of millions of rows.
 
-# Register your models here.
-admin.site.register(Category)
-admin.site.register(Product)
\ No newline at end of file
+- Unfiltered changelists count with the planner's estimate on PostgreSQL
+  once a table is past ESTIMATED_COUNT_THRESHOLD rows, instead of an exact
+  COUNT(*), and never run the second, unfiltered count. Filtered and
+  searched changelists count exactly: an estimate off by orders of
+  magnitude would page through empty pages.
+- Related rows shown by list_display and by the __str__ of the objects
+  (change forms, autocomplete results, delete confirmations) are joined in
+  the same query.
+- Foreign keys are autocomplete widgets, not a <select> of the whole table.
+- Ordering, sorting and list filters only use indexed columns.
+- Bulk actions update in keyset batches (api/bulk.py), one transaction
+  each, keeping the rollups and cached responses in step.
+"""
+from django.contrib import admin, messages
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+from .bulk import adjust_stock, update_order_status
+from .models import Category, Order, OrderItem, Product, Review
+from .search import get_search_backend
+
+# Tables estimated above this many rows are not counted exactly
+ESTIMATED_COUNT_THRESHOLD = 100000
+
+# Rows per UPDATE and transaction of the bulk actions
+ACTION_BATCH_SIZE = 1000
+
+# Products returned by a changelist or autocomplete search
+PRODUCT_SEARCH_LIMIT = 200
+
+
+def estimated_count(queryset):
+    """
+    The rows of a whole table from the PostgreSQL pg_class statistics. None
+    for a filtered queryset, on other databases, or when the table was
+    never analyzed.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql' or queryset.query.where:
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(%s)',
+                       [queryset.model._meta.db_table])
+        row = cursor.fetchone()
+    return row[0] if row is not None and row[0] >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator counting exactly unless a whole large table is listed: its last pages may then be empty."""
+
+    @cached_property
+    def count(self):
+        estimate = estimated_count(self.object_list)
+        if estimate is not None and estimate > ESTIMATED_COUNT_THRESHOLD:
+            return estimate
+        return super().count
+
+
+class ScalableModelAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
+
+    def get_queryset(self, request):
+        # __str__ of these models reads the related rows of list_select_related
+        return super().get_queryset(request).select_related(*self.list_select_related or ())
+
+
+@admin.register(Category)
+class CategoryAdmin(ScalableModelAdmin):
+    list_display = ('id', 'name')
+    search_fields = ('name',)
+    ordering = ('name',)
+    sortable_by = ('id', 'name')
+
+
+@admin.register(Product)
+class ProductAdmin(ScalableModelAdmin):
+    list_display = ('id', 'name', 'category', 'price', 'stock', 'reserved', 'date_time_added')
+    list_select_related = ('category',)
+    list_filter = ('category',)  # product_cat_added_id_idx
+    autocomplete_fields = ('category',)
+    search_fields = ('name',)  # Served by the search backend, see get_search_results
+    ordering = ('-date_time_added', '-id')
+    sortable_by = ('id', 'date_time_added')
+    actions = ['add_10_to_stock', 'add_100_to_stock', 'remove_10_from_stock']
+
+    def get_search_results(self, request, queryset, search_term):
+        """An id, or a ranked full-text search through the search index instead of a LIKE scan."""
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        if search_term.isdigit():
+            return queryset.filter(pk=int(search_term)), False
+        ids = [product.pk for product in get_search_backend().search(search_term, limit=PRODUCT_SEARCH_LIMIT)]
+        return queryset.filter(pk__in=ids), False
+
+    def _adjust_stock(self, request, queryset, delta):
+        updated = adjust_stock(queryset, delta, batch_size=ACTION_BATCH_SIZE)
+        self.message_user(request, f"Stock of {updated} products changed by {delta:+d}.", messages.SUCCESS)
+
+    @admin.action(description="Add 10 units to stock", permissions=['change'])
+    def add_10_to_stock(self, request, queryset):
+        self._adjust_stock(request, queryset, 10)
+
+    @admin.action(description="Add 100 units to stock", permissions=['change'])
+    def add_100_to_stock(self, request, queryset):
+        self._adjust_stock(request, queryset, 100)
+
+    @admin.action(description="Remove 10 units from stock (not below the units held in carts)", permissions=['change'])
+    def remove_10_from_stock(self, request, queryset):
+        self._adjust_stock(request, queryset, -10)
+
+
+class OrderItemInline(admin.TabularInline):
+    model = OrderItem
+    autocomplete_fields = ('product',)
+    extra = 0
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('product')
+
+
+@admin.register(Order)
+class OrderAdmin(ScalableModelAdmin):
+    list_display = ('id', 'user', 'status', 'total_price', 'order_date')
+    list_select_related = ('user',)
+    list_filter = ('status',)  # order_status_date_idx
+    autocomplete_fields = ('user',)
+    search_fields = ('=id', '=user__username')
+    ordering = ('-order_date', '-id')
+    sortable_by = ('id', 'order_date')
+    inlines = [OrderItemInline]
+    actions = ['mark_shipped', 'mark_delivered', 'mark_cancelled']
+
+    def _set_status(self, request, queryset, status):
+        changed = update_order_status(queryset, status, batch_size=ACTION_BATCH_SIZE)
+        self.message_user(request, f"{changed} orders marked {status}.", messages.SUCCESS)
+
+    @admin.action(description="Mark selected orders as Shipped", permissions=['change'])
+    def mark_shipped(self, request, queryset):
+        self._set_status(request, queryset, 'Shipped')
+
+    @admin.action(description="Mark selected orders as Delivered", permissions=['change'])
+    def mark_delivered(self, request, queryset):
+        self._set_status(request, queryset, 'Delivered')
+
+    @admin.action(description="Mark selected orders as Cancelled", permissions=['change'])
+    def mark_cancelled(self, request, queryset):
+        self._set_status(request, queryset, 'Cancelled')
+
+
+@admin.register(OrderItem)
+class OrderItemAdmin(ScalableModelAdmin):
+    list_display = ('id', 'order', 'product', 'quantity', 'price')
+    list_select_related = ('order__user', 'product')
+    autocomplete_fields = ('order', 'product')
+    search_fields = ('=order__id',)
+    ordering = ('-id',)
+    sortable_by = ('id',)
+
+
+@admin.register(Review)
+class ReviewAdmin(ScalableModelAdmin):
+    list_display = ('id', 'product', 'user', 'rating', 'created_at')
+    list_select_related = ('product', 'user')
+    autocomplete_fields = ('product', 'user')
+    search_fields = ('=id', '=user__username')
+    ordering = ('-created_at', '-id')
+    sortable_by = ('id', 'created_at')
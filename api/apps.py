@@ -1,4 +1,6 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_migrate
 
 
 class apiConfig(AppConfig):
@@ -7,4 +9,9 @@ class apiConfig(AppConfig):
 
     def ready(self):
         import api.signals
+        from api.search import ensure_search_index
+        post_migrate.connect(ensure_search_index, sender=self)
+        from api.metrics import install, install_query_recorder
+        connection_created.connect(install_query_recorder, dispatch_uid='metrics_query_recorder')
+        install()
         return super().ready()
\ No newline at end of file
@@ -0,0 +1,105 @@
+# archive.py
+"""
+Archival of completed orders.
+
+Delivered and Cancelled orders older than ORDER_ARCHIVE_AFTER_DAYS are moved,
+with their items, from Order / OrderItem to ArchivedOrder / ArchivedOrderItem,
+keeping their ids, so the hot tables hold the recent and open orders only.
+
+The mover works in batches of a few hundred orders, one short transaction
+each: it locks the oldest archivable orders of a status (skipping rows
+another transaction holds), copies them and deletes them. Each batch is
+complete or not done at all, so the mover can be stopped at any time and
+simply resumes with the orders still left; run it during business hours
+with a pause between batches.
+
+Archived sales still count: the rows are deleted without the model signals,
+so the popularity counters and sales rollups keep them, and their rebuilds,
+like the recommendations build, read both tables.
+"""
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .invalidation import mark_dirty, object_tag
+from .models import ArchivedOrder, ArchivedOrderItem, Order, OrderItem
+
+# Statuses an order never leaves: only these are archived
+ARCHIVED_STATUSES = ('Delivered', 'Cancelled')
+
+ARCHIVE_BATCH_SIZE = 500
+
+
+def archive_cutoff(older_than_days=None, now=None):
+    """Orders placed before this moment may be archived."""
+    days = settings.ORDER_ARCHIVE_AFTER_DAYS if older_than_days is None else older_than_days
+    return (now or timezone.now()) - timedelta(days=days)
+
+
+def _delete_rows(model, column, ids):
+    """DELETE the rows of model whose column is in ids, in SQL: no deletion collector, no model signals."""
+    table, column = connection.ops.quote_name(model._meta.db_table), connection.ops.quote_name(column)
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {table} WHERE {column} IN ({", ".join(["%s"] * len(ids))})', ids)
+
+
+def archive_batch(cutoff, batch_size=ARCHIVE_BATCH_SIZE):
+    """
+    Move up to batch_size archivable orders placed before cutoff, with their
+    items, in one transaction. Returns (orders, items) moved.
+    """
+    with transaction.atomic():
+        orders = []
+        for status in ARCHIVED_STATUSES:
+            # Oldest first, read from the (status, order_date, id) index
+            orders += (
+                Order.objects.select_for_update(skip_locked=True)
+                .filter(status=status, order_date__lt=cutoff)
+                .order_by('order_date', 'id')
+                .values('id', 'user_id', 'total_price', 'status', 'order_date')[:batch_size - len(orders)]
+            )
+            if len(orders) >= batch_size:
+                break
+        if not orders:
+            return 0, 0
+        order_ids = [order['id'] for order in orders]
+        items = list(OrderItem.objects.filter(order_id__in=order_ids).values('id', 'order_id', 'product_id', 'quantity', 'price'))
+
+        ArchivedOrder.objects.bulk_create([ArchivedOrder(**order) for order in orders])
+        ArchivedOrderItem.objects.bulk_create([ArchivedOrderItem(**item) for item in items])
+        # Deleted in SQL: the delete signals would take the sales out of the counters and rollups
+        _delete_rows(OrderItem, OrderItem._meta.get_field('order').column, order_ids)
+        _delete_rows(Order, Order._meta.pk.column, order_ids)
+
+        mark_dirty(
+            {'order', 'orderitem'}
+            | {object_tag(Order, order_id) for order_id in order_ids}
+            | {object_tag(OrderItem, item['id']) for item in items}
+        )
+    return len(orders), len(items)
+
+
+def archive_orders(older_than_days=None, batch_size=ARCHIVE_BATCH_SIZE, max_batches=None, pause=0):
+    """
+    Archive every archivable order, batch after batch, sleeping pause seconds
+    between batches. Stops after max_batches when given. Returns a summary.
+    """
+    started = time.perf_counter()
+    cutoff = archive_cutoff(older_than_days)
+    summary = {'orders': 0, 'items': 0, 'batches': 0}
+    while max_batches is None or summary['batches'] < max_batches:
+        orders, items = archive_batch(cutoff, batch_size)
+        if not orders:
+            break
+        summary['orders'] += orders
+        summary['items'] += items
+        summary['batches'] += 1
+        if orders < batch_size:
+            break
+        if pause:
+            time.sleep(pause)
+    summary['seconds'] = time.perf_counter() - started
+    return summary
@@ -0,0 +1,207 @@
+# async_views.py
+"""
+Async versions of the hot catalog reads, served under ASGI (see lux/asgi.py
+and ASYNC_CATALOG_READS in settings).
+
+They return the same JSON as the viewsets and share their cache entries,
+tags, ETags and throttles. Rows are fetched with the async ORM and the cache
+is read with the async cache API, so a slow query holds a coroutine rather
+than a worker thread. Anything else on the same URLs (writes, the browsable
+API, ?format=) is handed to the regular viewset.
+"""
+import functools
+
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ValidationError
+from django.http import Http404, HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from rest_framework import exceptions
+from rest_framework.request import Request
+
+from .cach_keys import POPULAR_PRODUCTS_KEY_CACHE_KEY
+from .caching import (
+    aget_or_refresh,
+    aget_tagged,
+    aset_tagged,
+    atag_versions,
+    response_cache_key,
+    response_etag,
+    versions_last_modified,
+)
+from .fast_serializers import get_values_serializer
+from .fieldsets import select_fields
+from .invalidation import POPULAR_TAG
+from .mixins import CachedResponseMixin
+from .models import Product, ProductStats
+from .pagination import ordering_columns
+from .query_plan import get_query_plan
+from .renderers import FastJSONRenderer
+from .routers import use_primary_if_recent
+from .search import SEARCH_RESULT_LIMIT, get_search_backend
+from .serializers import CategorySerializer, ProductDetailSerializer, ProductSerializer
+from .stats import SUMMARY_FIELDS, review_summary
+from .views import POPULAR_PRODUCTS_TIMEOUT, CategoryViewSet, ProductViewSet, compute_popular_products
+
+ASYNC_METHODS = ('GET', 'HEAD')
+
+
+def with_sync_fallback(async_view, sync_view):
+    """
+    Serve JSON GET/HEAD requests with async_view and everything else with
+    the DRF view sync_view, so a URL keeps its write paths and browsable API.
+    """
+    sync_view = sync_to_async(sync_view)
+
+    async def view(request, *args, **kwargs):
+        if request.method in ASYNC_METHODS and _wants_json(request):
+            return await async_view(request, *args, **kwargs)
+        return await sync_view(request, *args, **kwargs)
+
+    view.csrf_exempt = True  # As DRF views are; authentication is by token
+    return view
+
+
+def _wants_json(request):
+    return 'format' not in request.GET and 'text/html' not in request.headers.get('Accept', '')
+
+
+def _json_response(data, status=200):
+    response = HttpResponse(FastJSONRenderer().render(data), status=status, content_type='application/json')
+    patch_vary_headers(response, ['Accept'])
+    return response
+
+
+def _error_response(exc):
+    data = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+    response = _json_response(data, status=exc.status_code)
+    if getattr(exc, 'auth_header', None):
+        response['WWW-Authenticate'] = exc.auth_header
+    if getattr(exc, 'wait', None):
+        response['Retry-After'] = '%d' % exc.wait
+    return response
+
+
+def _check_throttles(request, viewset):
+    """Authenticate and apply the viewset's throttles (and throttle_scope) as the viewset would."""
+    authenticators = [auth() for auth in viewset.authentication_classes]
+    drf_request = Request(request, authenticators=authenticators)
+    try:
+        drf_request.user
+    except exceptions.AuthenticationFailed as exc:
+        if authenticators:
+            exc.auth_header = authenticators[0].authenticate_header(drf_request)
+        raise
+    durations = [
+        throttle.wait() for throttle in (cls() for cls in viewset.throttle_classes)
+        if not throttle.allow_request(drf_request, viewset)
+    ]
+    if durations:
+        raise exceptions.Throttled(max((d for d in durations if d is not None), default=None))
+
+
+def async_read(viewset):
+    """Throttle an async read as viewset would and turn errors into DRF-style JSON responses."""
+    def decorator(handler):
+        @functools.wraps(handler)
+        async def view(request, *args, **kwargs):
+            try:
+                await sync_to_async(_check_throttles)(request, viewset)
+                return await handler(request, *args, **kwargs)
+            except Http404 as exc:
+                return _error_response(exceptions.NotFound(*exc.args))
+            except exceptions.APIException as exc:
+                return _error_response(exc)
+        return view
+    return decorator
+
+
+async def _cached_response(request, viewset, tags, compute):
+    """The async counterpart of CachedResponseMixin._cached_response, sharing its entries."""
+    basename = viewset.queryset.model._meta.object_name.lower()  # The router's default basename
+    key = response_cache_key(basename, request.build_absolute_uri())
+    versions = await atag_versions(tags)
+
+    validators = None
+    if viewset.conditional_get:
+        validators = response_etag(key, FastJSONRenderer.format, versions), versions_last_modified(versions)
+        not_modified = get_conditional_response(request, etag=validators[0], last_modified=validators[1])
+        if not_modified is not None:
+            return CachedResponseMixin._add_validators(not_modified, validators)
+
+    data = await aget_tagged(key, versions)
+    if data is None:
+        with use_primary_if_recent(versions):
+            data = await compute()
+        await aset_tagged(key, data, versions, viewset.cache_timeout)
+    response = _json_response(data)
+    if validators is not None:
+        CachedResponseMixin._add_validators(response, validators)
+    return response
+
+
+@async_read(ProductViewSet)
+async def product_list(request):
+    async def compute():
+        fast = get_values_serializer(ProductSerializer, tuple(ProductSerializer(context={'request': request}).fields))
+        paginator = ProductViewSet.pagination_class()
+        columns = dict.fromkeys([*fast.columns, *ordering_columns(ProductViewSet.pagination_class)])
+        page = await paginator.apaginate_queryset(Product.objects.values(*columns), Request(request))
+        return paginator.get_paginated_response(fast.serialize(page, {'request': request})).data
+
+    return await _cached_response(request, ProductViewSet, ProductViewSet.cache_list_tags, compute)
+
+
+@async_read(ProductViewSet)
+async def product_detail(request, pk):
+    async def compute():
+        names = tuple(ProductDetailSerializer(context={'request': request}).fields)
+        fast = get_values_serializer(ProductSerializer, tuple(name for name in names if name != 'review_summary'))
+        try:
+            row = await Product.objects.values(*fast.columns).aget(pk=pk)
+        except (Product.DoesNotExist, TypeError, ValueError, ValidationError):
+            raise Http404('No Product matches the given query.')
+        data = fast.serialize([row], {'request': request})[0]
+        if 'review_summary' in names:
+            stats = await ProductStats.objects.filter(product_id=pk).values(*SUMMARY_FIELDS).afirst()
+            data['review_summary'] = review_summary(stats)
+        return data
+
+    tags = [tag.format(pk=pk) for tag in ProductViewSet.cache_detail_tags]
+    return await _cached_response(request, ProductViewSet, tags, compute)
+
+
+@async_read(ProductViewSet)
+async def popular_products(request):
+    data = await aget_or_refresh(
+        POPULAR_PRODUCTS_KEY_CACHE_KEY, lambda: compute_popular_products(request),
+        timeout=POPULAR_PRODUCTS_TIMEOUT, tags=[POPULAR_TAG],
+    )
+    return _json_response(select_fields(data, request))
+
+
+@async_read(ProductViewSet)
+async def search_products(request):
+    query = request.GET.get('query', '')
+    if not query:
+        return _json_response([])
+    try:
+        limit = min(int(request.GET.get('limit', SEARCH_RESULT_LIMIT)), SEARCH_RESULT_LIMIT)
+    except ValueError:
+        limit = SEARCH_RESULT_LIMIT
+    products = await get_search_backend().asearch(query, limit=max(limit, 1))
+    data = get_values_serializer(ProductSerializer).serialize(products, {'request': request})
+    return _json_response(select_fields(data, request))
+
+
+@async_read(CategoryViewSet)
+async def category_list(request):
+    async def compute():
+        context = {'request': request}
+        queryset = get_query_plan(CategorySerializer(context=context)).apply(
+            CategoryViewSet.queryset.all(), also=ordering_columns(CategoryViewSet.pagination_class)
+        )
+        paginator = CategoryViewSet.pagination_class()
+        page = await paginator.apaginate_queryset(queryset, Request(request))
+        return paginator.get_paginated_response(CategorySerializer(page, many=True, context=context).data).data
+
+    return await _cached_response(request, CategoryViewSet, CategoryViewSet.cache_list_tags, compute)
@@ -0,0 +1,131 @@
+# authentication.py
+import hmac
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework.authentication import BaseAuthentication, get_authorization_header
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+# Short enough to bound staleness after writes that bypass the User signals (queryset.update())
+USER_CACHE_TIMEOUT = 300
+
+
+def user_cache_key(pk):
+    return f'user_fields:{pk}'
+
+
+# The only User fields kept in the cache: never the password hash or the full model
+CACHED_USER_FIELDS = ('pk', 'username', 'is_active', 'is_staff', 'is_superuser')
+
+
+def _cache_entry(user):
+    """The cached form of user: a few fields, and a digest of the password hash for the revoke check."""
+    entry = {field: getattr(user, field) for field in CACHED_USER_FIELDS}
+    entry['password_md5'] = get_md5_hash_password(user.password)
+    return entry
+
+
+def _from_cache_entry(entry):
+    """
+    A User carrying only the cached fields, for request.user and rendering.
+    Its password is None, so saving it fails instead of wiping the stored hash.
+    """
+    entry = dict(entry)
+    password_md5 = entry.pop('password_md5')
+    user = get_user_model()(**entry, password=None)
+    user._state.adding = False
+    user.password_md5 = password_md5
+    return user
+
+
+def get_cached_user(pk):
+    """Return the user with primary key pk from the cache, loading it on a miss. None if it doesn't exist."""
+    key = user_cache_key(pk)
+    entry = cache.get(key)
+    if entry is None:
+        user = get_user_model().objects.filter(pk=pk).first()
+        if user is None:
+            return None
+        entry = _cache_entry(user)
+        cache.set(key, entry, USER_CACHE_TIMEOUT)
+    return _from_cache_entry(entry)
+
+
+def get_cached_users(pks):
+    """Map each primary key to its user: one cache read, plus one query for the misses."""
+    keys = {user_cache_key(pk): pk for pk in pks}
+    entries = {keys[key]: entry for key, entry in cache.get_many(keys).items()}
+    missing = [pk for pk in keys.values() if pk not in entries]
+    if missing:
+        loaded = {user.pk: _cache_entry(user) for user in get_user_model().objects.filter(pk__in=missing)}
+        cache.set_many({user_cache_key(pk): entry for pk, entry in loaded.items()}, USER_CACHE_TIMEOUT)
+        entries.update(loaded)
+    return {pk: _from_cache_entry(entry) for pk, entry in entries.items()}
+
+
+def forget_user(pk):
+    """Drop the cached user once the current transaction commits."""
+    transaction.on_commit(lambda: cache.delete(user_cache_key(pk)))
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that resolves the token's user through the user cache
+    instead of querying auth_user on every request.
+
+    The User signals in api/signals.py drop the cached entry on every save
+    or delete, so deactivating a user, changing their password (with
+    CHECK_REVOKE_TOKEN) or renaming them takes effect on the next request.
+    The same checks as JWTAuthentication then run on the cached user.
+    """
+
+    def get_user(self, validated_token):
+        if jwt_settings.USER_ID_FIELD != self.user_model._meta.pk.name:
+            # The cache is keyed by primary key
+            return super().get_user(validated_token)
+
+        try:
+            user_id = validated_token[jwt_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        try:
+            user = get_cached_user(user_id)
+        except (TypeError, ValueError):
+            user = None
+        if user is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+
+        if jwt_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if jwt_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(jwt_settings.REVOKE_TOKEN_CLAIM) != user.password_md5:
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+
+        return user
+
+
+class MetricsTokenAuthentication(BaseAuthentication):
+    """
+    Accept 'Authorization: Bearer <METRICS_TOKEN>' from the Prometheus
+    scraper, with request.auth set to 'metrics'. Any other credentials are
+    left to the next authentication class.
+    """
+
+    def authenticate(self, request):
+        token = settings.METRICS_TOKEN
+        parts = get_authorization_header(request).split()
+        if token and len(parts) == 2 and parts[0].lower() == b'bearer' and hmac.compare_digest(parts[1], token.encode()):
+            return AnonymousUser(), 'metrics'
+        return None
+
+    def authenticate_header(self, request):
+        return 'Bearer realm="api"'
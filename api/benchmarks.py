@@ -0,0 +1,202 @@
+# benchmarks.py
+"""
+Per-route latency, throughput and SQL query count of the API, measured
+in-process with the test client against whatever data the database holds
+(see api/synthetic.py and the generate_synthetic_data command).
+
+Every route of api/urls.py is listed in ROUTES, or in UNBENCHMARKED with
+the reason, and has a budget in BUDGETS: the most SQL queries one request
+may run, and its p95 latency in milliseconds. The bench_endpoints command
+prints the figures against the budgets, and BenchmarkBudgetTests fails the
+build when a change goes over one (an N+1 query, a slow popular list...).
+
+By default every request is cold: the cache is cleared before it, so the
+figures are those of the code and the database rather than of the cache.
+Throttles are lifted for the run.
+"""
+import statistics
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework.views import APIView
+
+from .models import Category, Order, OrderItem, ProductStats, Review
+
+# user is who sends the request: None (anonymous), 'shopper' or 'staff'
+Route = namedtuple('Route', ['name', 'method', 'path', 'user', 'data'], defaults=[None, None])
+
+ROUTES = [
+    Route('api-root', 'GET', '/api/'),
+    Route('swagger-docs', 'GET', '/api/docs/?format=openapi'),
+    Route('redoc-docs', 'GET', '/api/redoc/'),
+    Route('category-list', 'GET', '/api/categories/'),
+    Route('category-detail', 'GET', '/api/categories/{category}/'),
+    Route('category-products', 'GET', '/api/categories/{category}/products/'),
+    Route('product-list', 'GET', '/api/products/'),
+    Route('product-detail', 'GET', '/api/products/{product}/'),
+    Route('product-popular-products', 'GET', '/api/products/popular/'),
+    Route('product-search-products', 'GET', '/api/products/search/?query=wireless+speaker'),
+    Route('product-related', 'GET', '/api/products/{product}/related/'),
+    Route('product-reviews', 'GET', '/api/products/{product}/reviews/'),
+    Route('product-availability', 'GET', '/api/products/availability/?id={product}'),
+    Route('product-export-products', 'GET', '/api/products/export/', 'staff'),
+    Route('order-list', 'GET', '/api/orders/'),
+    Route('order-detail', 'GET', '/api/orders/{order}/'),
+    Route('order-checkout', 'POST', '/api/orders/checkout/', 'shopper',
+          {'items': [{'product_id': '{product}', 'quantity': 1}]}),
+    Route('order-export-orders', 'GET', '/api/orders/export/', 'staff'),
+    Route('order-history', 'GET', '/api/orders/history/', 'shopper'),
+    Route('orderitem-list', 'GET', '/api/order-items/'),
+    Route('orderitem-detail', 'GET', '/api/order-items/{order_item}/'),
+    Route('orderitem-export-order-items', 'GET', '/api/order-items/export/', 'staff'),
+    Route('review-list', 'GET', '/api/reviews/'),
+    Route('review-detail', 'GET', '/api/reviews/{review}/'),
+    Route('cart-list', 'POST', '/api/cart/', 'shopper', {'product_id': '{product}', 'quantity': 1}),
+    Route('sales-report-list', 'GET', '/api/reports/sales/?interval=week', 'staff'),
+    Route('sales-report-top', 'GET', '/api/reports/sales/top/', 'staff'),
+    Route('metrics', 'GET', '/api/metrics/', 'staff'),
+]
+
+# Routes of api/urls.py without a benchmark, and why
+UNBENCHMARKED = {
+    'token_obtain_pair': "dominated by password hashing",
+    'token_refresh': "token signing only, no queries",
+    'product-bulk-import': "covered by BulkImportExportTests; its cost grows with the upload",
+    'cart-detail': "DELETE of a hold, the same statements as cart-list POST",
+}
+
+# Route name -> (most SQL queries per request, p95 latency in ms), on the 'tiny' synthetic dataset
+BUDGETS = {
+    'api-root': (0, 50),
+    'swagger-docs': (0, 50),
+    'redoc-docs': (0, 50),
+    'category-list': (3, 150),
+    'category-detail': (3, 75),
+    'category-products': (3, 75),
+    'product-list': (2, 75),
+    'product-detail': (2, 75),
+    'product-popular-products': (2, 75),
+    'product-search-products': (2, 75),
+    'product-related': (3, 75),
+    'product-reviews': (4, 100),
+    'product-availability': (2, 50),
+    'product-export-products': (2, 75),
+    'order-list': (4, 150),
+    'order-detail': (4, 75),
+    'order-checkout': (20, 100),
+    'order-export-orders': (2, 75),
+    'order-history': (6, 75),
+    'orderitem-list': (2, 100),
+    'orderitem-detail': (2, 50),
+    'orderitem-export-order-items': (2, 100),
+    'review-list': (3, 100),
+    'review-detail': (3, 75),
+    'cart-list': (7, 50),
+    'sales-report-list': (2, 50),
+    'sales-report-top': (2, 50),
+    'metrics': (0, 50),
+}
+
+Result = namedtuple('Result', ['name', 'method', 'path', 'status', 'queries', 'p50_ms', 'p95_ms', 'rps'])
+
+
+@contextmanager
+def _unthrottled():
+    """Lift every throttle: the harness sends far more requests than any rate allows."""
+    throttles = APIView.throttle_classes
+    APIView.throttle_classes = ()
+    try:
+        yield
+    finally:
+        APIView.throttle_classes = throttles
+
+
+def sample_ids():
+    """The objects the route paths point at: the most ordered product and its neighbours in the data."""
+    stats = ProductStats.objects.order_by('-order_count', '-rating_avg', '-product').first()
+    product_id = stats.product_id if stats is not None else None
+    return {
+        'product': product_id,
+        'category': Category.objects.filter(products=product_id).values_list('id', flat=True).first(),
+        'order': Order.objects.order_by('-order_date', '-id').values_list('id', flat=True).first(),
+        'order_item': OrderItem.objects.order_by('-id').values_list('id', flat=True).first(),
+        'review': Review.objects.filter(product=product_id).order_by('-id').values_list('id', flat=True).first(),
+    }
+
+
+def _fill(value, ids):
+    """Substitute {product}-style placeholders in a path or request body."""
+    if isinstance(value, str):
+        value = value.format(**ids)
+        return int(value) if value.isdigit() else value
+    if isinstance(value, dict):
+        return {key: _fill(item, ids) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_fill(item, ids) for item in value]
+    return value
+
+
+def _clients():
+    """Test clients for each kind of Route.user, their users created in the current transaction."""
+    host = next((host for host in settings.ALLOWED_HOSTS if host != '*' and not host.startswith('.')), 'localhost')
+    stamp = timezone.now().strftime('%Y%m%d%H%M%S%f')
+    clients = {None: APIClient(HTTP_HOST=host)}
+    for name, staff in (('shopper', False), ('staff', True)):
+        clients[name] = APIClient(HTTP_HOST=host)
+        clients[name].force_authenticate(User.objects.create(username=f'bench-{name}-{stamp}', is_staff=staff))
+    return clients
+
+
+def measure(client, route, ids, iterations=20, warm=False):
+    """Send route iterations times (after one discarded warm-up request) and return its Result."""
+    path, data = _fill(route.path, ids), _fill(route.data, ids)
+    timings, queries, status = [], 0, None
+    for iteration in range(iterations + 1):
+        if not warm:
+            cache.clear()
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            send = getattr(client, route.method.lower())
+            response = send(path) if data is None else send(path, data, format='json')
+            if response.streaming:
+                b''.join(response.streaming_content)
+            elapsed = time.perf_counter() - started
+        if iteration:
+            timings.append(elapsed)
+            queries = max(queries, len(captured))
+        status = response.status_code
+    quantiles = statistics.quantiles(timings, n=100, method='inclusive') if len(timings) > 1 else timings * 99
+    return Result(route.name, route.method, path, status, queries, 1000 * quantiles[49], 1000 * quantiles[94],
+                  len(timings) / sum(timings))
+
+
+def run_benchmarks(routes=None, iterations=20, warm=False):
+    """Measure routes (all of ROUTES by default). Run it inside a transaction that is rolled back: checkout writes."""
+    ids = sample_ids()
+    clients = _clients()
+    with _unthrottled():
+        return [
+            measure(clients[route.user], route, ids, iterations, warm)
+            for route in (ROUTES if routes is None else routes)
+        ]
+
+
+def over_budget(result, latency_factor=1.0):
+    """What result exceeds in its budget, as a list of messages (empty when within it)."""
+    max_queries, max_p95_ms = BUDGETS[result.name]
+    problems = []
+    if result.status >= 400:
+        problems.append(f"status {result.status}")
+    if result.queries > max_queries:
+        problems.append(f"{result.queries} queries > {max_queries}")
+    if result.p95_ms > max_p95_ms * latency_factor:
+        problems.append(f"p95 {result.p95_ms:.1f}ms > {max_p95_ms * latency_factor:.0f}ms")
+    return problems
@@ -0,0 +1,370 @@
+# bulk.py
+import csv
+import io
+import json
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .caching import invalidate_tags
+from .invalidation import CATALOG_TAG, POPULAR_TAG, mark_dirty, object_tag
+from .models import Category, Order, OrderItem, Product, ProductStats
+from .rollups import order_statuses_changed, product_categories_changed
+from .search import get_search_backend
+
+FORMATS = ('jsonl', 'csv')
+
+DEFAULT_BATCH_SIZE = 1000
+
+# Report at most this many bad rows back to the caller
+MAX_REPORTED_ERRORS = 100
+
+PRODUCT_IMPORT_FIELDS = ['id', 'name', 'description', 'price', 'stock', 'category']
+
+# Columns of each export, as (header, values_list lookup)
+EXPORTS = {
+    'products': (
+        Product,
+        [('id', 'id'), ('name', 'name'), ('description', 'description'), ('price', 'price'),
+         ('stock', 'stock'), ('category', 'category__name'), ('date_time_added', 'date_time_added'),
+         ('updated_at', 'updated_at')],
+    ),
+    'orders': (
+        Order,
+        [('id', 'id'), ('user', 'user__username'), ('total_price', 'total_price'), ('status', 'status'),
+         ('order_date', 'order_date')],
+    ),
+    'order-items': (
+        OrderItem,
+        [('id', 'id'), ('order', 'order_id'), ('product', 'product_id'), ('quantity', 'quantity'),
+         ('price', 'price')],
+    ),
+}
+
+
+def guess_format(filename, default='jsonl'):
+    """Pick the format from a file extension."""
+    if filename and filename.lower().endswith('.csv'):
+        return 'csv'
+    if filename and filename.lower().endswith(('.jsonl', '.ndjson', '.json')):
+        return 'jsonl'
+    return default
+
+
+def _lines(rows):
+    """
+    Number the rows of a text reader, ending with a ValueError row instead of
+    raising when the input is not UTF-8 or not valid CSV: the rest of the
+    file cannot be read reliably, so it is reported and skipped.
+    """
+    iterator = iter(rows)
+    line_number = 0
+    while True:
+        try:
+            row = next(iterator)
+        except StopIteration:
+            return
+        except UnicodeDecodeError:
+            yield line_number + 1, ValueError("not valid UTF-8 text; the rest of the file was not read")
+            return
+        except csv.Error as error:
+            yield line_number + 1, ValueError(f"invalid CSV ({error}); the rest of the file was not read")
+            return
+        line_number += 1
+        yield line_number, row
+
+
+def iter_records(stream, fmt):
+    """
+    Yield (line_number, record dict) from a text stream one row at a time,
+    so input of any size is parsed in constant memory. Rows that can't be
+    parsed are yielded as (line_number, ValueError).
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for _, record in _lines(reader):
+            if isinstance(record, ValueError):
+                yield reader.line_num + 1, record  # The reader stopped before the unreadable line
+            else:
+                yield reader.line_num, record
+        return
+    for line_number, line in _lines(stream):
+        if isinstance(line, ValueError):
+            yield line_number, line
+            continue
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+            if not isinstance(record, dict):
+                raise ValueError("expected a JSON object")
+        except ValueError as error:
+            yield line_number, ValueError(f"invalid JSON: {error}")
+            continue
+        yield line_number, record
+
+
+def _batches(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+# Largest value of a PositiveIntegerField / integer primary key on every backend
+MAX_INTEGER = 2147483647
+
+
+def _string(record, field):
+    """A text field of a record, '' when missing; anything but a string is an error."""
+    value = record.get(field)
+    if value is None:
+        return ''
+    if not isinstance(value, str):
+        raise ValueError(f"{field} must be a string")
+    return value
+
+
+def _integer(record, field):
+    """A non-negative integer field of a record (an int or a numeric string), None when missing."""
+    value = record.get(field)
+    if value in ('', None):
+        return None
+    if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+        raise ValueError(f"invalid {field} {value!r}")
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"invalid {field} {value!r}")
+    if not 0 <= value <= MAX_INTEGER:
+        raise ValueError(f"{field} {value} out of range")
+    return value
+
+
+def _parse_product(record):
+    """Validate one import record, returning clean values or raising ValueError."""
+    name = _string(record, 'name').strip()
+    category = _string(record, 'category').strip()
+    description = _string(record, 'description')
+    if not name:
+        raise ValueError("name is required")
+    if not category:
+        raise ValueError("category is required")
+    if len(name) > 255 or len(category) > 255:
+        raise ValueError("name and category are limited to 255 characters")
+    raw_price = record.get('price')
+    if isinstance(raw_price, bool) or not isinstance(raw_price, (str, int, float)):
+        raise ValueError(f"invalid price {raw_price!r}")
+    try:
+        price = Decimal(str(raw_price).strip())
+    except InvalidOperation:
+        raise ValueError(f"invalid price {raw_price!r}")
+    if not price.is_finite():
+        raise ValueError(f"invalid price {raw_price!r}")
+    if price < 0 or price >= Decimal('1e8'):
+        raise ValueError(f"price {price} out of range")
+    stock = _integer(record, 'stock')
+    if stock is None:
+        raise ValueError("stock is required")
+    return {
+        'id': _integer(record, 'id'),
+        'name': name,
+        'description': description,
+        'price': price.quantize(Decimal('0.01')),
+        'stock': stock,
+        'category': category,
+    }
+
+
+def _resolve_categories(names):
+    """Map category names to ids, creating the missing categories in one statement."""
+    categories = dict(Category.objects.filter(name__in=names).values_list('name', 'id'))
+    missing = [name for name in names if name not in categories]
+    if missing:
+        Category.objects.bulk_create([Category(name=name) for name in missing], ignore_conflicts=True)
+        categories.update(Category.objects.filter(name__in=missing).values_list('name', 'id'))
+    return categories
+
+
+def import_products(records, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Create or update products from (line_number, record) pairs.
+
+    Records with an id update that product, the others are created. Each
+    batch resolves its category names with one query, writes with one
+    bulk_create and one bulk_update and commits on its own, so an import of
+    any size holds locks only briefly. The per-row model signals don't run:
+    popularity rows, the search index and the category sales rollups of
+    moved products are maintained per batch, and the cache is invalidated
+    once at the end.
+    """
+    summary = {'created': 0, 'updated': 0, 'failed': 0, 'errors': []}
+    touched_categories = set()
+    search = get_search_backend()
+
+    def fail(line_number, error):
+        summary['failed'] += 1
+        if len(summary['errors']) < MAX_REPORTED_ERRORS:
+            summary['errors'].append({'line': line_number, 'error': str(error)})
+
+    for batch in _batches(records, batch_size):
+        rows = []
+        for line_number, record in batch:
+            if isinstance(record, Exception):
+                fail(line_number, record)
+                continue
+            try:
+                rows.append((line_number, _parse_product(record)))
+            except ValueError as error:
+                fail(line_number, error)
+        if not rows:
+            continue
+
+        with transaction.atomic():
+            categories = _resolve_categories({row['category'] for _, row in rows})
+            update_ids = {row['id'] for _, row in rows if row['id'] is not None}
+            # Locked: no cart reserves units of a product while its stock is checked and written
+            existing = {
+                product_id: (category_id, reserved) for product_id, category_id, reserved
+                in Product.objects.select_for_update().filter(pk__in=update_ids).values_list('id', 'category_id', 'reserved')
+            }
+            now = timezone.now()
+            to_create, to_update = [], []
+            for line_number, row in rows:
+                product = Product(
+                    name=row['name'], description=row['description'], price=row['price'],
+                    stock=row['stock'], category_id=categories[row['category']],
+                )
+                if row['id'] is None:
+                    to_create.append(product)
+                elif row['id'] in existing:
+                    reserved = existing[row['id']][1]
+                    if row['stock'] < reserved:
+                        fail(line_number, f"stock {row['stock']} is below the {reserved} units held in carts")
+                        continue
+                    product.pk = row['id']
+                    product.updated_at = now
+                    to_update.append(product)
+                else:
+                    fail(line_number, f"product {row['id']} does not exist")
+                    continue
+                touched_categories.add(product.category_id)
+
+            created = Product.objects.bulk_create(to_create, batch_size=batch_size)
+            Product.objects.bulk_update(
+                to_update, ['name', 'description', 'price', 'stock', 'category', 'updated_at'], batch_size=batch_size
+            )
+            ProductStats.objects.bulk_create(
+                [ProductStats(product_id=product.pk) for product in created if product.pk is not None],
+                ignore_conflicts=True,
+            )
+            search.index_products(created + to_update)
+            product_categories_changed({product.pk: (existing[product.pk][0], product.category_id) for product in to_update})
+
+        summary['created'] += len(created)
+        summary['updated'] += len(to_update)
+
+    if summary['created'] or summary['updated']:
+        # One invalidation for the whole import instead of one per row
+        invalidate_tags({'product', 'category', CATALOG_TAG, POPULAR_TAG}
+                        | {f'category:{category_id}' for category_id in touched_categories})
+    return summary
+
+
+def pk_batches(queryset, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Yield the primary keys of queryset in ascending batches, each read with
+    a keyset query (pk > last one), so a selection of any size is walked
+    without OFFSET or holding every id in memory.
+    """
+    queryset = queryset.order_by('pk').values_list('pk', flat=True)
+    last = None
+    while True:
+        batch = list((queryset if last is None else queryset.filter(pk__gt=last))[:batch_size])
+        if not batch:
+            return
+        yield batch
+        last = batch[-1]
+
+
+def update_order_status(queryset, status, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Set the status of the orders of queryset, one transaction per batch.
+    Each batch is one UPDATE; the sales rollups of the orders that changed
+    are moved and their cached responses invalidated as the model signals
+    would. Returns the number of orders changed.
+    """
+    changed = 0
+    for batch in pk_batches(queryset.exclude(status=status), batch_size):
+        with transaction.atomic():
+            orders = list(
+                Order.objects.select_for_update().filter(pk__in=batch).exclude(status=status)
+                .values_list('id', 'order_date', 'status')
+            )
+            Order.objects.filter(pk__in=[order_id for order_id, _, _ in orders]).update(status=status)
+            order_statuses_changed([(order_id, order_date, old, status) for order_id, order_date, old in orders])
+            mark_dirty({'order'} | {object_tag(Order, order_id) for order_id, _, _ in orders})
+        changed += len(orders)
+    return changed
+
+
+def adjust_stock(queryset, delta, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Add delta (possibly negative) to the stock of the products of queryset,
+    one UPDATE and transaction per batch. Stock never drops below the units
+    held in carts. Returns the number of products updated.
+    """
+    updated = 0
+    now = timezone.now()
+    for batch in pk_batches(queryset, batch_size):
+        with transaction.atomic():
+            updated += Product.objects.filter(pk__in=batch).update(
+                stock=Greatest(F('stock') + delta, F('reserved')), updated_at=now,
+            )
+            # One tag per bulk write instead of one per product, as for imports
+            mark_dirty({'product', 'category', CATALOG_TAG, POPULAR_TAG})
+    return updated
+
+
+class _Echo:
+    """File-like object whose write() returns the line, for csv.writer streaming."""
+
+    def write(self, value):
+        return value
+
+
+def _plain(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def export_rows(kind, fmt, chunk_size=2000):
+    """
+    Yield the export of kind ('products', 'orders' or 'order-items') line by
+    line. Rows are read with a server-side cursor (.iterator()) as plain
+    tuples, so memory use does not depend on the size of the table.
+    """
+    model, columns = EXPORTS[kind]
+    headers = [header for header, _ in columns]
+    rows = model.objects.order_by('pk').values_list(*[lookup for _, lookup in columns]).iterator(chunk_size=chunk_size)
+
+    if fmt == 'csv':
+        writer = csv.writer(_Echo())
+        yield writer.writerow(headers)
+        for row in rows:
+            yield writer.writerow([_plain(value) for value in row])
+        return
+    for row in rows:
+        yield json.dumps(dict(zip(headers, map(_plain, row))), ensure_ascii=False) + '\n'
+
+
+def text_stream(binary_file):
+    """Decode an uploaded or opened binary file lazily as UTF-8 text."""
+    return io.TextIOWrapper(binary_file, encoding='utf-8-sig', newline='')
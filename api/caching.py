@@ -0,0 +1,253 @@
+# caching.py
+import contextvars
+import hashlib
+import logging
+import random
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db import close_old_connections
+from django.utils.http import quote_etag
+
+from .metrics import record_cache
+
+logger = logging.getLogger(__name__)
+
+# Fraction of the timeout added or removed at random so keys written together don't expire together
+TTL_JITTER = 0.1
+
+# How long a stale value may still be served while it is being refreshed
+DEFAULT_STALE_TIMEOUT = 600
+
+# Upper bound on a recomputation; the lock expires on its own after this
+LOCK_TIMEOUT = 30
+
+# How long a request without a cached value waits for another process to fill it
+MISS_WAIT_TIMEOUT = 5.0
+MISS_POLL_INTERVAL = 0.05
+
+_refresh_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='cache-refresh')
+
+
+def jittered(timeout):
+    """Spread a timeout by +/- TTL_JITTER."""
+    return max(1, int(timeout * random.uniform(1 - TTL_JITTER, 1 + TTL_JITTER)))
+
+
+def _tag_key(tag):
+    return f'tag:{tag}'
+
+
+def _new_version():
+    # The creation time doubles as the tag's last modification time
+    return f'{time.time():.6f}:{uuid.uuid4().hex}'
+
+
+def versions_last_modified(versions):
+    """Latest modification time (epoch seconds) among tag versions."""
+    stamps = []
+    for version in versions.values():
+        try:
+            stamps.append(float(version.split(':', 1)[0]))
+        except (AttributeError, ValueError):
+            stamps.append(time.time())  # Unknown version: assume it just changed
+    return int(max(stamps)) if stamps else int(time.time())
+
+
+def tag_versions(tags):
+    """
+    Return the current version of each tag, creating missing ones.
+    Read them before computing a value: a write that commits in the meantime
+    bumps a version and makes the stored entry stale on the next read.
+    """
+    keys = {_tag_key(tag): tag for tag in tags}
+    if not keys:
+        return {}
+    found = cache.get_many(keys)
+    missing = [key for key in keys if key not in found]
+    for key in missing:
+        # add() so a concurrent invalidation is not overwritten
+        cache.add(key, _new_version(), None)
+    if missing:
+        found.update(cache.get_many(missing))
+    return {tag: found.get(key) for key, tag in keys.items()}
+
+
+async def atag_versions(tags):
+    """tag_versions for async views."""
+    keys = {_tag_key(tag): tag for tag in tags}
+    if not keys:
+        return {}
+    found = await cache.aget_many(keys)
+    missing = [key for key in keys if key not in found]
+    for key in missing:
+        await cache.aadd(key, _new_version(), None)
+    if missing:
+        found.update(await cache.aget_many(missing))
+    return {tag: found.get(key) for key, tag in keys.items()}
+
+
+def invalidate_tags(tags):
+    """Give every tag a new version, making all entries tagged with it stale."""
+    if tags:
+        cache.set_many({_tag_key(tag): _new_version() for tag in tags}, None)
+
+
+def get_tagged(key, versions):
+    """Return the value stored under key if none of its tags changed, else None."""
+    entry = cache.get(key)
+    if entry is not None and entry['versions'] == versions:
+        record_cache(key, 'hit')
+        return entry['value']
+    record_cache(key, 'miss')
+    return None
+
+
+def set_tagged(key, value, versions, timeout):
+    """Store value with the tag versions read before it was computed."""
+    cache.set(key, {'value': value, 'versions': versions}, jittered(timeout))
+
+
+async def aget_tagged(key, versions):
+    """get_tagged for async views."""
+    entry = await cache.aget(key)
+    if entry is not None and entry['versions'] == versions:
+        record_cache(key, 'hit')
+        return entry['value']
+    record_cache(key, 'miss')
+    return None
+
+
+async def aset_tagged(key, value, versions, timeout):
+    """set_tagged for async views."""
+    await cache.aset(key, {'value': value, 'versions': versions}, jittered(timeout))
+
+
+def _lock_key(key):
+    return f'{key}:lock'
+
+
+def _acquire(key):
+    """
+    Try to become the single process recomputing key. Returns a token or None.
+
+    Exclusive on Redis only: add() is SET NX there, but a read then a write on
+    the file backend, where two processes may both get a token.
+    """
+    token = uuid.uuid4().hex
+    return token if cache.add(_lock_key(key), token, LOCK_TIMEOUT) else None
+
+
+def _release(key, token):
+    if cache.get(_lock_key(key)) == token:
+        cache.delete(_lock_key(key))
+
+
+def _store(key, value, timeout, stale_timeout, versions=None):
+    fresh_for = jittered(timeout)
+    envelope = {'value': value, 'fresh_until': time.time() + fresh_for, 'versions': versions or {}}
+    cache.set(key, envelope, fresh_for + stale_timeout)
+
+
+def _recompute(key, compute, timeout, stale_timeout, token, tags=()):
+    from .routers import use_primary_if_recent  # routers imports this module
+
+    try:
+        versions = tag_versions(tags)
+        # Right after a write a replica may not have it yet: stored now, its old data would pass as fresh
+        with use_primary_if_recent(versions):
+            value = compute()
+        _store(key, value, timeout, stale_timeout, versions)
+        return value
+    finally:
+        _release(key, token)
+
+
+def _refresh_in_background(key, compute, timeout, stale_timeout, token, tags=()):
+    def run():
+        try:
+            _recompute(key, compute, timeout, stale_timeout, token, tags)
+        except Exception:
+            logger.exception("Background refresh of cache key %s failed", key)
+        finally:
+            close_old_connections()
+    # In a copy of the caller's context, so a request pinned to the primary refreshes from it too
+    return _refresh_executor.submit(contextvars.copy_context().run, run)
+
+
+def get_or_refresh(key, compute, timeout, stale_timeout=DEFAULT_STALE_TIMEOUT, tags=()):
+    """
+    Return the cached value of key, computing it with compute() when needed.
+
+    - Fresh value: returned as is.
+    - Stale value (older than timeout, younger than timeout + stale_timeout):
+      returned immediately while one process refreshes it in the background.
+    - Missing value: one process computes it under a lock; the others wait
+      briefly for it to appear instead of running the same query.
+
+    Timeouts are jittered so that keys do not all expire at the same moment.
+    When tags are given, invalidating any of them makes the value stale.
+    """
+    envelope = cache.get(key)
+    if envelope is not None:
+        expired = envelope['fresh_until'] <= time.time()
+        if expired or (tags and envelope.get('versions') != tag_versions(tags)):
+            record_cache(key, 'stale')
+            token = _acquire(key)
+            if token:
+                _refresh_in_background(key, compute, timeout, stale_timeout, token, tags)
+        else:
+            record_cache(key, 'hit')
+        return envelope['value']
+
+    record_cache(key, 'miss')
+    token = _acquire(key)
+    if token:
+        return _recompute(key, compute, timeout, stale_timeout, token, tags)
+
+    # Someone else is computing it: wait for their result
+    deadline = time.monotonic() + MISS_WAIT_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(MISS_POLL_INTERVAL)
+        envelope = cache.get(key)
+        if envelope is not None:
+            return envelope['value']
+
+    # The other process is too slow or died; compute without caching over its result
+    logger.warning("Timed out waiting for cache key %s, computing it locally", key)
+    return compute()
+
+
+async def aget_or_refresh(key, compute, timeout, stale_timeout=DEFAULT_STALE_TIMEOUT, tags=()):
+    """
+    get_or_refresh for async views. Fresh and stale values are served with
+    async cache calls only; refreshes run in the background pool as usual.
+    A miss, which has to compute or wait, runs get_or_refresh in a worker
+    thread so the event loop is never blocked.
+    """
+    envelope = await cache.aget(key)
+    if envelope is None:
+        return await sync_to_async(get_or_refresh)(key, compute, timeout, stale_timeout, tags)  # Counts the miss
+    expired = envelope['fresh_until'] <= time.time()
+    if expired or (tags and envelope.get('versions') != await atag_versions(tags)):
+        record_cache(key, 'stale')
+        token = uuid.uuid4().hex
+        if await cache.aadd(_lock_key(key), token, LOCK_TIMEOUT):
+            _refresh_in_background(key, compute, timeout, stale_timeout, token, tags)
+    else:
+        record_cache(key, 'hit')
+    return envelope['value']
+
+
+def response_cache_key(basename, url):
+    """Cache key of a rendered list or detail response, by its absolute URL: the links in the body carry the scheme and host."""
+    return f'response:{basename}:{hashlib.md5(url.encode("utf-8")).hexdigest()}'
+
+
+def response_etag(key, renderer_format, versions):
+    """ETag of a cached response: it changes exactly when one of its tags does."""
+    fingerprint = '|'.join([key, renderer_format] + [f'{t}={v}' for t, v in sorted(versions.items())])
+    return quote_etag(hashlib.md5(fingerprint.encode('utf-8')).hexdigest())
@@ -0,0 +1,100 @@
+# checkout.py
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+
+from .invalidation import mark_dirty, object_tag, tags_for_instance
+from .models import Category, Order, OrderItem, Product, StockReservation
+from .rollups import record_sales, sale_day
+from .stats import apply_stats_delta
+
+
+class InsufficientStock(APIException):
+    """Raised when a cart asks for more units than a product has left."""
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'Not enough stock to fulfil the order.'
+    default_code = 'insufficient_stock'
+
+
+def _take_holds(user, product_ids):
+    """Lock and delete the user's holds on product_ids, and return the units each one held."""
+    holds = list(
+        StockReservation.objects.select_for_update().filter(user=user, product_id__in=product_ids)
+        .values_list('id', 'product_id', 'quantity')
+    )
+    if holds:
+        StockReservation.objects.filter(pk__in=[hold_id for hold_id, _, _ in holds]).delete()
+    return {product_id: quantity for _, product_id, quantity in holds}
+
+
+def place_order(user, items):
+    """
+    Create an order for user from items, an iterable of (product_id, quantity).
+
+    Everything happens in one short transaction:
+    - stock is taken with one conditional UPDATE per product
+      (SET stock = stock - n WHERE stock >= n), so concurrent checkouts can
+      never oversell and no row is read before it is locked;
+    - units held by other carts (api/reservations.py) are not for sale,
+      while the user's own holds on the cart's products are consumed;
+    - products are locked in id order, so two carts can't deadlock;
+    - prices come from the database, never from the client;
+    - order items are written with a single bulk_create and the total is
+      summed by the database.
+
+    Raises InsufficientStock (409) or ValidationError (400), rolling back
+    every change.
+    """
+    cart = Counter()
+    for product_id, quantity in items:
+        cart[product_id] += quantity
+    if not cart:
+        raise ValidationError({'items': ['The cart is empty.']})
+
+    now = timezone.now()
+    with transaction.atomic():
+        held = _take_holds(user, cart)
+        for product_id in sorted(cart):
+            quantity, own = cart[product_id], held.get(product_id, 0)
+            taken = Product.objects.filter(pk=product_id, stock__gte=F('reserved') + quantity - own).update(
+                stock=F('stock') - quantity, reserved=F('reserved') - own, updated_at=now
+            )
+            if not taken:
+                if not Product.objects.filter(pk=product_id).exists():
+                    raise ValidationError({'items': [f'Product {product_id} does not exist.']})
+                raise InsufficientStock(f'Not enough stock for product {product_id}.')
+
+        # The rows are locked by the UPDATEs above, so these prices are the ones we sell at
+        products = list(Product.objects.filter(pk__in=cart).values_list('id', 'price', 'category_id'))
+        order = Order.objects.create(user=user, total_price=0)
+        order_items = OrderItem.objects.bulk_create(
+            OrderItem(order=order, product_id=product_id, quantity=cart[product_id], price=price)
+            for product_id, price, category_id in products
+        )
+        total = (
+            OrderItem.objects.filter(order=OuterRef('pk'))
+            .values('order')
+            .annotate(total=Sum(F('price') * F('quantity')))
+            .values('total')
+        )
+        Order.objects.filter(pk=order.pk).update(total_price=Subquery(total))
+        order.refresh_from_db(fields=['total_price'])
+
+        # bulk_create and update() skip the model signals: keep counters and caches in step by hand
+        tags = set()
+        for item in order_items:
+            apply_stats_delta(item.product_id, units_sold=item.quantity, order_count=1)
+            tags |= tags_for_instance(item)
+        categories = {product_id: category_id for product_id, price, category_id in products}
+        record_sales(sale_day(order.order_date), order.status, [
+            (item.product_id, categories[item.product_id], item.quantity, item.price) for item in order_items
+        ])
+        for product_id, price, category_id in products:
+            tags |= {'product', object_tag(Product, product_id), 'category', object_tag(Category, category_id)}
+        mark_dirty(tags)
+
+    return order
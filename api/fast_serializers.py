@@ -0,0 +1,144 @@
+# fast_serializers.py
+from decimal import Decimal
+from operator import attrgetter, itemgetter
+
+from django.core.exceptions import FieldDoesNotExist, ImproperlyConfigured
+from django.utils import timezone
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
+
+_compiled = {}
+
+# Sparse fieldsets compile one converter per field subset: stop memoizing past this
+MAX_COMPILED = 1024
+
+
+class ValuesSerializer:
+    """
+    Read-only fast path producing exactly what a flat ModelSerializer would.
+
+    The serializer's fields are inspected once and each one is compiled to a
+    plain converter (Decimal -> string, aware datetime -> ISO 8601, stored
+    file name -> absolute URL, ...). Rows can be .values() dicts or model
+    instances; building the output is then one dict per row with no per-field
+    get_attribute / to_representation dispatch.
+
+    Fields without a specialised converter fall back to their own
+    to_representation, so the output never diverges from the serializer.
+    field_names restricts the output (and the columns) to those fields.
+    """
+
+    def __init__(self, serializer_class, field_names=None):
+        self.serializer_class = serializer_class
+        model = serializer_class.Meta.model
+        self.fields = []
+        for name, field in serializer_class().fields.items():
+            if field.write_only or (field_names is not None and name not in field_names):
+                continue
+            if field.source == '*' or len(field.source_attrs) != 1:
+                raise ImproperlyConfigured(f"{serializer_class.__name__}.{name} is not a plain model column")
+            try:
+                model_field = model._meta.get_field(field.source)
+            except FieldDoesNotExist:
+                raise ImproperlyConfigured(f"{serializer_class.__name__}.{name} is not a model field")
+            if model_field.is_relation:
+                raise ImproperlyConfigured(f"{serializer_class.__name__}.{name} is a relation")
+            self.fields.append((name, model_field.attname, model_field))
+        # Columns to pass to .values()
+        self.columns = [column for _, column, _ in self.fields]
+
+    def _compile(self, field, model_field, context):
+        """Return a function turning a stored value into its representation."""
+        if isinstance(field, serializers.DecimalField) and not field.localize and getattr(
+            field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING
+        ):
+            exponent = Decimal('.1') ** field.decimal_places if field.decimal_places is not None else None
+            rounding = field.rounding
+
+            def decimal_to_string(value, exponent=exponent, rounding=rounding):
+                if not isinstance(value, Decimal):
+                    value = Decimal(str(value).strip())
+                if exponent is not None:
+                    value = value.quantize(exponent, rounding=rounding)
+                return '{:f}'.format(value)
+            return decimal_to_string if exponent is not None else field.to_representation
+
+        if isinstance(field, serializers.DateTimeField) and not isinstance(field, serializers.DateField):
+            output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+            if output_format is None or output_format.lower() != ISO_8601:
+                return field.to_representation
+            field_timezone = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+            if field_timezone is None:
+                return field.to_representation
+
+            def datetime_to_iso(value, tz=field_timezone):
+                if not value:
+                    return None
+                if timezone.is_aware(value):
+                    value = value.astimezone(tz)
+                else:
+                    return field.to_representation(value)
+                value = value.isoformat()
+                if value.endswith('+00:00'):
+                    value = value[:-6] + 'Z'
+                return value
+            return datetime_to_iso
+
+        if isinstance(field, serializers.FileField) and getattr(field, 'use_url', api_settings.UPLOADED_FILES_USE_URL):
+            storage = model_field.storage
+            request = context.get('request')
+
+            def file_to_url(value):
+                name = getattr(value, 'name', value)
+                if not name:
+                    return None
+                url = storage.url(name)
+                return request.build_absolute_uri(url) if request is not None else url
+            return file_to_url
+
+        if type(field) is serializers.IntegerField:
+            return int
+        if type(field) is serializers.CharField:
+            return str
+        return field.to_representation
+
+    def serialize(self, rows, context=None):
+        """Serialize rows (dicts from .values() or model instances) to a list of dicts."""
+        rows = list(rows)
+        if not rows:
+            return []
+        context = context or {}
+        # A bound serializer per call, so fallback converters see this request's context.
+        # The selected fields were fixed at compile time: don't let the request prune them again.
+        fields = self.serializer_class(context=dict(context, field_selection=None)).fields
+        getter = itemgetter if isinstance(rows[0], dict) else attrgetter
+        compiled = []
+        for name, column, model_field in self.fields:
+            field = fields[name]
+            compiled.append((name, getter(column), self._compile(field, model_field, context)))
+
+        output = []
+        for row in rows:
+            item = {}
+            for name, get, convert in compiled:
+                value = get(row)
+                item[name] = None if value is None else convert(value)
+            output.append(item)
+        return output
+
+
+def get_values_serializer(serializer_class, field_names=None):
+    """
+    Return the memoized ValuesSerializer of serializer_class (restricted to
+    field_names, a tuple), or None if it has nested or computed fields.
+    """
+    key = (serializer_class, field_names)
+    if key in _compiled:
+        return _compiled[key]
+    try:
+        fast = ValuesSerializer(serializer_class, field_names)
+    except ImproperlyConfigured:
+        fast = None
+    if len(_compiled) < MAX_COMPILED:
+        _compiled[key] = fast
+    return fast
@@ -0,0 +1,144 @@
+# fieldsets.py
+"""
+Sparse fieldsets and on-demand expansion of nested serializers.
+
+    ?fields=id,name,product.name   keep only these fields; dotted names
+                                   select inside nested serializers
+    ?expand=product,products.product
+                                   embed only these nested serializers and
+                                   render the others as primary keys
+
+Without ?expand= nested serializers stay embedded, as they always were.
+Unknown names are ignored. The selection only applies to reads.
+
+DynamicFieldsMixin prunes a serializer's fields, which in turn shrinks the
+query plan (api/query_plan.py): unselected columns are left out of only(),
+and unexpanded relations are read from their foreign key without a join.
+"""
+from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+
+FIELDS_PARAM = 'fields'
+EXPAND_PARAM = 'expand'
+
+
+def _split(value):
+    return [name.strip() for name in value.split(',') if name.strip()]
+
+
+def join_path(path, name):
+    return f'{path}.{name}' if path else name
+
+
+class FieldSelection:
+    """The fields and expansions a request asked for, by dotted path ('' is the top level)."""
+
+    def __init__(self, fields=None, expand=None):
+        self.fields = None
+        if fields:
+            self.fields = {}
+            for name in _split(fields):
+                parts = name.split('.')
+                for depth, part in enumerate(parts):
+                    self.fields.setdefault('.'.join(parts[:depth]), set()).add(part)
+        self.expand = None
+        if expand is not None:
+            self.expand = set()
+            for name in _split(expand):
+                parts = name.split('.')
+                self.expand.update('.'.join(parts[:depth + 1]) for depth in range(len(parts)))
+
+    @classmethod
+    def from_request(cls, request):
+        """The selection of request (a DRF or Django request), or None when it asks for everything."""
+        if request is None or request.method not in SAFE_METHODS:
+            return None
+        selection = getattr(request, '_field_selection', False)
+        if selection is False:
+            params = getattr(request, 'query_params', request.GET)
+            selection = cls(params.get(FIELDS_PARAM), params.get(EXPAND_PARAM))
+            if selection.fields is None and selection.expand is None:
+                selection = None
+            request._field_selection = selection
+        return selection
+
+    @classmethod
+    def from_context(cls, context):
+        """The selection of a serializer context; context['field_selection'] overrides the request's."""
+        if 'field_selection' in context:
+            return context['field_selection']
+        return cls.from_request(context.get('request'))
+
+    def names(self, path):
+        """The field names to keep at path, or None to keep them all."""
+        if self.fields is None:
+            return None
+        return self.fields.get(path)
+
+    def expanded(self, path):
+        """Whether the nested serializer at path is embedded, or None when expansion was not asked for."""
+        if self.expand is None:
+            return None
+        return path in self.expand
+
+    def prune(self, data, path=''):
+        """Apply the field selection to already serialized data (dicts and lists of dicts)."""
+        if self.fields is None:
+            return data
+        if isinstance(data, list):
+            return [self.prune(item, path) for item in data]
+        names = self.names(path)
+        if not isinstance(data, dict) or names is None:
+            return data
+        return {name: self.prune(value, join_path(path, name)) for name, value in data.items() if name in names}
+
+
+def select_fields(data, request):
+    """Apply the request's ?fields= to data serialized without it (e.g. shared by every request through the cache)."""
+    selection = FieldSelection.from_request(request)
+    return data if selection is None else selection.prune(data)
+
+
+def _collapsed(field):
+    """A read-only primary key field standing in for the nested serializer field."""
+    kwargs = {'read_only': True, 'many': isinstance(field, serializers.ListSerializer)}
+    if field.source is not None:
+        kwargs['source'] = field.source
+    return serializers.PrimaryKeyRelatedField(**kwargs)
+
+
+class DynamicFieldsMixin:
+    """
+    Serializer mixin applying the request's ?fields= and ?expand= (see the
+    module docstring). Nested serializers using it find their own part of
+    the selection from their position in the tree; a serializer created by
+    hand for a nested value (e.g. in a method field) passes its path as
+    context['field_path'].
+    """
+
+    def get_fields(self):
+        fields = super().get_fields()
+        selection = FieldSelection.from_context(self.context)
+        if selection is None:
+            return fields
+        path = self.field_path
+        names = selection.names(path)
+        if names is not None:
+            fields = {name: field for name, field in fields.items() if name in names}
+        for name, field in fields.items():
+            if isinstance(field, serializers.BaseSerializer) and selection.expanded(join_path(path, name)) is False:
+                fields[name] = _collapsed(field)
+        return fields
+
+    @property
+    def field_path(self):
+        """Dotted path of this serializer from the root of the response."""
+        names = []
+        node = self
+        while node.parent is not None:
+            if node.field_name:
+                names.append(node.field_name)
+            node = node.parent
+        if self.context.get('field_path'):
+            names.append(self.context['field_path'])
+        return '.'.join(reversed(names))
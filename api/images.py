@@ -0,0 +1,158 @@
+# images.py
+import logging
+import posixpath
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps
+
+from .caching import invalidate_tags
+from .invalidation import tags_for_instance
+from .models import Product
+from .routers import use_primary
+
+logger = logging.getLogger(__name__)
+
+# Bounding boxes of the generated variants; images are never upscaled
+VARIANTS = {
+    'thumbnail': (200, 200),
+    'medium': (600, 600),
+    'large': (1200, 1200),
+}
+
+# Every variant is written as WebP plus a JPEG fallback for older clients
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 85, 'optimize': True, 'progressive': True}),
+}
+
+VARIANT_DIR = 'product_images/variants'
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        # Pillow releases the GIL while decoding, resizing and encoding, so threads scale
+        _executor = ThreadPoolExecutor(max_workers=settings.PRODUCT_IMAGE_WORKERS, thread_name_prefix='product-images')
+    return _executor
+
+
+def _encode(image, fmt):
+    pil_format, options = FORMATS[fmt]
+    if fmt == 'jpeg' and image.mode != 'RGB':
+        # JPEG has no alpha channel: flatten onto white
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A') if 'A' in image.getbands() else None)
+        image = background
+    buffer = BytesIO()
+    image.save(buffer, pil_format, **options)
+    return buffer.getvalue()
+
+
+def render_variants(source, storage, product_id):
+    """
+    Write every variant of the image file source to storage and return its
+    description: original dimensions, then per variant its dimensions and
+    the stored name of each format.
+    """
+    with Image.open(source) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'PA') else 'RGB')
+        result = {'original': {'width': image.width, 'height': image.height}}
+        stem = posixpath.splitext(posixpath.basename(source.name))[0]
+        for variant, size in VARIANTS.items():
+            resized = image.copy()
+            resized.thumbnail(size, Image.LANCZOS)
+            entry = {'width': resized.width, 'height': resized.height}
+            for fmt in FORMATS:
+                name = f'{VARIANT_DIR}/{product_id}/{stem}-{variant}.{fmt}'
+                entry[fmt] = storage.save(name, ContentFile(_encode(resized, fmt)))
+            result[variant] = entry
+    return result
+
+
+def _stored_names(variants):
+    return {entry[fmt] for key, entry in (variants or {}).items() if key in VARIANTS for fmt in FORMATS if fmt in entry}
+
+
+def generate_variants(product_id, image_name=None):
+    """
+    Generate the variants of a product's current image and record them.
+
+    image_name is the upload the job was scheduled for: if the product has
+    been given another image meanwhile, the result is discarded and the
+    newer job wins. Previous variants are deleted once replaced. Returns
+    the recorded variants, or None when there was nothing to do.
+    """
+    product = Product.objects.filter(pk=product_id).only('id', 'image', 'image_variants', 'category_id').first()
+    if product is None or not product.image or (image_name is not None and product.image.name != image_name):
+        return None
+    storage = product.image.storage
+    with product.image.open('rb') as source:
+        variants = render_variants(source, storage, product.pk)
+
+    # Conditional on the image so a concurrent re-upload is never overwritten with stale variants
+    updated = Product.objects.filter(pk=product.pk, image=product.image.name).update(image_variants=variants)
+    if not updated:
+        for name in _stored_names(variants):
+            storage.delete(name)
+        return None
+    for name in _stored_names(product.image_variants) - _stored_names(variants):
+        storage.delete(name)
+    # update() skips the model signals: drop the cached responses that embed the product
+    invalidate_tags(tags_for_instance(product))
+    return variants
+
+
+def delete_variants(variants):
+    """Delete the stored files of variants once the current transaction commits."""
+    names = _stored_names(variants)
+    if not names:
+        return
+    storage = Product._meta.get_field('image').storage
+
+    def delete():
+        for name in names:
+            storage.delete(name)
+
+    transaction.on_commit(delete)
+
+
+def _generate_logged(product_id, image_name):
+    try:
+        # Scheduled right after the upload committed: a replica may not have it yet
+        with use_primary():
+            generate_variants(product_id, image_name)
+    except Exception:
+        # A broken upload must not fail the request that stored it; the original is still served
+        logger.exception("Generating image variants of product %s failed", product_id)
+
+
+def _run(product_id, image_name):
+    try:
+        _generate_logged(product_id, image_name)
+    finally:
+        close_old_connections()
+
+
+def schedule_variants(product):
+    """
+    Generate the variants of product's image off the request, once the
+    current transaction commits. With PRODUCT_IMAGE_WORKERS = 0 they are
+    generated inline instead.
+    """
+    product_id, image_name = product.pk, product.image.name
+
+    def submit():
+        if settings.PRODUCT_IMAGE_WORKERS:
+            _get_executor().submit(_run, product_id, image_name)
+        else:
+            _generate_logged(product_id, image_name)
+
+    transaction.on_commit(submit)
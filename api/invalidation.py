@@ -0,0 +1,91 @@
+# invalidation.py
+import threading
+
+from django.db import transaction
+
+from .caching import invalidate_tags
+
+# Tag of the cached popular products list
+POPULAR_TAG = 'popular'
+
+# Bumped by bulk catalog writes, which would otherwise need one tag per product
+CATALOG_TAG = 'catalog'
+
+_pending = threading.local()
+
+
+def model_tag(model):
+    """Tag covering every list of a model, e.g. 'product'."""
+    return model._meta.model_name
+
+
+def object_tag(model, pk):
+    """Tag covering a single object, e.g. 'product:42'."""
+    return f'{model._meta.model_name}:{pk}'
+
+
+def tags_for_instance(instance):
+    """
+    Tags made dirty by a write to instance: its own object and list tags,
+    plus the cached responses that embed it.
+    """
+    model = type(instance)
+    tags = {model_tag(model), object_tag(model, instance.pk)}
+    extra = _extra_tags.get(model._meta.label)
+    if extra:
+        tags.update(extra(instance))
+    return tags
+
+
+def _product_tags(instance):
+    # Categories embed a preview of their products; popularity lists products
+    tags = {POPULAR_TAG, 'category', f'category:{instance.category_id}'}
+    old_category_id = getattr(instance, '_old_category_id', None)
+    if old_category_id is not None:
+        tags.add(f'category:{old_category_id}')
+    return tags
+
+
+def _order_item_tags(instance):
+    # Orders embed their items, and items feed the popularity counters
+    return {POPULAR_TAG, 'order', f'order:{instance.order_id}'}
+
+
+def _review_tags(instance):
+    # Product detail embeds the review summary of the product
+    tags = {POPULAR_TAG, f'product:{instance.product_id}'}
+    old = getattr(instance, '_stats_old', None)
+    if old is not None:
+        tags.add(f'product:{old[0]}')
+    return tags
+
+
+_extra_tags = {
+    'api.Product': _product_tags,
+    'api.OrderItem': _order_item_tags,
+    'api.Review': _review_tags,
+}
+
+
+def mark_dirty(tags, using=None):
+    """
+    Queue tags for invalidation when the current transaction commits.
+
+    Tags are collected in a per-thread set and flushed in one cache write, so
+    a transaction touching thousands of rows invalidates each tag once. Outside
+    a transaction the flush happens immediately. Tags queued by a transaction
+    that rolls back are flushed with the next commit, which is harmless.
+    """
+    pending = getattr(_pending, 'tags', None)
+    if pending is None:
+        pending = _pending.tags = set()
+    pending.update(tags)
+    transaction.on_commit(flush_dirty_tags, using=using)
+
+
+def flush_dirty_tags():
+    """Invalidate every queued tag. Later callbacks of the same commit find nothing left."""
+    tags = getattr(_pending, 'tags', None)
+    if tags:
+        _pending.tags = set()
+        invalidate_tags(tags)
@@ -0,0 +1,40 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.archive import ARCHIVE_BATCH_SIZE, archive_orders
+
+
+class Command(BaseCommand):
+    """
+    Move Delivered and Cancelled orders older than ORDER_ARCHIVE_AFTER_DAYS
+    to the archive tables (see api/archive.py), a batch per transaction.
+    Safe to interrupt: the next run resumes with the orders left. Run it
+    nightly from cron, or keep it running with --every.
+    """
+    help = "Archive old completed orders"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-days', type=int, default=settings.ORDER_ARCHIVE_AFTER_DAYS,
+                            help="Archive orders placed more than this many days ago")
+        parser.add_argument('--batch-size', type=int, default=ARCHIVE_BATCH_SIZE, help="Orders moved per transaction")
+        parser.add_argument('--max-batches', type=int, help="Stop after this many batches")
+        parser.add_argument('--pause', type=float, default=0, help="Seconds to sleep between batches")
+        parser.add_argument('--every', type=float, help="Keep archiving, pausing this many seconds between runs")
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1 or options['older_than_days'] < 0:
+            raise CommandError("--batch-size must be positive and --older-than-days not negative")
+        while True:
+            summary = archive_orders(
+                options['older_than_days'], batch_size=options['batch_size'], max_batches=options['max_batches'],
+                pause=options['pause'],
+            )
+            self.stdout.write(
+                f"Archived {summary['orders']} orders ({summary['items']} items) in {summary['batches']} batches, "
+                f"{summary['seconds']:.1f}s"
+            )
+            if options['every'] is None:
+                break
+            time.sleep(options['every'])
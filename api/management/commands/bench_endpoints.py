@@ -0,0 +1,59 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from api.benchmarks import BUDGETS, ROUTES, over_budget, run_benchmarks
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    """
+    Benchmark every API route in-process (see api/benchmarks.py) and compare
+    it with its query and latency budgets. Load a dataset first, e.g.
+
+        python manage.py generate_synthetic_data --scale small
+        python manage.py bench_endpoints --iterations 50
+
+    Requests run in a transaction that is rolled back, so the dataset is the
+    same for every run. With --check the command fails when a route is over
+    budget; the budgets are set for the 'tiny' dataset the tests use.
+    """
+    help = "Measure p50/p95 latency, throughput and SQL queries of every API route"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20, help="Timed requests per route")
+        parser.add_argument('--route', action='append', dest='routes', help="Route name to run (repeatable)")
+        parser.add_argument('--warm', action='store_true', help="Keep the cache between requests")
+        parser.add_argument('--check', action='store_true', help="Fail when a route is over its budget")
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1:
+            raise CommandError("--iterations must be positive")
+        routes = ROUTES
+        if options['routes']:
+            unknown = set(options['routes']) - {route.name for route in ROUTES}
+            if unknown:
+                raise CommandError(f"Unknown routes: {', '.join(sorted(unknown))}")
+            routes = [route for route in ROUTES if route.name in options['routes']]
+
+        try:
+            with transaction.atomic():
+                results = run_benchmarks(routes, options['iterations'], options['warm'])
+                raise _Rollback
+        except _Rollback:
+            pass
+
+        failures = 0
+        self.stdout.write(f"{'route':<30} {'status':>6} {'queries':>9} {'p50 ms':>8} {'p95 ms':>12} {'req/s':>8}")
+        for result in results:
+            max_queries, max_p95_ms = BUDGETS[result.name]
+            problems = over_budget(result, settings.BENCHMARK_LATENCY_FACTOR)
+            failures += bool(problems)
+            line = (f"{result.name:<30} {result.status:>6} {result.queries:>4}/{max_queries:<4} "
+                    f"{result.p50_ms:>8.1f} {result.p95_ms:>6.1f}/{max_p95_ms:<5} {result.rps:>8.1f}")
+            self.stdout.write(self.style.ERROR(line) if problems else line)
+        if options['check'] and failures:
+            raise CommandError(f"{failures} routes over budget")
@@ -0,0 +1,71 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.recommendations import TOP_K, _python_top_neighbors, cooccurrence, np, top_neighbors
+
+
+class Command(BaseCommand):
+    """
+    Time the co-occurrence build on synthetic order items generated in
+    memory: baskets of 1-8 products drawn with a long-tailed popularity, as
+    in a real catalog. Nothing touches the database. With --python-items,
+    the pure Python fallback is timed on a prefix of the same data.
+    """
+    help = "Benchmark the recommendations build on a synthetic dataset"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--order-items', type=int, default=3_000_000)
+        parser.add_argument('--products', type=int, default=50_000)
+        parser.add_argument('--top-k', type=int, default=TOP_K)
+        parser.add_argument('--python-items', type=int, default=200_000, help="Items for the Python comparison, 0 to skip")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if np is None:
+            raise CommandError("NumPy and SciPy are required for this benchmark")
+        rng = np.random.default_rng(options['seed'])
+        order_ids, product_ids = self.synthesize(rng, options['order_items'], options['products'])
+        self.stdout.write(f"{len(order_ids)} order items, {order_ids[-1] + 1} orders, {options['products']} products")
+
+        started = time.perf_counter()
+        products = np.unique(product_ids)
+        counts = cooccurrence(order_ids, product_ids, products)
+        built = time.perf_counter()
+        neighbors = top_neighbors(products, counts, options['top_k'])
+        ranked = time.perf_counter()
+        self.stdout.write(
+            f"sparse: co-occurrence {built - started:.2f}s ({counts.nnz} pairs), "
+            f"top-{options['top_k']} {ranked - built:.2f}s, total {ranked - started:.2f}s"
+        )
+
+        sample = options['python_items']
+        if sample:
+            started = time.perf_counter()
+            python = _python_top_neighbors(zip(order_ids[:sample].tolist(), product_ids[:sample].tolist()), options['top_k'])
+            elapsed = time.perf_counter() - started
+            started = time.perf_counter()
+            sample_products = np.unique(product_ids[:sample])
+            sparse_result = top_neighbors(
+                sample_products, cooccurrence(order_ids[:sample], product_ids[:sample], sample_products), options['top_k']
+            )
+            sparse_elapsed = time.perf_counter() - started
+            same = all(
+                [n[0] for n in python[product_id]] == [n[0] for n in sparse_result[product_id]] for product_id in python
+            )
+            self.stdout.write(
+                f"{sample} items: python {elapsed:.2f}s, sparse {sparse_elapsed:.2f}s "
+                f"({elapsed / max(sparse_elapsed, 1e-9):.1f}x), same neighbours: {same}"
+            )
+        self.stdout.write(f"{sum(len(n) for n in neighbors.values())} neighbour rows")
+
+    @staticmethod
+    def synthesize(rng, item_count, product_count):
+        """Parallel (order id, product id) arrays, ordered by order."""
+        sizes = np.minimum(rng.geometric(0.35, size=item_count), 8)
+        sizes = sizes[np.cumsum(sizes) <= item_count]
+        order_ids = np.repeat(np.arange(len(sizes)), sizes)
+        # Zipf-like popularity: product i is drawn with weight 1 / (i + 10)
+        weights = 1.0 / (np.arange(product_count) + 10)
+        product_ids = rng.choice(product_count, size=len(order_ids), p=weights / weights.sum()) + 1
+        return order_ids, product_ids
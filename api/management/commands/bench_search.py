@@ -0,0 +1,87 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from api.models import Category, Product
+from api.search import SEARCH_RESULT_LIMIT, get_search_backend
+
+WORDS = (
+    "laptop phone camera wireless charger leather wallet running shoes cotton shirt "
+    "stainless steel bottle bluetooth speaker gaming mouse mechanical keyboard ceramic "
+    "mug organic coffee desk lamp backpack waterproof jacket smart watch headphones"
+).split()
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    """
+    Compare the ranked search backend with the previous icontains scan.
+    Synthetic products are inserted inside a transaction that is rolled back,
+    so the command is safe to run against a development database.
+    """
+    help = "Benchmark product search against the icontains implementation"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=20000, help="Synthetic products to insert")
+        parser.add_argument('--queries', type=int, default=200, help="Queries to run per implementation")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        queries = [rng.choice(WORDS)[:rng.randint(3, 8)] for _ in range(options['queries'])]
+
+        try:
+            with transaction.atomic():
+                self.seed(rng, options['products'])
+                self.run(queries)
+                raise _Rollback
+        except _Rollback:
+            # Drop the synthetic rows from any in-memory index as well
+            get_search_backend().reset()
+
+    def seed(self, rng, count):
+        category = Category.objects.create(name=f"bench-search-{time.time_ns()}")
+        Product.objects.bulk_create(
+            (
+                Product(
+                    name=" ".join(rng.sample(WORDS, 3)),
+                    description=" ".join(rng.choice(WORDS) for _ in range(40)),
+                    price=rng.randint(1, 500),
+                    stock=rng.randint(0, 100),
+                    category=category,
+                )
+                for _ in range(count)
+            ),
+            batch_size=2000,
+        )
+        backend = get_search_backend()
+        started = time.perf_counter()
+        backend.rebuild()
+        self.stdout.write(f"Indexed {count} products in {time.perf_counter() - started:.2f}s ({type(backend).__name__})")
+
+    def run(self, queries):
+        backend = get_search_backend()
+
+        def icontains(query):
+            return list(Product.objects.filter(Q(name__icontains=query) | Q(description__icontains=query)))
+
+        def ranked(query):
+            return backend.search(query, limit=SEARCH_RESULT_LIMIT)
+
+        for label, search in (("icontains", icontains), ("ranked", ranked)):
+            timings = []
+            for query in queries:
+                started = time.perf_counter()
+                search(query)
+                timings.append(time.perf_counter() - started)
+            timings.sort()
+            self.stdout.write(
+                f"{label:>10}: mean {1000 * sum(timings) / len(timings):.2f}ms "
+                f"p95 {1000 * timings[int(len(timings) * 0.95) - 1]:.2f}ms"
+            )
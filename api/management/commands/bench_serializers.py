@@ -0,0 +1,83 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+
+from api.fast_serializers import get_values_serializer
+from api.models import Category, Product
+from api.renderers import FastJSONRenderer
+from api.serializers import ProductSerializer
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    """
+    Compare ProductSerializer + JSONRenderer with the .values() fast path and
+    FastJSONRenderer, and check that both produce the same bytes. Synthetic
+    products are inserted inside a transaction that is rolled back.
+    """
+    help = "Benchmark product list serialization and rendering"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=5000, help="Synthetic products to insert")
+        parser.add_argument('--rounds', type=int, default=5, help="Timed runs per implementation")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.seed(random.Random(options['seed']), options['products'])
+                self.run(options['rounds'])
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def seed(self, rng, count):
+        category = Category.objects.create(name=f"bench-serializers-{time.time_ns()}")
+        Product.objects.bulk_create(
+            (
+                Product(
+                    name=f"Product {i} ünïcode",
+                    description="x" * rng.randint(20, 200),
+                    price=f"{rng.randint(1, 99999) / 100:.2f}",
+                    stock=rng.randint(0, 100),
+                    image=f"products/{i}.jpg" if i % 2 else "",
+                    category=category,
+                )
+                for i in range(count)
+            ),
+            batch_size=2000,
+        )
+
+    def run(self, rounds):
+        request = APIRequestFactory().get('/api/products/', HTTP_HOST='localhost')
+        context = {'request': request}
+        queryset = Product.objects.order_by('-date_time_added', '-id')
+        fast = get_values_serializer(ProductSerializer)
+
+        def baseline():
+            return JSONRenderer().render(ProductSerializer(queryset.all(), many=True, context=context).data)
+
+        def fast_path():
+            return FastJSONRenderer().render(fast.serialize(queryset.values(*fast.columns), context))
+
+        if baseline() != fast_path():
+            self.stderr.write("Outputs differ")
+            return
+        self.stdout.write("Outputs are byte-for-byte identical")
+
+        rows = queryset.count()
+        for label, render in (("serializer", baseline), ("values", fast_path)):
+            timings = []
+            for _ in range(rounds):
+                started = time.perf_counter()
+                render()
+                timings.append(time.perf_counter() - started)
+            best = min(timings)
+            self.stdout.write(f"{label:>10}: {1000 * best:.1f}ms for {rows} rows ({rows / best:,.0f} rows/s)")
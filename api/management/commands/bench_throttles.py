@@ -0,0 +1,37 @@
+import time
+
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand
+from rest_framework import throttling
+from rest_framework.test import APIRequestFactory
+
+from api.throttling import AnonRateThrottle
+
+
+class Command(BaseCommand):
+    """
+    Time one client's requests through DRF's AnonRateThrottle and the
+    sliding-window AnonRateThrottle at increasing rates. Both use a private
+    in-memory cache. The DRF throttle's cost grows with the rate because it
+    stores one timestamp per request; the sliding window stays flat.
+    """
+    help = "Benchmark the sliding-window throttle against DRF's timestamp-list throttle"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=5000, help="Requests per measurement")
+        parser.add_argument('--rates', nargs='+', default=['100/hour', '1000/hour', '10000/hour', '100000/hour'])
+
+    def handle(self, *args, **options):
+        request = APIRequestFactory().get('/api/products/', REMOTE_ADDR='10.0.0.1')
+        request.user = None
+        for rate in options['rates']:
+            results = []
+            for label, base in (("drf", throttling.AnonRateThrottle), ("sliding", AnonRateThrottle)):
+                throttle_class = type(f'Bench{base.__name__}', (base,), {'rate': rate, 'cache': LocMemCache(f'bench-{label}-{rate}', {})})
+                started = time.perf_counter()
+                allowed = 0
+                for _ in range(options['requests']):
+                    allowed += throttle_class().allow_request(request, None)
+                elapsed = time.perf_counter() - started
+                results.append(f"{label} {1e6 * elapsed / options['requests']:8.1f}us/request ({allowed} allowed)")
+            self.stdout.write(f"{rate:>12}: " + "  ".join(results))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.recommendations import TOP_K, build_recommendations, np
+
+
+class Command(BaseCommand):
+    """
+    Build the "frequently bought together" neighbours from the order history.
+    Run it periodically with --incremental to fold in new orders, and now and
+    then without it to rescore everything and forget cancelled orders.
+    """
+    help = "Build the product co-occurrence recommendations"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--incremental', action='store_true', help="Only add the orders placed since the last build")
+        parser.add_argument('--top-k', type=int, default=TOP_K, help="Neighbours stored per product")
+        parser.add_argument('--min-orders', type=int, default=1, help="Orders a pair needs in common to be recommended")
+
+    def handle(self, *args, **options):
+        if not 1 <= options['top_k'] <= TOP_K:
+            raise CommandError(f"--top-k must be between 1 and {TOP_K}")
+        if np is None and options['incremental']:
+            self.stderr.write("NumPy/SciPy are not installed: rebuilding everything")
+        summary = build_recommendations(options['top_k'], options['min_orders'], options['incremental'])
+        kind = "Incremental build" if summary['incremental'] else "Full build"
+        self.stdout.write(self.style.SUCCESS(
+            f"{kind}: {summary['order_items']} order items, {summary['products']} products updated "
+            f"in {summary['seconds']:.2f}s"
+        ))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from api.bulk import EXPORTS, FORMATS, export_rows
+
+
+class Command(BaseCommand):
+    """
+    Write products, orders or order items as JSONL or CSV, streaming rows
+    from the database so memory stays flat for tables of any size.
+    """
+    help = "Bulk export products, orders or order items"
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(EXPORTS))
+        parser.add_argument('--format', choices=FORMATS, default='jsonl')
+        parser.add_argument('--output', help="Destination file (defaults to stdout)")
+        parser.add_argument('--chunk-size', type=int, default=2000, help="Rows fetched per database round trip")
+
+    def handle(self, *args, **options):
+        rows = export_rows(options['kind'], options['format'], chunk_size=options['chunk_size'])
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as output:
+                output.writelines(rows)
+        else:
+            for row in rows:
+                self.stdout.write(row, ending='')
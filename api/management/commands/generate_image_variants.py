@@ -0,0 +1,57 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from api.images import generate_variants
+from api.models import Product
+
+
+class Command(BaseCommand):
+    """
+    Backfill the resized variants of existing product images. By default only
+    products with an image but no variants are processed; --all regenerates
+    every one (e.g. after changing VARIANTS). Images are processed by a pool
+    of threads, each product committing on its own.
+    """
+    help = "Generate thumbnail/medium/large WebP and JPEG variants of product images"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help="Regenerate variants that already exist")
+        parser.add_argument('--workers', type=int, default=4, help="Images processed in parallel (1 = in this thread)")
+
+    def handle(self, *args, **options):
+        products = Product.objects.exclude(image='').exclude(image__isnull=True)
+        if not options['all']:
+            products = products.filter(image_variants={})
+        ids = list(products.order_by('pk').values_list('pk', flat=True))
+
+        def process(product_id):
+            try:
+                return generate_variants(product_id) is not None, None
+            except Exception as error:
+                return False, f"product {product_id}: {error}"
+
+        def process_in_worker(product_id):
+            try:
+                return process(product_id)
+            finally:
+                close_old_connections()
+
+        done = failed = 0
+        if options['workers'] > 1:
+            executor = ThreadPoolExecutor(max_workers=options['workers'])
+            results = executor.map(process_in_worker, ids)
+        else:
+            executor, results = None, map(process, ids)
+        try:
+            for ok, error in results:
+                if error:
+                    failed += 1
+                    self.stderr.write(error)
+                done += ok
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        self.stdout.write(self.style.SUCCESS(f"Generated variants for {done} of {len(ids)} products, {failed} failed"))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from api.schema import code_fingerprint, write_schema
+
+
+class Command(BaseCommand):
+    """
+    Write the OpenAPI schema of the current code to SCHEMA_DIR (see
+    api/schema.py). Run it at build time so no worker generates it when
+    serving the docs.
+    """
+    help = "Generate the OpenAPI schema files of this code version"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output-dir', help="Directory to write to instead of SCHEMA_DIR")
+
+    def handle(self, *args, **options):
+        paths = write_schema(options['output_dir'])
+        for path in paths.values():
+            self.stdout.write(path)
+        self.stdout.write(self.style.SUCCESS(f"OpenAPI schema {code_fingerprint()} written"))
@@ -0,0 +1,55 @@
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from api.caching import invalidate_tags
+from api.invalidation import CATALOG_TAG, POPULAR_TAG
+from api.synthetic import SCALES, generate_dataset
+
+COUNTS = ['categories', 'products', 'users', 'orders', 'reviews']
+
+# Commands rebuilding what the model signals would have maintained
+REBUILD_COMMANDS = ['rebuild_product_stats', 'rebuild_sales_rollups', 'rebuild_search_index', 'build_recommendations']
+
+
+class Command(BaseCommand):
+    """
+    Load a reproducible synthetic dataset (see api/synthetic.py) for the
+    benchmarks and load tests, e.g.
+
+        python manage.py generate_synthetic_data --scale medium --seed 1
+        python manage.py bench_endpoints
+
+    Bulk inserts bypass the model signals, so the popularity counters, the
+    sales rollups, the search index and the recommendations are rebuilt
+    afterwards.
+    """
+    help = "Generate a synthetic catalog, users, orders and reviews"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=SCALES, default='small', help="Named dataset size")
+        for name in COUNTS:
+            parser.add_argument(f'--{name}', type=int, help=f"Number of {name} (overrides --scale)")
+        parser.add_argument('--max-items', type=int, default=5, help="Most distinct products per order")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=5000, help="Rows per INSERT and transaction")
+        parser.add_argument('--skip-rebuild', action='store_true', help="Leave the derived tables to be rebuilt later")
+
+    def handle(self, *args, **options):
+        counts = {name: options[name] if options[name] is not None else SCALES[options['scale']][name] for name in COUNTS}
+        if any(count < 0 for count in counts.values()) or options['max_items'] < 1 or options['batch_size'] < 1:
+            raise CommandError("Counts must not be negative, --max-items and --batch-size must be positive")
+
+        started = time.perf_counter()
+        written = generate_dataset(
+            **counts, seed=options['seed'], max_items=options['max_items'], batch_size=options['batch_size'],
+            log=self.stdout.write,
+        )
+        if not options['skip_rebuild']:
+            for command in REBUILD_COMMANDS:
+                call_command(command, stdout=self.stdout, stderr=self.stderr)
+        invalidate_tags({CATALOG_TAG, POPULAR_TAG, 'product', 'category', 'order', 'orderitem', 'review'})
+
+        rows = sum(written.values())
+        self.stdout.write(self.style.SUCCESS(f"Generated {rows} rows in {time.perf_counter() - started:.1f}s"))
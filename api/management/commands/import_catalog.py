@@ -0,0 +1,39 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.bulk import DEFAULT_BATCH_SIZE, FORMATS, guess_format, import_products, iter_records, text_stream
+
+
+class Command(BaseCommand):
+    """
+    Load products from a JSONL or CSV file.
+    Each record has name, description, price, stock and category (a name,
+    created when missing); records with an id update that product.
+    """
+    help = "Bulk import products from a JSONL or CSV file"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to import ('-' for stdin)")
+        parser.add_argument('--format', choices=FORMATS, help="Defaults to the file extension, else jsonl")
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        fmt = options['format'] or guess_format(options['path'])
+        try:
+            if options['path'] == '-':
+                summary = self.run(sys.stdin.buffer, fmt, options['batch_size'])
+            else:
+                with open(options['path'], 'rb') as binary_file:
+                    summary = self.run(binary_file, fmt, options['batch_size'])
+        except OSError as error:
+            raise CommandError(str(error))
+
+        for error in summary['errors']:
+            self.stderr.write(f"line {error['line']}: {error['error']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"{summary['created']} created, {summary['updated']} updated, {summary['failed']} failed"
+        ))
+
+    def run(self, binary_file, fmt, batch_size):
+        return import_products(iter_records(text_stream(binary_file), fmt), batch_size=batch_size)
@@ -0,0 +1,91 @@
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+
+DEFAULT_PATHS = [
+    '/api/products/',
+    '/api/products/popular/',
+    '/api/products/search/?query=phone',
+    '/api/categories/',
+]
+
+
+class Command(BaseCommand):
+    """
+    Measure concurrent read throughput of one or more running deployments,
+    typically the WSGI and the ASGI one side by side:
+
+        gunicorn lux.wsgi:application --workers 3 --bind 127.0.0.1:8000
+        gunicorn lux.asgi:application --workers 3 -k uvicorn.workers.UvicornWorker --bind 127.0.0.1:8001
+        python manage.py load_test wsgi=http://127.0.0.1:8000 asgi=http://127.0.0.1:8001
+
+    Every target gets the same request mix from the same number of
+    concurrent clients. Throttled (429) and failed requests are counted
+    separately, so raise the throttle rates of the servers under test.
+    """
+    help = "Compare concurrent-request throughput between deployments"
+
+    def add_arguments(self, parser):
+        parser.add_argument('targets', nargs='+', help="label=base_url, e.g. asgi=http://127.0.0.1:8001")
+        parser.add_argument('--path', action='append', dest='paths', help="Path to request (repeatable)")
+        parser.add_argument('--concurrency', type=int, default=50, help="Concurrent clients")
+        parser.add_argument('--requests', type=int, default=2000, help="Requests per target")
+        parser.add_argument('--timeout', type=float, default=30.0, help="Per-request timeout in seconds")
+
+    def handle(self, *args, **options):
+        targets = []
+        for target in options['targets']:
+            label, _, url = target.rpartition('=')
+            if not url.startswith(('http://', 'https://')):
+                raise CommandError(f"Invalid target {target!r}, expected label=http://host:port")
+            targets.append((label or url, url.rstrip('/')))
+        paths = options['paths'] or DEFAULT_PATHS
+
+        for label, base_url in targets:
+            self.run(label, [base_url + path for path in paths], options)
+
+    def run(self, label, urls, options):
+        total = options['requests']
+        latencies, statuses = [], {}
+        lock = threading.Lock()
+        counter = iter(range(total))
+
+        def client():
+            while True:
+                with lock:
+                    index = next(counter, None)
+                if index is None:
+                    return
+                started = time.perf_counter()
+                try:
+                    with urllib.request.urlopen(urls[index % len(urls)], timeout=options['timeout']) as response:
+                        response.read()
+                        code = response.status
+                except urllib.error.HTTPError as error:
+                    code = error.code
+                except OSError:
+                    code = 'error'
+                elapsed = time.perf_counter() - started
+                with lock:
+                    latencies.append(elapsed)
+                    statuses[code] = statuses.get(code, 0) + 1
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+            for _ in range(options['concurrency']):
+                executor.submit(client)
+        wall = time.perf_counter() - started
+
+        latencies.sort()
+        ok = sum(count for code, count in statuses.items() if code in (200, 304))
+        quantiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+        self.stdout.write(
+            f"{label:>8}: {ok / wall:8.1f} ok req/s  p50 {1000 * quantiles[49]:7.1f}ms  "
+            f"p95 {1000 * quantiles[94]:7.1f}ms  p99 {1000 * quantiles[98]:7.1f}ms  "
+            f"statuses {dict(sorted(statuses.items(), key=str))}"
+        )
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+
+from api.models import Product, ProductStats
+from api.stats import STATS_FIELDS, compute_product_stats, save_product_stats
+
+
+class Command(BaseCommand):
+    """
+    Recompute ProductStats from the order items (hot and archived) and Review,
+    one product id range at a time so memory and lock time stay bounded on
+    large catalogs.
+    With --dry-run only the drift between stored and computed counters is reported.
+    """
+    help = "Rebuild or reconcile the denormalized product popularity counters"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000, help="Products per batch")
+        parser.add_argument('--dry-run', action='store_true', help="Report drift without writing")
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        max_id = Product.objects.aggregate(max_id=Max('id'))['max_id'] or 0
+        checked = drifted = 0
+
+        for start_id in range(0, max_id + 1, chunk_size):
+            end_id = start_id + chunk_size
+            with transaction.atomic():
+                computed = compute_product_stats(start_id, end_id)
+                stored = ProductStats.objects.filter(product_id__gte=start_id, product_id__lt=end_id).in_bulk()
+                changed = [
+                    stats for stats in computed
+                    if stats.product_id not in stored
+                    or any(getattr(stats, f) != getattr(stored[stats.product_id], f) for f in STATS_FIELDS)
+                ]
+                if changed and not options['dry_run']:
+                    save_product_stats(changed)
+            checked += len(computed)
+            drifted += len(changed)
+
+        verb = "would be updated" if options['dry_run'] else "updated"
+        self.stdout.write(self.style.SUCCESS(f"Checked {checked} products, {drifted} {verb}"))
@@ -0,0 +1,47 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Min
+from django.utils import timezone
+
+from api.models import ArchivedOrder, Order
+from api.rollups import rebuild_daily_sales, sale_day
+
+
+class Command(BaseCommand):
+    """
+    Recompute the daily sales rollups from the order items, hot and
+    archived, a range of days at a time so each transaction stays short. Use it to backfill the rollups of
+    existing orders, or to reconcile them after writes that bypass the
+    model signals (queryset.update() of an order status, raw SQL).
+    """
+    help = "Rebuild the daily sales rollup tables from order history"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', type=date.fromisoformat, help="First day (YYYY-MM-DD), default the first order's")
+        parser.add_argument('--end', type=date.fromisoformat, help="Last day (YYYY-MM-DD), default today")
+        parser.add_argument('--chunk-days', type=int, default=31, help="Days per transaction")
+
+    def handle(self, *args, **options):
+        end = options['end'] or timezone.localdate()
+        start = options['start']
+        if start is None:
+            firsts = [model.objects.aggregate(first=Min('order_date'))['first'] for model in (Order, ArchivedOrder)]
+            first = min(filter(None, firsts), default=None)
+            if first is None:
+                self.stdout.write("No orders")
+                return
+            start = sale_day(first)
+        if start > end:
+            raise CommandError("--start must not be after --end")
+        if options['chunk_days'] < 1:
+            raise CommandError("--chunk-days must be positive")
+
+        days = rows = 0
+        while start <= end:
+            chunk_end = min(start + timedelta(days=options['chunk_days']), end + timedelta(days=1))
+            rows += sum(rebuild_daily_sales(start, chunk_end).values())
+            days += (chunk_end - start).days
+            start = chunk_end
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {days} days, {rows} rollup rows"))
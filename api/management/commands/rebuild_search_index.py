@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from api.search import get_search_backend
+
+
+class Command(BaseCommand):
+    """
+    Recompute the product search index from scratch.
+    Run after bulk loads that bypass the Product signals.
+    """
+    help = "Rebuild the product full-text search index"
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        backend.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Search index rebuilt ({type(backend).__name__})"))
@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.reservations import SWEEP_BATCH_SIZE, release_expired
+
+
+class Command(BaseCommand):
+    """
+    Give the units of expired cart holds back to their products, a batch per
+    transaction so the sweep never locks many rows at once. Run it from cron
+    every minute, or keep it running with --every.
+    """
+    help = "Release expired stock reservations"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=SWEEP_BATCH_SIZE, help="Holds released per transaction")
+        parser.add_argument('--every', type=float, help="Keep sweeping, pausing this many seconds between sweeps")
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size must be positive")
+        while True:
+            released = 0
+            while True:
+                count = release_expired(options['batch_size'])
+                released += count
+                if count < options['batch_size']:
+                    break
+            self.stdout.write(f"Released {released} expired reservations")
+            if options['every'] is None:
+                break
+            time.sleep(options['every'])
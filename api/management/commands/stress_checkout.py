@@ -0,0 +1,77 @@
+import threading
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection
+from django.db.models import Sum
+
+from api.checkout import InsufficientStock, place_order
+from api.models import Category, Order, OrderItem, Product
+
+
+class Command(BaseCommand):
+    """
+    Hammer the checkout path from many threads against a single product and
+    check that stock was never oversold. Every row the command creates is
+    deleted afterwards unless --keep is given.
+    """
+    help = "Concurrent checkout stress test: reports throughput and verifies zero overselling"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--attempts', type=int, default=50, help="Checkouts per thread")
+        parser.add_argument('--stock', type=int, default=300, help="Initial stock of the contested product")
+        parser.add_argument('--quantity', type=int, default=1, help="Units per checkout")
+        parser.add_argument('--keep', action='store_true', help="Keep the generated rows")
+
+    def handle(self, *args, **options):
+        stamp = time.time_ns()
+        category = Category.objects.create(name=f"stress-checkout-{stamp}")
+        product = Product.objects.create(
+            name="Contested product", description="", price=10, stock=options['stock'], category=category
+        )
+        user = User.objects.create(username=f"stress-checkout-{stamp}")
+        counts = {'placed': 0, 'rejected': 0, 'errors': 0}
+        lock = threading.Lock()
+
+        def worker():
+            try:
+                for _ in range(options['attempts']):
+                    try:
+                        place_order(user, [(product.id, options['quantity'])])
+                        outcome = 'placed'
+                    except InsufficientStock:
+                        outcome = 'rejected'
+                    except OperationalError:
+                        outcome = 'errors'  # e.g. SQLite "database is locked"
+                    with lock:
+                        counts[outcome] += 1
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(options['threads'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        product.refresh_from_db()
+        sold = OrderItem.objects.filter(product=product).aggregate(units=Sum('quantity'))['units'] or 0
+        attempts = options['threads'] * options['attempts']
+        self.stdout.write(
+            f"{attempts} checkouts in {elapsed:.2f}s ({attempts / elapsed:.0f}/s): "
+            f"{counts['placed']} placed, {counts['rejected']} out of stock, {counts['errors']} errors"
+        )
+        self.stdout.write(f"Initial stock {options['stock']}, sold {sold}, remaining {product.stock}")
+
+        if not options['keep']:
+            Order.objects.filter(user=user).delete()
+            user.delete()
+            category.delete()
+
+        if sold > options['stock'] or sold + product.stock != options['stock']:
+            raise CommandError("Stock was oversold or lost")
+        self.stdout.write(self.style.SUCCESS("No overselling"))
@@ -0,0 +1,352 @@
+# metrics.py
+"""
+Runtime telemetry in the Prometheus text format.
+
+MetricsMiddleware records, per route (the URL pattern name):
+- request count by method and status, and a latency histogram;
+- response sizes;
+- SQL queries per request and their total time, through a database
+  execute wrapper installed on every connection;
+- cache hits, stale hits and misses of api/caching.py, per key family
+  (e.g. 'popular_products', 'response:product').
+
+Everything is aggregated in-process under a lock: a few dict updates per
+request. A background thread of each worker writes a snapshot of its totals
+to METRICS_DIR every METRICS_FLUSH_SECONDS, off the request path, and
+/api/metrics/ adds up the snapshots of every worker, so the figures cover
+the whole gunicorn deployment. Snapshots are named by PID and a random boot
+id, so a new worker never takes over the file of an old one. A snapshot not
+rewritten for SNAPSHOT_EXPIRY_FLUSHES intervals is from a worker that is
+gone: it is ignored and deleted, and the totals drop, which Prometheus
+treats as a counter reset.
+
+Requests slower than SLOW_REQUEST_SECONDS are logged (logger 'api.metrics')
+with their slowest and most repeated SQL statements.
+"""
+import heapq
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# name -> (type, help, histogram buckets)
+METRICS = {
+    'lux_http_requests_total': ('counter', 'HTTP requests by route, method and status.', None),
+    'lux_http_request_duration_seconds': ('histogram', 'Request latency by route.', LATENCY_BUCKETS),
+    'lux_http_response_size_bytes': ('histogram', 'Size of non-streaming response bodies by route.', SIZE_BUCKETS),
+    'lux_db_queries_per_request': ('histogram', 'SQL queries run by one request, by route.', QUERY_BUCKETS),
+    'lux_db_query_duration_seconds_total': ('counter', 'Time spent in SQL queries by route.', None),
+    'lux_cache_requests_total': ('counter', 'Cache lookups by key family and result (hit, stale, miss).', None),
+    'lux_slow_requests_total': ('counter', 'Requests slower than SLOW_REQUEST_SECONDS, by route.', None),
+}
+
+# Statements kept per request for the slow-request log
+SLOW_SQL_KEPT = 5
+# Distinct statements counted per request to find the most repeated one (an N+1)
+REPEATED_SQL_TRACKED = 200
+
+UNMATCHED_ROUTE = '<unmatched>'
+
+# Flush intervals after which the snapshot of a worker that stopped writing it is dropped
+SNAPSHOT_EXPIRY_FLUSHES = 3
+
+
+class Registry:
+    """Counters and histograms of this process, keyed by metric name and sorted label pairs."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = defaultdict(float)
+        self.histograms = {}
+
+    def inc(self, name, labels, value=1):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] += value
+
+    def observe(self, name, labels, value):
+        key = (name, tuple(sorted(labels.items())))
+        buckets = METRICS[name][2]
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [[0] * len(buckets), 0.0, 0]
+            for index, bound in enumerate(buckets):
+                if value <= bound:
+                    histogram[0][index] += 1
+                    break
+            histogram[1] += value
+            histogram[2] += 1
+
+    def snapshot(self):
+        """The totals as JSON-serializable lists."""
+        with self._lock:
+            return {
+                'counters': [[name, labels, value] for (name, labels), value in self.counters.items()],
+                'histograms': [[name, labels, *histogram] for (name, labels), histogram in self.histograms.items()],
+            }
+
+    def merge(self, snapshot):
+        """Add the totals of a snapshot (of another worker) to this registry."""
+        for name, labels, value in snapshot['counters']:
+            self.counters[(name, tuple(map(tuple, labels)))] += value
+        for name, labels, counts, total, count in snapshot['histograms']:
+            histogram = self.histograms.setdefault((name, tuple(map(tuple, labels))), [[0] * len(counts), 0.0, 0])
+            histogram[0] = [a + b for a, b in zip(histogram[0], counts)]
+            histogram[1] += total
+            histogram[2] += count
+
+
+registry = Registry()
+_flush_lock = threading.Lock()
+_process = None  # (pid, snapshot file name) of this worker
+_flusher_pid = None
+
+
+def _snapshot_name():
+    global _process
+    pid = os.getpid()
+    if _process is None or _process[0] != pid:  # First call, or in a forked worker
+        _process = (pid, f'worker-{pid}-{uuid.uuid4().hex[:12]}.json')
+    return _process[1]
+
+
+def _snapshots(expired):
+    """The snapshot files of the other workers: the live ones, or the expired ones."""
+    if not settings.METRICS_DIR or not os.path.isdir(settings.METRICS_DIR):
+        return []
+    own = _snapshot_name()
+    oldest = time.time() - SNAPSHOT_EXPIRY_FLUSHES * settings.METRICS_FLUSH_SECONDS
+    entries = []
+    for entry in os.scandir(settings.METRICS_DIR):
+        if entry.name.startswith('worker-') and entry.name != own:
+            try:
+                if (entry.stat().st_mtime < oldest) == expired:
+                    entries.append(entry)
+            except FileNotFoundError:
+                continue  # Deleted by another worker
+    return entries
+
+
+def flush():
+    """Write this worker's snapshot to METRICS_DIR and delete the expired ones of gone workers."""
+    if not settings.METRICS_DIR:
+        return
+    with _flush_lock:
+        try:
+            os.makedirs(settings.METRICS_DIR, exist_ok=True)
+            path = os.path.join(settings.METRICS_DIR, _snapshot_name())
+            with open(f'{path}.tmp', 'w') as file:
+                json.dump(registry.snapshot(), file)
+            os.replace(f'{path}.tmp', path)  # Readers never see a partial file
+            for entry in _snapshots(expired=True):
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    continue
+        except OSError:
+            logger.exception("Could not write the metrics snapshot")
+
+
+def _flush_periodically():
+    while True:
+        time.sleep(settings.METRICS_FLUSH_SECONDS)
+        flush()
+
+
+def start_flusher():
+    """Start the thread flushing this worker's snapshot, once per process."""
+    global _flusher_pid
+    if not settings.METRICS_DIR or _flusher_pid == os.getpid():
+        return
+    with _flush_lock:
+        if _flusher_pid != os.getpid():  # A forked worker does not inherit the thread
+            _flusher_pid = os.getpid()
+            threading.Thread(target=_flush_periodically, name='metrics-flush', daemon=True).start()
+
+
+def collect():
+    """A registry with the totals of every worker: this one's live figures plus the others' snapshots."""
+    merged = Registry()
+    merged.merge(registry.snapshot())
+    for entry in _snapshots(expired=False):
+        if entry.name.endswith('.json'):
+            try:
+                with open(entry.path) as file:
+                    merged.merge(json.load(file))
+            except (OSError, ValueError):
+                continue  # A worker being replaced
+    return merged
+
+
+def _format_labels(labels, extra=()):
+    pairs = [*labels, *extra]
+    if not pairs:
+        return ''
+    escaped = (
+        (name, str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')) for name, value in pairs
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+def _number(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def render(merged):
+    """The Prometheus text exposition (format 0.0.4) of a registry."""
+    series = defaultdict(list)
+    for (name, labels), value in sorted(merged.counters.items()):
+        series[name].append(f'{name}{_format_labels(labels)} {_number(value)}')
+    for (name, labels), (counts, total, count) in sorted(merged.histograms.items()):
+        cumulative = 0
+        for bound, bucket in zip(METRICS[name][2], counts):
+            cumulative += bucket
+            series[name].append(f'{name}_bucket{_format_labels(labels, [("le", _number(bound))])} {cumulative}')
+        series[name].append(f'{name}_bucket{_format_labels(labels, [("le", "+Inf")])} {count}')
+        series[name].append(f'{name}_sum{_format_labels(labels)} {_number(total)}')
+        series[name].append(f'{name}_count{_format_labels(labels)} {count}')
+    lines = []
+    for name, (kind, help_text, _) in METRICS.items():
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}', *series.get(name, [])]
+    return '\n'.join(lines) + '\n'
+
+
+def cache_family(key):
+    """The metric label of a cache key: the key without its last ':' part (an id or a hash)."""
+    family, separator, _ = key.rpartition(':')
+    return family if separator else key
+
+
+def record_cache(key, result):
+    """Count a cache lookup of api/caching.py: result is 'hit', 'stale' or 'miss'."""
+    registry.inc('lux_cache_requests_total', {'cache': cache_family(key), 'result': result})
+
+
+class QueryRecorder:
+    """The SQL statements of one request: count, total time, slowest and most repeated."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.slowest = []  # Min-heap of (duration, sql)
+        self.repeated = Counter()
+
+    def add(self, sql, duration):
+        self.count += 1
+        self.duration += duration
+        if len(self.slowest) < SLOW_SQL_KEPT:
+            heapq.heappush(self.slowest, (duration, sql))
+        elif duration > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, (duration, sql))
+        if sql in self.repeated or len(self.repeated) < REPEATED_SQL_TRACKED:
+            self.repeated[sql] += 1
+
+
+_recorder = ContextVar('metrics_query_recorder', default=None)
+
+
+def _record_query(execute, sql, params, many, context):
+    """Database execute wrapper timing the queries of the current request, if any."""
+    recorder = _recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        recorder.add(sql, time.perf_counter() - started)
+
+
+def install_query_recorder(connection, **kwargs):
+    """connection_created receiver: put the execute wrapper on every new connection."""
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+def install():
+    """Instrument the connections already open; the connection_created signal covers the others."""
+    for connection in connections.all(initialized_only=True):
+        install_query_recorder(connection)
+
+
+def _route(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return UNMATCHED_ROUTE
+    return match.url_name or match.route
+
+
+def record_request(request, response, duration, queries):
+    """Add one request to the registry, and log it when it is slow."""
+    start_flusher()  # Here rather than at startup: the app may be loaded before gunicorn forks
+    route = _route(request)
+    registry.inc('lux_http_requests_total', {'route': route, 'method': request.method, 'status': str(response.status_code)})
+    registry.observe('lux_http_request_duration_seconds', {'route': route}, duration)
+    if not response.streaming:
+        registry.observe('lux_http_response_size_bytes', {'route': route}, len(response.content))
+    registry.observe('lux_db_queries_per_request', {'route': route}, queries.count)
+    registry.inc('lux_db_query_duration_seconds_total', {'route': route}, queries.duration)
+
+    if duration >= settings.SLOW_REQUEST_SECONDS:
+        registry.inc('lux_slow_requests_total', {'route': route})
+        slowest = '\n'.join(f'  {1000 * took:.1f}ms {sql}' for took, sql in sorted(queries.slowest, reverse=True))
+        repeated = queries.repeated.most_common(1)
+        logger.warning(
+            "Slow request %s %s (%s): %.0fms, %d queries in %.0fms; most repeated (%dx): %s\nSlowest queries:\n%s",
+            request.method, request.get_full_path(), route, 1000 * duration, queries.count, 1000 * queries.duration,
+            repeated[0][1] if repeated else 0, repeated[0][0] if repeated else '-', slowest or '  -',
+        )
+
+
+class MetricsMiddleware:
+    """
+    Record the latency, status, response size and SQL queries of every
+    request (see the module docstring). Put it first in MIDDLEWARE so the
+    timing covers the other middleware too.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        queries = QueryRecorder()
+        token = _recorder.set(queries)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _recorder.reset(token)
+        record_request(request, response, time.perf_counter() - started, queries)
+        return response
+
+    async def __acall__(self, request):
+        queries = QueryRecorder()
+        token = _recorder.set(queries)  # Copied into the threads running the ORM by sync_to_async
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _recorder.reset(token)
+        record_request(request, response, time.perf_counter() - started, queries)
+        return response
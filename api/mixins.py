@@ -0,0 +1,130 @@
+# mixins.py
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework import status
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.response import Response
+
+from .caching import (
+    get_tagged,
+    response_cache_key,
+    response_etag,
+    set_tagged,
+    tag_versions,
+    versions_last_modified,
+)
+from .fast_serializers import get_values_serializer
+from .pagination import ordering_columns
+from .query_plan import get_query_plan
+from .routers import use_primary_if_recent
+
+
+class CachedResponseMixin:
+    """
+    Cache the data of list and retrieve responses, tagged so that the signals
+    in api/signals.py invalidate them when a row they contain changes.
+
+    Tags are format strings filled with the view kwargs, e.g. 'product:{pk}'.
+    The data is cached before rendering, so every renderer can reuse it.
+
+    With conditional_get, responses also carry an ETag and Last-Modified
+    derived from the tag versions alone. A client revalidating with
+    If-None-Match / If-Modified-Since gets a 304 without any database query
+    or serialization.
+    """
+    cache_timeout = 300
+    cache_list_tags = ()
+    cache_detail_tags = ()
+    conditional_get = False
+
+    def list(self, request, *args, **kwargs):
+        return self._cached_response(self.cache_list_tags, super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._cached_response(self.cache_detail_tags, super().retrieve, request, *args, **kwargs)
+
+    def get_response_cache_key(self, request):
+        return response_cache_key(self.basename, request.build_absolute_uri())
+
+    def _cached_response(self, tags, view, request, *args, **kwargs):
+        tags = [tag.format(**kwargs) for tag in tags]
+        key = self.get_response_cache_key(request)
+        # Read the versions first: a write committing while we compute makes our entry stale
+        versions = tag_versions(tags)
+
+        validators = None
+        if self.conditional_get:
+            validators = self._validators(request, key, versions)
+            not_modified = get_conditional_response(request, etag=validators[0], last_modified=validators[1])
+            if not_modified is not None:
+                return self._add_validators(not_modified, validators)
+
+        data = get_tagged(key, versions)
+        if data is not None:
+            response = Response(data)
+        else:
+            with use_primary_if_recent(versions):
+                response = view(request, *args, **kwargs)
+            if response.status_code == status.HTTP_200_OK:
+                set_tagged(key, response.data, versions, self.cache_timeout)
+
+        if validators is not None and response.status_code == status.HTTP_200_OK:
+            self._add_validators(response, validators)
+        return response
+
+    def _validators(self, request, key, versions):
+        """ETag and Last-Modified of the response: they change exactly when one of its tags does."""
+        renderer = getattr(request, 'accepted_renderer', None)
+        return response_etag(key, getattr(renderer, 'format', ''), versions), versions_last_modified(versions)
+
+    @staticmethod
+    def _add_validators(response, validators):
+        response['ETag'] = validators[0]
+        response['Last-Modified'] = http_date(validators[1])
+        response['Cache-Control'] = 'no-cache'  # Clients may store it but must revalidate
+        return response
+
+
+class QueryPlanMixin:
+    """
+    Derive select_related / prefetch_related / only() for read requests from
+    the serializer's field tree (see api/query_plan.py), so a page costs a
+    constant number of queries however many rows it holds.
+
+    The plan is applied on top of the viewset's own queryset, which can still
+    add lookups the planner cannot see, such as those of method fields.
+    The serializer is the one of this request, so ?fields= and ?expand=
+    shrink the query too.
+    """
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        request = getattr(self, 'request', None)
+        if request is not None and request.method in SAFE_METHODS:
+            plan = get_query_plan(self.get_serializer())
+            queryset = plan.apply(queryset, also=ordering_columns(self.pagination_class))
+        return queryset
+
+
+class ValuesListMixin:
+    """
+    Serve list() from .values() rows through a compiled ValuesSerializer
+    (see api/fast_serializers.py) instead of model instances and a
+    ModelSerializer. The output is identical; no model is instantiated and
+    no per-field dispatch happens, which matters on large pages.
+
+    Viewsets whose serializer has nested or computed fields keep the regular
+    list(). With ?fields=, only the selected columns are read.
+    """
+
+    def list(self, request, *args, **kwargs):
+        fast = get_values_serializer(self.get_serializer_class(), tuple(self.get_serializer().fields))
+        if fast is None:
+            return super().list(request, *args, **kwargs)
+        columns = dict.fromkeys([*fast.columns, *ordering_columns(self.pagination_class)])
+        queryset = self.filter_queryset(self.get_queryset()).values(*columns)
+        context = self.get_serializer_context()
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(fast.serialize(page, context))
+        return Response(fast.serialize(queryset, context))
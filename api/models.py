@@ -1,5 +1,7 @@
 from django.db import models
+from django.contrib.postgres.search import SearchVectorField
 from django.contrib.auth.models import User
+from django.utils import timezone
 
 class Category(models.Model):
     """
@@ -21,10 +23,20 @@ class Product(models.Model):
     description = models.TextField()
     price = models.DecimalField(max_digits=10, decimal_places=2)
     stock = models.PositiveIntegerField()
+    reserved = models.PositiveIntegerField(default=0, editable=False)  # Units held in carts (api/reservations.py); available = stock - reserved
     category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='products')
     image = models.ImageField(upload_to='product_images/', blank=True, null=True)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)  # Resized copies, filled by api/images.py
     date_time_added = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    search_vector = SearchVectorField(null=True, editable=False)  # Maintained by signals, GIN-indexed on PostgreSQL
+
+    class Meta:
+        indexes = [
+            # Keyset pagination of the catalog and of a single category's products
+            models.Index(fields=['-date_time_added', '-id'], name='product_added_id_idx'),
+            models.Index(fields=['category', '-date_time_added', '-id'], name='product_cat_added_id_idx'),
+        ]
     
     def __str__(self):
         return self.name
@@ -45,6 +57,15 @@ class Order(models.Model):
     total_price = models.DecimalField(max_digits=10, decimal_places=2)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='Pending')
     order_date = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-order_date', '-id'], name='order_date_id_idx'),
+            # Orders of one status, newest first (admin status filter, archival mover)
+            models.Index(fields=['status', '-order_date', '-id'], name='order_status_date_idx'),
+            # A user's order history, newest first
+            models.Index(fields=['user', '-order_date', '-id'], name='order_user_date_idx'),
+        ]
     
     def __str__(self):
         return f"Order {self.id} - {self.user.username}"
@@ -72,6 +93,169 @@ class Review(models.Model):
     rating = models.PositiveIntegerField()
     comment = models.TextField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='review_created_id_idx'),
+            # Serves a product's review feed (/products/{id}/reviews/), newest first
+            models.Index(fields=['product', '-created_at', '-id'], name='review_product_created_idx'),
+        ]
     
     def __str__(self):
-        return f"{self.user.username} - {self.product.name}"
\ No newline at end of file
+        return f"{self.user.username} - {self.product.name}"
+
+class ProductStats(models.Model):
+    """
+    Denormalized sales and rating counters for a product.
+    Kept current by the OrderItem and Review signals so that popularity can
+    be read from an index instead of aggregating order and review history.
+    """
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    units_sold = models.PositiveIntegerField(default=0)  # Sum of OrderItem.quantity
+    order_count = models.PositiveIntegerField(default=0)  # Number of OrderItem rows
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
+    rating_avg = models.FloatField(default=0)  # rating_sum / rating_count, stored so it can be indexed
+    # Star histogram: number of reviews rated 1 to 5
+    rating_1 = models.PositiveIntegerField(default=0)
+    rating_2 = models.PositiveIntegerField(default=0)
+    rating_3 = models.PositiveIntegerField(default=0)
+    rating_4 = models.PositiveIntegerField(default=0)
+    rating_5 = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            # Serves the popular products top-N directly
+            models.Index(fields=['-order_count', '-rating_avg', '-product'], name='product_popularity_idx'),
+        ]
+
+    def __str__(self):
+        return f"Stats for product {self.product_id}"
+
+class DailySales(models.Model):
+    """
+    Sales of one day for one order status, pre-aggregated from OrderItem.
+    Kept current by the OrderItem and Order signals (see api/rollups.py) so
+    that reports read a few rows per day instead of scanning order history.
+    """
+    day = models.DateField()  # Date of Order.order_date in TIME_ZONE
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)  # Sum of OrderItem.price * quantity
+    units = models.PositiveIntegerField(default=0)  # Sum of OrderItem.quantity
+    line_count = models.PositiveIntegerField(default=0)  # Number of OrderItem rows
+
+    class Meta:
+        abstract = True
+
+class ProductDailySales(DailySales):
+    """Daily sales rollup of a product."""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='daily_sales')
+
+    class Meta:
+        constraints = [
+            # Also serves a product's time series
+            models.UniqueConstraint(fields=['product', 'day', 'status'], name='product_daily_sales_uniq'),
+        ]
+        indexes = [
+            # Top-N over a date range
+            models.Index(fields=['day'], name='product_daily_sales_day_idx'),
+        ]
+
+    def __str__(self):
+        return f"Sales of product {self.product_id} on {self.day} ({self.status})"
+
+class CategoryDailySales(DailySales):
+    """Daily sales rollup of a category."""
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='daily_sales')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['category', 'day', 'status'], name='category_daily_sales_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['day'], name='category_daily_sales_day_idx'),
+        ]
+
+    def __str__(self):
+        return f"Sales of category {self.category_id} on {self.day} ({self.status})"
+
+class ProductNeighbor(models.Model):
+    """
+    One of the products most often bought together with a product, ranked
+    from 1. Written by the recommendations build (api/recommendations.py)
+    so that "frequently bought together" is a single indexed read.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='neighbors')
+    neighbor = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    rank = models.PositiveSmallIntegerField()
+    orders = models.PositiveIntegerField()  # Orders containing both products
+    score = models.FloatField()  # Cosine similarity: orders / sqrt(orders of product * orders of neighbor)
+
+    class Meta:
+        constraints = [
+            # Serves the lookup of a product's neighbours in rank order
+            models.UniqueConstraint(fields=['product', 'rank'], name='product_neighbor_rank_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.neighbor_id} bought with {self.product_id} (#{self.rank})"
+
+class StockReservation(models.Model):
+    """
+    A time-limited hold on units of a product, placed when a customer puts
+    it in their cart. Counted in Product.reserved until checkout converts it
+    into a sale or the sweeper releases it after expires_at.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='reservations')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reservations')
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            # One hold per cart line; also serves the lookup of a user's cart
+            models.UniqueConstraint(fields=['user', 'product'], name='reservation_user_product_uniq'),
+        ]
+        indexes = [
+            # The sweeper reads the expired holds in expiry order
+            models.Index(fields=['expires_at'], name='reservation_expires_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} x product {self.product_id} held for {self.user_id}"
+
+
+class ArchivedOrder(models.Model):
+    """
+    A Delivered or Cancelled order moved out of the Order table by the
+    archival mover (api/archive.py) once it is old enough, keeping its id.
+    The hot Order table stays small while a user's history still spans both.
+    """
+    id = models.BigIntegerField(primary_key=True)  # The id it had as an Order
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_orders')
+    total_price = models.DecimalField(max_digits=10, decimal_places=2)
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    order_date = models.DateTimeField()
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-order_date', '-id'], name='archived_order_user_date_idx'),
+            # Day ranges of the sales rollups rebuild
+            models.Index(fields=['order_date'], name='archived_order_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"Archived order {self.id}"
+
+class ArchivedOrderItem(models.Model):
+    """An OrderItem of an ArchivedOrder, keeping its id."""
+    id = models.BigIntegerField(primary_key=True)
+    order = models.ForeignKey(ArchivedOrder, on_delete=models.CASCADE, related_name='items')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    quantity = models.PositiveIntegerField()
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+
+    def __str__(self):
+        return f"{self.quantity} x product {self.product_id} (archived)"
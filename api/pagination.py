@@ -0,0 +1,209 @@
+# pagination.py
+import json
+from base64 import b64decode, b64encode
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+# Number of products embedded in each category of a category listing.
+# The full list is served page by page from /categories/{id}/products/.
+CATEGORY_PRODUCT_PREVIEW_SIZE = 5
+
+
+def ordering_columns(pagination_class):
+    """The columns a keyset paginator reads from each row of the page to build its cursors."""
+    ordering = getattr(pagination_class, 'ordering', None) or ()
+    if isinstance(ordering, str):
+        ordering = (ordering,)
+    return [field.lstrip('-') for field in ordering]
+
+
+class KeysetCursorPagination(CursorPagination):
+    """
+    Cursor pagination keyed on a composite, indexed ordering such as
+    ('-date_time_added', '-id').
+
+    DRF's CursorPagination only keys on the first ordering field and falls
+    back to an OFFSET for ties. Here the cursor carries the value of every
+    ordering field of the boundary row, and the next page is fetched with a
+    row-value comparison (a < x OR (a = x AND b < y)), so a deep page costs
+    the same index range scan as the first one.
+
+    All ordering fields must share the same direction and the last one must
+    be unique (normally the primary key).
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('-id',)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        queryset = self._page_queryset(queryset, request, view)
+        if queryset is None:
+            return None
+        return self._set_page(list(queryset))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """paginate_queryset for async views: the page is fetched with the async ORM."""
+        queryset = self._page_queryset(queryset, request, view)
+        if queryset is None:
+            return None
+        return self._set_page([row async for row in queryset])
+
+    def paginate_querysets(self, querysets, request, view=None):
+        """
+        One page over several querysets with the same ordering columns, such
+        as a table and its archive: each reads at most a page from its own
+        index and the rows are merged here. The last ordering column must be
+        unique across all of them.
+        """
+        rows = []
+        for queryset in querysets:
+            queryset = self._page_queryset(queryset, request, view)
+            if queryset is None:
+                return None
+            rows.extend(queryset)
+        reverse = self.cursor is not None and self.cursor['reverse']
+        names = [field.lstrip('-') for field in self.ordering]
+        rows.sort(key=lambda row: [getattr(row, name) for name in names],
+                  reverse=self.ordering[0].startswith('-') != reverse)
+        return self._set_page(rows[:self.page_size + 1])
+
+    def _page_queryset(self, queryset, request, view):
+        """Parse the request and return the unevaluated query of the page."""
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.model = queryset.model
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor is not None and self.cursor['reverse']
+
+        # Walk the index backwards when moving to the previous page
+        ordering = self._invert(self.ordering) if reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if self.cursor is not None:
+            queryset = queryset.filter(self._keyset_filter(ordering, self.cursor['position']))
+
+        # Fetch one extra row to know whether there is another page
+        return queryset[:self.page_size + 1]
+
+    def _set_page(self, results):
+        reverse = self.cursor is not None and self.cursor['reverse']
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        if reverse:
+            self.page.reverse()
+
+        if reverse:
+            self.has_next = True
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = self.cursor is not None
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        if not self.page:
+            # Stepped back past the first row: restart from the beginning
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor({'position': self._position(self.page[-1]), 'reverse': False})
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor({'position': self._position(self.page[0]), 'reverse': True})
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            cursor = json.loads(b64decode(encoded.encode('ascii')).decode('utf-8'))
+            position = cursor['p']
+            if not isinstance(position, list) or len(position) != len(self.ordering):
+                raise ValueError
+            return {'position': self._parse_position(position), 'reverse': bool(cursor.get('r'))}
+        except (TypeError, ValueError, KeyError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def _parse_position(self, position):
+        """The cursor values as the ordering fields store them: a tampered cursor fails here, not in the query."""
+        values = []
+        for field, value in zip(self.ordering, position):
+            model_field = self.model._meta.get_field(field.lstrip('-'))
+            value = model_field.to_python(value)
+            if value is None:
+                raise ValueError
+            values.append(model_field.get_prep_value(value))
+        return values
+
+    def encode_cursor(self, cursor):
+        payload = {'p': cursor['position']}
+        if cursor['reverse']:
+            payload['r'] = 1
+        encoded = b64encode(json.dumps(payload, separators=(',', ':')).encode('utf-8')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def _position(self, instance):
+        position = []
+        for field in self.ordering:
+            # Rows are model instances, or dicts on the .values() fast path
+            value = instance[field.lstrip('-')] if isinstance(instance, dict) else getattr(instance, field.lstrip('-'))
+            # Datetimes and decimals travel as strings and are parsed back by the field on filtering
+            position.append(value if isinstance(value, (int, str)) or value is None else str(value))
+        return position
+
+    @staticmethod
+    def _invert(ordering):
+        return tuple(field[1:] if field.startswith('-') else '-' + field for field in ordering)
+
+    @staticmethod
+    def _keyset_filter(ordering, position):
+        """
+        Build (f1 > v1) OR (f1 = v1 AND f2 > v2) OR ... for the given ordering,
+        using "<" for descending fields.
+        """
+        condition = Q()
+        equal = {}
+        for field, value in zip(ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return condition
+
+
+class ProductCursorPagination(KeysetCursorPagination):
+    """Newest products first, backed by the (date_time_added, id) index."""
+    ordering = ('-date_time_added', '-id')
+
+
+class CategoryCursorPagination(KeysetCursorPagination):
+    """Categories in creation order."""
+    ordering = ('id',)
+
+
+class OrderCursorPagination(KeysetCursorPagination):
+    """Newest orders first, backed by the (order_date, id) index."""
+    ordering = ('-order_date', '-id')
+
+
+class OrderItemCursorPagination(KeysetCursorPagination):
+    """Newest order items first."""
+    ordering = ('-id',)
+
+
+class ReviewCursorPagination(KeysetCursorPagination):
+    """Newest reviews first, backed by the (created_at, id) index."""
+    ordering = ('-created_at', '-id')
@@ -0,0 +1,162 @@
+# query_plan.py
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework import serializers
+from rest_framework.relations import ManyRelatedField, RelatedField
+
+_plans = {}
+
+# Sparse fieldsets make the number of distinct serializer shapes client-driven: stop memoizing past this
+MAX_MEMOIZED_PLANS = 1024
+
+
+class QueryPlan:
+    """
+    The select_related / prefetch_related / only() calls needed to serialize
+    a queryset without per-row queries.
+    """
+
+    def __init__(self, select_related=(), prefetch_related=(), only=None):
+        self.select_related = list(select_related)
+        self.prefetch_related = list(prefetch_related)
+        self.only = None if only is None else sorted(only)
+
+    def apply(self, queryset, also=()):
+        """Apply the plan to queryset. also names columns to load besides the serializer's, such as pagination keys."""
+        if self.select_related:
+            queryset = queryset.select_related(*self.select_related)
+        if self.prefetch_related:
+            queryset = queryset.prefetch_related(*self.prefetch_related)
+        if self.only is not None:
+            queryset = queryset.only(*self.only, *also)
+        return queryset
+
+    def __repr__(self):
+        return f'QueryPlan(select_related={self.select_related}, prefetch_related={self.prefetch_related}, only={self.only})'
+
+
+def _resolve(model, name):
+    """Return the model field or reverse relation reachable as attribute name, or None."""
+    try:
+        return model._meta.get_field(name)
+    except FieldDoesNotExist:
+        pass
+    # Reverse relations without a related_name are exposed as <model>_set
+    for relation in model._meta.related_objects:
+        if relation.get_accessor_name() == name:
+            return relation
+    return None
+
+
+def _uses_pk_only(field):
+    """True when DRF renders the relation from the foreign key value alone (no join needed)."""
+    return isinstance(field, RelatedField) and field.use_pk_only_optimization()
+
+
+def _walk(serializer, model, prefix, select_related, prefetch_related, only):
+    """
+    Add the lookups needed by serializer (rendering instances of model,
+    reached through prefix) to the given lists.
+
+    Returns False when the serializer reads something that cannot be mapped
+    to model fields (method fields, properties, source='*'); the caller then
+    loads every column of that model.
+    """
+    restricted = True
+    columns = {prefix + model._meta.pk.name}
+
+    for field in serializer.fields.values():
+        if field.write_only:
+            continue
+        if field.source == '*' or isinstance(field, serializers.SerializerMethodField):
+            restricted = False
+            continue
+
+        model_field = _resolve(model, field.source_attrs[0])
+        if model_field is None:
+            restricted = False
+            continue
+        name = field.source_attrs[0]
+        path = prefix + name
+
+        if not model_field.is_relation:
+            columns.add(path)
+            continue
+
+        related_model = model_field.related_model
+        if model_field.many_to_many or model_field.one_to_many:
+            child = field.child if isinstance(field, serializers.ListSerializer) else None
+            if isinstance(field, ManyRelatedField):
+                child = field.child_relation
+            queryset = related_model._default_manager.all()
+            if isinstance(child, serializers.BaseSerializer):
+                queryset = plan_for_serializer(child, related_model, link=model_field).apply(queryset)
+            elif _uses_pk_only(child) and model_field.one_to_many:
+                # Only the ids are rendered, plus the foreign key attaching them to their parent
+                queryset = queryset.only(related_model._meta.pk.name, model_field.field.name)
+            prefetch_related.append(Prefetch(path, queryset=queryset))
+            continue
+
+        # Forward foreign key / one-to-one, or reverse one-to-one
+        if model_field.concrete:
+            columns.add(path)
+        if isinstance(field, serializers.BaseSerializer) and len(field.source_attrs) == 1:
+            select_related.append(path)
+            nested_columns = set()
+            if _walk(field, related_model, path + '__', select_related, prefetch_related, nested_columns):
+                columns.update(nested_columns)
+        elif _uses_pk_only(field) and len(field.source_attrs) == 1:
+            continue
+        else:
+            # StringRelatedField, SlugRelatedField, dotted sources: join and load the related row
+            select_related.append(path)
+
+    if restricted:
+        only.update(columns)
+    return restricted
+
+
+def plan_for_serializer(serializer, model=None, link=None):
+    """
+    Build the QueryPlan for serializer, an instance of a ModelSerializer
+    (or a ListSerializer wrapping one). link is the reverse relation a nested
+    plan is prefetched through; its foreign key is always loaded so Django
+    can attach the rows to their parents.
+    """
+    if isinstance(serializer, serializers.ListSerializer):
+        serializer = serializer.child
+    model = model or serializer.Meta.model
+
+    select_related, prefetch_related, only = [], [], set()
+    if not _walk(serializer, model, '', select_related, prefetch_related, only):
+        only = None
+    elif link is not None and link.one_to_many:
+        only.add(link.field.name)
+    return QueryPlan(select_related, prefetch_related, only)
+
+
+def _shape(serializer):
+    """The field tree of serializer: names and field types, recursively through nested serializers."""
+    shape = []
+    for name, field in serializer.fields.items():
+        if isinstance(field, serializers.ListSerializer):
+            field = field.child
+        shape.append((name, type(field), _shape(field) if isinstance(field, serializers.BaseSerializer) else None))
+    return tuple(shape)
+
+
+def get_query_plan(serializer):
+    """
+    Return the memoized plan of serializer. Plans depend only on the serializer
+    class and its field tree (which ?fields= and ?expand= can prune), so each
+    is computed once per process.
+    """
+    if isinstance(serializer, serializers.ListSerializer):
+        serializer = serializer.child
+    key = (type(serializer), _shape(serializer))
+    plan = _plans.get(key)
+    if plan is None:
+        plan = plan_for_serializer(serializer)
+        if len(_plans) < MAX_MEMOIZED_PLANS:
+            _plans[key] = plan
+    return plan
@@ -0,0 +1,242 @@
+# recommendations.py
+"""
+"Frequently bought together": item-to-item co-occurrence of products in orders.
+
+The batch build turns the order items into a sparse order x product matrix B
+(1 where the order contains the product) and computes C = B.T @ B in one
+sparse product: C[i, j] is the number of orders containing both products,
+and the diagonal the number of orders of each product. Neighbours are
+ranked by cosine similarity, C[i, j] / sqrt(C[i, i] * C[j, j]), and the best
+TOP_K of each product are stored as ProductNeighbor rows.
+
+C is saved to the default storage with the id of the last order it
+includes, so an incremental build only multiplies the orders placed since
+and re-ranks the products they contain. The scores of other products drift
+slightly until the next full build.
+
+NumPy and SciPy are optional: without them the build counts pairs in Python,
+which is fine for small shops, and incremental builds rebuild everything.
+"""
+import math
+import time
+from collections import Counter, defaultdict
+from datetime import timedelta
+from io import BytesIO
+from itertools import chain, combinations
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:  # Optional dependencies: fall back to the pure Python build
+    np = sparse = None
+
+from .caching import invalidate_tags
+from .models import ArchivedOrder, ArchivedOrderItem, Order, OrderItem, Product, ProductNeighbor
+
+# Tag of the cached related products lists, bumped by every build
+RELATED_TAG = 'related'
+
+# Neighbours stored per product
+TOP_K = 20
+
+# Orders younger than this are left for the next build: an order with a lower id may still be committing
+SETTLE_SECONDS = 60
+
+STATE_NAME = 'recommendations/cooccurrence.npz'
+
+
+def _settled_order_id():
+    """Id of the last order old enough to be included, 0 if none."""
+    until = timezone.now() - timedelta(seconds=SETTLE_SECONDS)
+    return max(
+        model.objects.filter(order_date__lt=until).aggregate(last=Max('id'))['last'] or 0
+        for model in (Order, ArchivedOrder)
+    )
+
+
+def _order_items(after_order_id, last_order_id):
+    """
+    (order id, product id) of the items of orders after_order_id < id <= last_order_id,
+    hot and archived, cancelled ones excluded.
+    """
+    return chain.from_iterable(
+        model.objects.filter(order_id__gt=after_order_id, order_id__lte=last_order_id)
+        .exclude(order__status='Cancelled')
+        .values_list('order_id', 'product_id')
+        .iterator(chunk_size=20000)
+        for model in (OrderItem, ArchivedOrderItem)
+    )
+
+
+def cooccurrence(order_ids, product_ids, products):
+    """
+    The co-occurrence count matrix of the order items given as two parallel
+    arrays, over products, a sorted array containing every product id.
+    A product listed twice in an order counts once.
+    """
+    orders, order_index = np.unique(order_ids, return_inverse=True)
+    baskets = sparse.csr_matrix(
+        (np.ones(len(order_ids), dtype=np.int32), (order_index, np.searchsorted(products, product_ids))),
+        shape=(len(orders), len(products)),
+    )
+    baskets.data[:] = 1  # Duplicates were summed when building the CSR matrix
+    return (baskets.T @ baskets).tocsr()
+
+
+def _reindex(counts, old_products, products):
+    """counts over old_products, embedded in the matrix over products (a sorted superset)."""
+    index = np.searchsorted(products, old_products)
+    counts = counts.tocoo()
+    return sparse.csr_matrix((counts.data, (index[counts.row], index[counts.col])), shape=(len(products),) * 2)
+
+
+def top_neighbors(products, counts, k=TOP_K, min_orders=1, rows=None):
+    """
+    The k most similar products of each product (only of the products at the
+    indexes rows, when given), best first, as
+    {product_id: [(neighbor_id, orders, score), ...]}.
+    Pairs bought together in fewer than min_orders orders are ignored.
+    """
+    counts = counts.tocsr()
+    orders = counts.diagonal().astype(np.float64)
+    row_of = np.repeat(np.arange(len(products)), np.diff(counts.indptr))
+    keep = (counts.indices != row_of) & (counts.data >= min_orders)
+    if rows is not None:
+        keep &= np.isin(row_of, rows)
+    row_of, columns, pair_orders = row_of[keep], counts.indices[keep], counts.data[keep]
+    scores = pair_orders / np.sqrt(orders[row_of] * orders[columns])
+
+    # Sort every pair by row, then best score (ties: lowest product id), and keep the first k of each row
+    ranked = np.lexsort((products[columns], -scores, row_of))
+    row_of, columns, pair_orders, scores = row_of[ranked], columns[ranked], pair_orders[ranked], scores[ranked]
+    top = np.arange(len(row_of)) - np.searchsorted(row_of, row_of) < k
+
+    result = {product_id: [] for product_id in (products if rows is None else products[rows]).tolist()}
+    for product_id, neighbor_id, count, score in zip(
+        products[row_of[top]].tolist(), products[columns[top]].tolist(), pair_orders[top].tolist(), scores[top].tolist()
+    ):
+        result[product_id].append((neighbor_id, count, score))
+    return result
+
+
+def _python_top_neighbors(items, k=TOP_K, min_orders=1):
+    """top_neighbors() computed with Counters, for installs without NumPy/SciPy."""
+    baskets = defaultdict(set)
+    for order_id, product_id in items:
+        baskets[order_id].add(product_id)
+    orders = Counter()
+    pairs = defaultdict(Counter)
+    for basket in baskets.values():
+        orders.update(basket)
+        for first, second in combinations(basket, 2):
+            pairs[first][second] += 1
+            pairs[second][first] += 1
+
+    result = {}
+    for product_id in orders:
+        scored = [
+            (neighbor_id, count, count / math.sqrt(orders[product_id] * orders[neighbor_id]))
+            for neighbor_id, count in pairs[product_id].items() if count >= min_orders
+        ]
+        scored.sort(key=lambda neighbor: (-neighbor[2], neighbor[0]))
+        result[product_id] = scored[:k]
+    return result
+
+
+def load_state():
+    """The saved (products, counts, last_order_id), or None."""
+    if not default_storage.exists(STATE_NAME):
+        return None
+    with default_storage.open(STATE_NAME) as file:
+        state = np.load(BytesIO(file.read()))
+    counts = sparse.csr_matrix((state['data'], state['indices'], state['indptr']), shape=(len(state['products']),) * 2)
+    return state['products'], counts, int(state['last_order_id'])
+
+
+def save_state(products, counts, last_order_id):
+    buffer = BytesIO()
+    np.savez_compressed(
+        buffer, products=products, data=counts.data, indices=counts.indices, indptr=counts.indptr,
+        last_order_id=last_order_id,
+    )
+    default_storage.delete(STATE_NAME)
+    default_storage.save(STATE_NAME, ContentFile(buffer.getvalue()))
+
+
+def save_neighbors(neighbors, batch_size=1000):
+    """Replace the stored neighbours of each product in neighbors, one transaction per batch of products."""
+    existing = set(Product.objects.values_list('id', flat=True))
+    product_ids = sorted(product_id for product_id in neighbors if product_id in existing)
+    for start in range(0, len(product_ids), batch_size):
+        batch = product_ids[start:start + batch_size]
+        rows = [
+            ProductNeighbor(product_id=product_id, neighbor_id=neighbor_id, rank=rank, orders=orders, score=score)
+            for product_id in batch
+            for rank, (neighbor_id, orders, score) in enumerate(
+                (neighbor for neighbor in neighbors[product_id] if neighbor[0] in existing), start=1
+            )
+        ]
+        with transaction.atomic():
+            ProductNeighbor.objects.filter(product_id__in=batch).delete()
+            ProductNeighbor.objects.bulk_create(rows, batch_size=batch_size)
+    return len(product_ids)
+
+
+def build_recommendations(k=TOP_K, min_orders=1, incremental=False):
+    """
+    Rebuild the stored neighbours from the order history, or with incremental
+    only fold in the orders placed since the last build. Returns a summary.
+    """
+    started = time.perf_counter()
+    last_order_id = _settled_order_id()
+    state = load_state() if incremental and np is not None else None
+    after_order_id = state[2] if state is not None else 0
+
+    if np is None:
+        items = list(_order_items(0, last_order_id))
+        neighbors = _python_top_neighbors(items, k, min_orders)
+        item_count = len(items)
+    else:
+        pairs = np.fromiter(chain.from_iterable(_order_items(after_order_id, last_order_id)), dtype=np.int64)
+        order_ids, product_ids = pairs[0::2], pairs[1::2]
+        item_count = len(order_ids)
+        if state is None:
+            products = np.unique(product_ids)
+            counts = cooccurrence(order_ids, product_ids, products)
+            rows = None
+        else:
+            old_products, old_counts, _ = state
+            products = np.union1d(old_products, product_ids)
+            counts = _reindex(old_counts, old_products, products) + cooccurrence(order_ids, product_ids, products)
+            rows = np.unique(np.searchsorted(products, product_ids))  # Only the products of the new orders
+        neighbors = top_neighbors(products, counts, k, min_orders, rows)
+        save_state(products, counts, max(last_order_id, after_order_id))
+
+    if state is None:
+        # Products without orders any more lose their stale neighbours
+        stored = set(ProductNeighbor.objects.values_list('product_id', flat=True).distinct())
+        neighbors.update({product_id: [] for product_id in stored - neighbors.keys()})
+    updated = save_neighbors(neighbors)
+    invalidate_tags({RELATED_TAG})
+    return {
+        'order_items': item_count,
+        'products': updated,
+        'incremental': state is not None,
+        'seconds': time.perf_counter() - started,
+    }
+
+
+def related_products(product_id, limit=TOP_K):
+    """The products most often bought together with product_id, best first: one indexed read."""
+    neighbors = (
+        ProductNeighbor.objects.filter(product_id=product_id, rank__lte=limit)
+        .select_related('neighbor')
+        .order_by('rank')
+    )
+    return [neighbor.neighbor for neighbor in neighbors]
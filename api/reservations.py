@@ -0,0 +1,107 @@
+# reservations.py
+"""
+Cart stock reservations: a hold keeps units of a product for one user for
+STOCK_RESERVATION_TTL seconds, so they can't be sold to another cart in the
+meantime.
+
+Product.reserved is the sum of the product's live holds, kept in step with
+conditional UPDATEs, so checking and taking availability (stock - reserved)
+never needs to read and lock the hold rows of other users. Checkout consumes
+the user's holds (api/checkout.py), and expired ones are given back in
+batches by the release_expired_reservations command.
+"""
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from .checkout import InsufficientStock
+from .models import Product, StockReservation
+
+SWEEP_BATCH_SIZE = 1000
+
+
+def reserve(user, product_id, quantity):
+    """
+    Set the user's hold on product_id to quantity units, valid for
+    STOCK_RESERVATION_TTL seconds from now, and return it.
+
+    Only the difference with the current hold is taken from the product,
+    with one conditional UPDATE (SET reserved = reserved + n WHERE
+    stock >= reserved + n), so concurrent carts never hold more than the
+    stock. Raises InsufficientStock (409) or ValidationError (400).
+    """
+    if not Product.objects.filter(pk=product_id).exists():
+        raise ValidationError({'product_id': [f'Product {product_id} does not exist.']})
+
+    expires_at = timezone.now() + timedelta(seconds=settings.STOCK_RESERVATION_TTL)
+    with transaction.atomic():
+        # Lock the hold before the product, in the same order as checkout and the sweeper
+        hold, created = StockReservation.objects.get_or_create(
+            user=user, product_id=product_id, defaults={'quantity': 0, 'expires_at': expires_at}
+        )
+        if not created:
+            hold = StockReservation.objects.select_for_update().get(pk=hold.pk)
+        extra = quantity - hold.quantity
+        if extra > 0:
+            held = Product.objects.filter(pk=product_id, stock__gte=F('reserved') + extra).update(
+                reserved=F('reserved') + extra
+            )
+            if not held:
+                raise InsufficientStock(f'Not enough stock for product {product_id}.')
+        elif extra < 0:
+            Product.objects.filter(pk=product_id).update(reserved=F('reserved') + extra)
+        hold.quantity = quantity
+        hold.expires_at = expires_at
+        hold.save(update_fields=['quantity', 'expires_at'])
+    return hold
+
+
+def _release(holds):
+    """Delete holds, (id, product_id, quantity) tuples locked by the caller, and give their units back."""
+    if not holds:
+        return 0
+    StockReservation.objects.filter(pk__in=[hold_id for hold_id, _, _ in holds]).delete()
+    released = Counter()
+    for _, product_id, quantity in holds:
+        released[product_id] += quantity
+    for product_id in sorted(released):
+        Product.objects.filter(pk=product_id).update(reserved=F('reserved') - released[product_id])
+    return len(holds)
+
+
+def release(user, product_ids=None):
+    """Release the user's holds (on product_ids only, when given). Returns how many were released."""
+    holds = StockReservation.objects.select_for_update().filter(user=user)
+    if product_ids is not None:
+        holds = holds.filter(product_id__in=product_ids)
+    with transaction.atomic():
+        return _release(list(holds.values_list('id', 'product_id', 'quantity')))
+
+
+def release_expired(batch_size=SWEEP_BATCH_SIZE, now=None):
+    """
+    Release up to batch_size expired holds in one short transaction and
+    return how many. Holds locked by a checkout or a cart change are skipped
+    rather than waited for; the next sweep picks them up if still expired.
+    """
+    expired = (
+        StockReservation.objects.select_for_update(skip_locked=True)
+        .filter(expires_at__lte=now or timezone.now())
+        .order_by('expires_at')
+        .values_list('id', 'product_id', 'quantity')
+    )
+    with transaction.atomic():
+        return _release(list(expired[:batch_size]))
+
+
+def availability(product_ids):
+    """Stock, held and available units of each product: a plain indexed read, never a row lock."""
+    return list(
+        Product.objects.filter(pk__in=product_ids).order_by('pk')
+        .values('id', 'stock', 'reserved', available=F('stock') - F('reserved'))
+    )
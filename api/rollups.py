@@ -0,0 +1,219 @@
+# rollups.py
+from collections import defaultdict
+from datetime import datetime, time
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate, TruncMonth, TruncWeek
+from django.utils import timezone
+
+from .models import ArchivedOrderItem, CategoryDailySales, Order, OrderItem, Product, ProductDailySales
+
+ROLLUP_FIELDS = ['revenue', 'units', 'line_count']
+
+# Report dimension -> (rollup model, key field)
+DIMENSIONS = {
+    'product': (ProductDailySales, 'product'),
+    'category': (CategoryDailySales, 'category'),
+}
+
+INTERVALS = {'day': None, 'week': TruncWeek, 'month': TruncMonth}
+
+
+def sale_day(order_date):
+    """The rollup day of an order: its date in the current time zone, like TruncDate."""
+    return timezone.localdate(order_date)
+
+
+def _day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def _apply_deltas(model, field, deltas):
+    """
+    Add deltas, {(key_id, day, status): [revenue, units, line_count]}, to
+    the rollup rows with one UPDATE ... SET x = x + n each, in key order so
+    concurrent writers lock rows in the same order.
+
+    A row is created on the first positive change and deleted once its last
+    sale is removed. Negative changes on a missing row are ignored: they
+    come from cascading deletes of the product or category.
+    """
+    for key_id, day, status in sorted(deltas):
+        revenue, units, line_count = deltas[(key_id, day, status)]
+        if not (revenue or units or line_count):
+            continue
+        rows = model.objects.filter(**{field: key_id}, day=day, status=status)
+        changes = {'revenue': F('revenue') + revenue, 'units': F('units') + units, 'line_count': F('line_count') + line_count}
+        if rows.update(**changes):
+            if line_count < 0:
+                rows.filter(line_count=0).delete()
+        elif line_count > 0:
+            model.objects.get_or_create(**{field: key_id}, day=day, status=status)
+            rows.update(**changes)
+
+
+def record_sales(day, status, lines, sign=1):
+    """
+    Add (sign=1) or remove (sign=-1) sales lines, (product_id, category_id,
+    quantity, price) tuples, to the rollups of day and status. Lines are
+    summed per product and per category first, so a whole order costs one
+    statement per product and per category.
+    """
+    products = defaultdict(lambda: [Decimal(0), 0, 0])
+    categories = defaultdict(lambda: [Decimal(0), 0, 0])
+    for product_id, category_id, quantity, price in lines:
+        for totals in (products[(product_id, day, status)], categories[(category_id, day, status)]):
+            totals[0] += sign * Decimal(price) * quantity
+            totals[1] += sign * quantity
+            totals[2] += sign
+    with transaction.atomic():
+        _apply_deltas(ProductDailySales, 'product_id', products)
+        _apply_deltas(CategoryDailySales, 'category_id', categories)
+
+
+def _record_order_item(item, sign):
+    order_id, product_id, quantity, price = item
+    order = Order.objects.filter(pk=order_id).values_list('order_date', 'status').first()
+    category_id = Product.objects.filter(pk=product_id).values_list('category_id', flat=True).first()
+    if order is None or category_id is None:
+        return
+    record_sales(sale_day(order[0]), order[1], [(product_id, category_id, quantity, price)], sign)
+
+
+def order_item_sales_changed(old, new):
+    """
+    Move a single OrderItem's sales between rollup rows.
+    old and new are (order_id, product_id, quantity, price) tuples, or None
+    when the row is created or deleted.
+    """
+    if old == new:
+        return
+    if old is not None:
+        _record_order_item(old, -1)
+    if new is not None:
+        _record_order_item(new, 1)
+
+
+def order_status_changed(order_id, order_date, old_status, new_status):
+    """Move all the sales of an order from its previous status to the new one."""
+    order_statuses_changed([(order_id, order_date, old_status, new_status)])
+
+
+def order_statuses_changed(changes):
+    """
+    Move the sales of several orders to their new status, reading all their
+    items with one query. changes are (order_id, order_date, old_status,
+    new_status) tuples; orders of the same day and move are applied together.
+    """
+    changes = {order_id: (sale_day(order_date), old, new) for order_id, order_date, old, new in changes if old != new}
+    if not changes:
+        return
+    moves = defaultdict(list)
+    items = OrderItem.objects.filter(order_id__in=changes).values_list(
+        'order_id', 'product_id', 'product__category_id', 'quantity', 'price'
+    )
+    for order_id, *line in items:
+        moves[changes[order_id]].append(line)
+    if moves:
+        with transaction.atomic():
+            for (day, old_status, new_status), lines in sorted(moves.items()):
+                record_sales(day, old_status, lines, sign=-1)
+                record_sales(day, new_status, lines)
+
+
+def product_categories_changed(moves):
+    """
+    Move the sales of products to their new category, so category rollups
+    always add up the sales of the products currently in it.
+    moves maps a product id to its (old_category_id, new_category_id).
+    """
+    moves = {product_id: move for product_id, move in moves.items() if move[0] != move[1]}
+    if not moves:
+        return
+    deltas = defaultdict(lambda: [Decimal(0), 0, 0])
+    rows = ProductDailySales.objects.filter(product_id__in=moves).values_list('product_id', 'day', 'status', *ROLLUP_FIELDS)
+    for product_id, day, status, revenue, units, line_count in rows:
+        for category_id, sign in zip(moves[product_id], (-1, 1)):
+            totals = deltas[(category_id, day, status)]
+            totals[0] += sign * revenue
+            totals[1] += sign * units
+            totals[2] += sign * line_count
+    with transaction.atomic():
+        _apply_deltas(CategoryDailySales, 'category_id', deltas)
+
+
+def compute_daily_sales(start, end):
+    """
+    Recompute the rollup rows of the days start <= day < end from OrderItem
+    and ArchivedOrderItem, with one grouped aggregate per table and dimension.
+    Returns unsaved instances per model.
+    """
+    computed = {}
+    for model, field, source in (
+        (ProductDailySales, 'product_id', 'product_id'),
+        (CategoryDailySales, 'category_id', 'product__category_id'),
+    ):
+        totals = defaultdict(lambda: [Decimal(0), 0, 0])
+        for item_model in (OrderItem, ArchivedOrderItem):
+            rows = item_model.objects.filter(
+                order__order_date__gte=_day_start(start), order__order_date__lt=_day_start(end)
+            ).annotate(day=TruncDate('order__order_date')).values('day', 'order__status', source).annotate(
+                revenue=Sum(F('price') * F('quantity')), units=Sum('quantity'), line_count=Count('id')
+            ).order_by()
+            for row in rows:
+                row_totals = totals[(row[source], row['day'], row['order__status'])]
+                row_totals[0] += row['revenue']
+                row_totals[1] += row['units']
+                row_totals[2] += row['line_count']
+        computed[model] = [
+            model(**{field: key_id}, day=day, status=status, revenue=revenue, units=units, line_count=line_count)
+            for (key_id, day, status), (revenue, units, line_count) in totals.items()
+        ]
+    return computed
+
+
+def rebuild_daily_sales(start, end, batch_size=1000):
+    """Replace the rollup rows of the days start <= day < end with recomputed ones. Returns the row counts."""
+    with transaction.atomic():
+        computed = compute_daily_sales(start, end)
+        for model, rows in computed.items():
+            model.objects.filter(day__gte=start, day__lt=end).delete()
+            model.objects.bulk_create(rows, batch_size=batch_size)
+    return {model: len(rows) for model, rows in computed.items()}
+
+
+def _rollups(dimension, start, end, statuses=None):
+    model, field = DIMENSIONS[dimension]
+    rows = model.objects.filter(day__gte=start, day__lte=end)
+    if statuses:
+        rows = rows.filter(status__in=statuses)
+    return rows, field
+
+
+def sales_series(dimension, start, end, ids=None, statuses=None, interval='day'):
+    """
+    Revenue, units and order lines per day, week or month between start and
+    end (inclusive), summed over the given products or categories (all by default).
+    """
+    rows, field = _rollups(dimension, start, end, statuses)
+    if ids:
+        rows = rows.filter(**{f'{field}_id__in': ids})
+    period = INTERVALS[interval]('day') if INTERVALS[interval] else F('day')
+    return list(
+        rows.annotate(period=period).values('period')
+        .annotate(revenue=Sum('revenue'), units=Sum('units'), line_count=Sum('line_count'))
+        .order_by('period')
+    )
+
+
+def top_sales(dimension, start, end, metric='revenue', statuses=None, limit=10):
+    """The limit products or categories with the highest metric between start and end (inclusive)."""
+    rows, field = _rollups(dimension, start, end, statuses)
+    top = (
+        rows.values(field, name=F(f'{field}__name'))
+        .annotate(revenue=Sum('revenue'), units=Sum('units'), line_count=Sum('line_count'))
+        .order_by(f'-{metric}', field)[:limit]
+    )
+    return [{'id': row.pop(field), **row} for row in top]
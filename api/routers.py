@@ -0,0 +1,117 @@
+# routers.py
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from .caching import versions_last_modified
+
+# Cookie keeping a client's reads on the primary for a moment after it wrote
+PRIMARY_COOKIE = 'db_primary'
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_pinned = ContextVar('primary_pinned', default=False)
+
+
+@contextmanager
+def use_primary():
+    """Send every read of the enclosed block (this thread or task only) to the primary."""
+    token = _pinned.set(True)
+    try:
+        yield
+    finally:
+        _pinned.reset(token)
+
+
+@contextmanager
+def use_primary_if_recent(versions):
+    """
+    use_primary() when one of the cache tag versions changed within the
+    replica lag: a value computed from a replica then could predate the
+    write that invalidated it, and would be cached as fresh.
+    """
+    if settings.DATABASE_REPLICAS and time.time() - versions_last_modified(versions) <= settings.DATABASE_REPLICA_LAG + 1:
+        with use_primary():
+            yield
+    else:
+        yield
+
+
+class PrimaryReplicaRouter:
+    """
+    Send reads to a random replica among DATABASE_REPLICAS and writes to the
+    primary ('default'). Reads stay on the primary:
+    - inside a transaction on the primary, so a transaction sees its own writes;
+    - while pinned by use_primary(), which PrimaryPinningMiddleware does for
+      the whole of a write request and for the client's next requests within
+      DATABASE_REPLICA_LAG seconds (read-after-write).
+    Replicas hold the same data, so relations may cross aliases, and only the
+    primary is migrated.
+    """
+
+    def db_for_read(self, model, **hints):
+        replicas = settings.DATABASE_REPLICAS
+        if not replicas or _pinned.get() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            # Follow relations on the database the instance came from
+            return instance._state.db
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.DATABASE_REPLICAS
+
+
+class PrimaryPinningMiddleware:
+    """
+    Pin the reads of unsafe requests to the primary, and set a short-lived
+    cookie so the same client keeps reading from the primary until the
+    replicas have caught up with its write.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self._pins(request):
+            return self.get_response(request)
+        with use_primary():
+            response = self.get_response(request)
+        return self._remember(request, response)
+
+    async def __acall__(self, request):
+        if not self._pins(request):
+            return await self.get_response(request)
+        with use_primary():
+            response = await self.get_response(request)
+        return self._remember(request, response)
+
+    @staticmethod
+    def _pins(request):
+        return bool(settings.DATABASE_REPLICAS) and (
+            request.method not in SAFE_METHODS or PRIMARY_COOKIE in request.COOKIES
+        )
+
+    @staticmethod
+    def _remember(request, response):
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            response.set_cookie(PRIMARY_COOKIE, '1', max_age=settings.DATABASE_REPLICA_LAG, httponly=True, samesite='Lax')
+        return response
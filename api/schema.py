@@ -0,0 +1,169 @@
+# schema.py
+"""
+The OpenAPI schema, generated once per code version instead of per request.
+
+drf_yasg walks every view and serializer to build the schema, which takes
+a worker hundreds of milliseconds on a large API, and SDK generators and
+docs crawlers fetch it constantly. The schema only depends on the code, so
+it is generated for a fingerprint of the project's Python sources (and of
+the DRF / drf_yasg versions) and written to SCHEMA_DIR as
+openapi-<fingerprint>.json and .yaml, e.g. at build time with
+
+    python manage.py generate_openapi_schema
+
+A worker reads the files of its code version on the first docs hit (or
+generates them if the build did not) and then serves them from memory,
+with an ETag so revalidating clients get a 304. A deploy changes the
+fingerprint, so a stale schema is never served.
+
+The schema is generated without a request, so it has no host and clients
+use the one they fetched it from.
+"""
+import hashlib
+import logging
+import os
+import threading
+from collections import namedtuple
+from functools import cache
+from importlib import import_module
+from importlib.metadata import version
+
+from django.apps import apps
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from drf_yasg import openapi
+from drf_yasg.codecs import OpenAPICodecJson, OpenAPICodecYaml
+from drf_yasg.generators import OpenAPISchemaGenerator
+from drf_yasg.views import get_schema_view
+from rest_framework.response import Response
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_INFO = openapi.Info(
+    title="E-Commerce API",
+    default_version='v1',
+    description="E-commerce platform API documentation",
+    terms_of_service="https://www.google.com/policies/terms/",
+    contact=openapi.Contact(email="contact@ecommerce.local"),
+    license=openapi.License(name="BSD License"),
+)
+
+# Encoding -> codec; the drf_yasg renderer formats map to these
+CODECS = {'json': OpenAPICodecJson, 'yaml': OpenAPICodecYaml}
+RENDERER_ENCODINGS = {'openapi': 'json', '.json': 'json', '.yaml': 'yaml'}
+
+# Packages whose version changes the generated schema
+SCHEMA_PACKAGES = ('djangorestframework', 'drf-yasg')
+
+SchemaDocument = namedtuple('SchemaDocument', ['content', 'etag'])
+
+_documents = {}
+_documents_lock = threading.Lock()
+
+
+def _source_dirs():
+    """The directories of the project's own apps and of its URLconf."""
+    base_dir = os.path.realpath(settings.BASE_DIR)
+    dirs = {
+        os.path.realpath(app.path) for app in apps.get_app_configs()
+        if os.path.realpath(app.path).startswith(base_dir + os.sep)
+    }
+    dirs.add(os.path.dirname(os.path.realpath(import_module(settings.ROOT_URLCONF).__file__)))
+    return sorted(dirs)
+
+
+@cache
+def code_fingerprint():
+    """A hash of the Python sources the schema is generated from: it changes with the code."""
+    digest = hashlib.sha256()
+    for package in SCHEMA_PACKAGES:
+        digest.update(f'{package}=={version(package)}\n'.encode())
+    for directory in _source_dirs():
+        for root, subdirs, files in os.walk(directory):
+            subdirs[:] = sorted(subdir for subdir in subdirs if not subdir.startswith(('.', '__pycache__')))
+            for name in sorted(files):
+                if name.endswith('.py'):
+                    path = os.path.join(root, name)
+                    digest.update(os.path.relpath(path, directory).encode())
+                    with open(path, 'rb') as file:
+                        digest.update(hashlib.sha256(file.read()).digest())
+    return digest.hexdigest()[:16]
+
+
+def schema_path(encoding):
+    """The file of the schema of this code version in SCHEMA_DIR."""
+    return os.path.join(settings.SCHEMA_DIR, f'openapi-{code_fingerprint()}.{encoding}')
+
+
+def generate_schema():
+    """The drf_yasg Swagger object of the whole public API."""
+    return OpenAPISchemaGenerator(SCHEMA_INFO).get_schema(request=None, public=True)
+
+
+def write_schema(directory=None):
+    """Generate the schema and write it in every encoding. Returns {encoding: path}."""
+    directory = directory or settings.SCHEMA_DIR
+    schema = generate_schema()
+    os.makedirs(directory, exist_ok=True)
+    paths = {}
+    for encoding, codec in CODECS.items():
+        path = os.path.join(directory, os.path.basename(schema_path(encoding)))
+        with open(f'{path}.tmp', 'wb') as file:
+            file.write(codec([]).encode(schema))
+        os.replace(f'{path}.tmp', path)  # Workers never read a partial file
+        paths[encoding] = path
+    return paths
+
+
+def _read(encoding):
+    with open(schema_path(encoding), 'rb') as file:
+        return file.read()
+
+
+def get_schema_document(encoding):
+    """The schema of this code version in encoding ('json' or 'yaml'), read or generated once per process."""
+    document = _documents.get(encoding)
+    if document is not None:
+        return document
+    with _documents_lock:
+        if encoding not in _documents:
+            try:
+                content = _read(encoding)
+            except FileNotFoundError:
+                try:
+                    write_schema()
+                    content = _read(encoding)
+                except OSError:
+                    logger.exception("Could not write the OpenAPI schema to %s", settings.SCHEMA_DIR)
+                    content = CODECS[encoding]([]).encode(generate_schema())
+            _documents[encoding] = SchemaDocument(content, f'"{code_fingerprint()}-{encoding}"')
+        return _documents[encoding]
+
+
+class PrecomputedSchemaMixin:
+    """
+    drf_yasg schema view serving the precomputed documents: the JSON and YAML
+    formats come from get_schema_document() and the Swagger UI / ReDoc pages
+    only need the API info, so no request walks the views.
+    """
+
+    def get(self, request, version='', format=None):
+        encoding = RENDERER_ENCODINGS.get(request.accepted_renderer.format)
+        if encoding is None:
+            # The UI pages render the title and version, then fetch the schema itself
+            return Response(openapi.Swagger(info=SCHEMA_INFO, _prefix='/', paths=openapi.Paths({})))
+        document = get_schema_document(encoding)
+        response = get_conditional_response(request, etag=document.etag)
+        if response is None:
+            media_type = request.accepted_renderer.media_type
+            response = HttpResponse(document.content, content_type=f'{media_type}; charset=utf-8')
+        response['ETag'] = document.etag
+        response['Cache-Control'] = 'no-cache'  # Clients may store it but must revalidate
+        return response
+
+
+def get_precomputed_schema_view(**kwargs):
+    """get_schema_view() of drf_yasg for SCHEMA_INFO, serving the precomputed schema."""
+    view = get_schema_view(SCHEMA_INFO, public=True, **kwargs)
+    return type('PrecomputedSchemaView', (PrecomputedSchemaMixin, view), {})
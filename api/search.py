@@ -0,0 +1,245 @@
+# search.py
+import bisect
+import heapq
+import re
+import threading
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connection, connections, transaction
+from django.db.models import F
+
+from .models import Product
+
+# Upper bound on the number of results a single search may return
+SEARCH_RESULT_LIMIT = 50
+
+# Text search configuration used for both the stored vector and the query
+SEARCH_CONFIG = 'english'
+
+SEARCH_INDEX_NAME = 'product_search_vector_gin'
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(text):
+    """Split text into lowercase word tokens."""
+    return _TOKEN_RE.findall((text or '').lower())
+
+
+def product_search_vector():
+    """Weighted search vector expression: name ranks above description."""
+    return (
+        SearchVector('name', weight='A', config=SEARCH_CONFIG)
+        + SearchVector('description', weight='B', config=SEARCH_CONFIG)
+    )
+
+
+class PostgresSearchBackend:
+    """
+    Ranked full-text search over Product.search_vector.
+
+    The vector column is kept current by the Product signals and is served by
+    a GIN index, so a search is an index lookup plus a rank sort of the
+    matching rows only.
+    """
+
+    def _queryset(self, terms, limit):
+        # Every term must match; each one also matches as a prefix ("lap" -> "laptop")
+        tsquery = SearchQuery(' & '.join(f'{term}:*' for term in terms), search_type='raw', config=SEARCH_CONFIG)
+        return (
+            Product.objects.filter(search_vector=tsquery)
+            .annotate(rank=SearchRank(F('search_vector'), tsquery))
+            .order_by('-rank', '-id')[:limit]
+        )
+
+    def search(self, query, limit=SEARCH_RESULT_LIMIT):
+        terms = tokenize(query)
+        if not terms:
+            return []
+        return list(self._queryset(terms, limit))
+
+    async def asearch(self, query, limit=SEARCH_RESULT_LIMIT):
+        terms = tokenize(query)
+        if not terms:
+            return []
+        return [product async for product in self._queryset(terms, limit)]
+
+    def index_product(self, product):
+        Product.objects.filter(pk=product.pk).update(search_vector=product_search_vector())
+
+    def index_products(self, products):
+        ids = [product.pk for product in products if product.pk is not None]
+        if ids:
+            Product.objects.filter(pk__in=ids).update(search_vector=product_search_vector())
+
+    def remove_product(self, product_id):
+        # The vector lives on the row itself and goes away with it
+        pass
+
+    def rebuild(self):
+        Product.objects.update(search_vector=product_search_vector())
+
+    def reset(self):
+        # Nothing is held in memory
+        pass
+
+    def ensure_index(self, using='default'):
+        """Create the GIN index backing the search vector if it is missing."""
+        with connections[using].cursor() as cursor:
+            cursor.execute(
+                f'CREATE INDEX IF NOT EXISTS {SEARCH_INDEX_NAME} '
+                f'ON {Product._meta.db_table} USING gin (search_vector)'
+            )
+
+
+class InvertedIndexSearchBackend:
+    """
+    In-process inverted index used where PostgreSQL full-text search is not
+    available (SQLite, tests).
+
+    Postings map each token to {product_id: weight}. A sorted vocabulary makes
+    prefix expansion a binary search, so the cost of a query depends on the
+    number of matching postings rather than on the size of the catalog. The
+    index is built lazily from the database on first use and then maintained
+    by the Product signals of the current process.
+    """
+    NAME_WEIGHT = 2.0
+    DESCRIPTION_WEIGHT = 1.0
+    PREFIX_PENALTY = 0.5  # A prefix match counts half as much as a whole word
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._postings = defaultdict(dict)
+            self._documents = {}
+            self._vocabulary = []
+            self._built = False
+
+    def rebuild(self):
+        with self._lock:
+            self.reset()
+            rows = Product.objects.values_list('id', 'name', 'description').iterator(chunk_size=2000)
+            for product_id, name, description in rows:
+                self._add(product_id, name, description)
+            self._built = True
+
+    def _ensure_built(self):
+        if not self._built:
+            self.rebuild()
+
+    def _add(self, product_id, name, description):
+        weights = defaultdict(float)
+        for token in tokenize(name):
+            weights[token] += self.NAME_WEIGHT
+        for token in tokenize(description):
+            weights[token] += self.DESCRIPTION_WEIGHT
+
+        for token, weight in weights.items():
+            postings = self._postings[token]
+            if not postings:
+                bisect.insort(self._vocabulary, token)
+            postings[product_id] = weight
+        self._documents[product_id] = set(weights)
+
+    def _remove(self, product_id):
+        for token in self._documents.pop(product_id, ()):
+            postings = self._postings[token]
+            postings.pop(product_id, None)
+            if not postings:
+                del self._postings[token]
+                position = bisect.bisect_left(self._vocabulary, token)
+                del self._vocabulary[position]
+
+    def _expand(self, term):
+        """Yield the vocabulary tokens that start with term."""
+        position = bisect.bisect_left(self._vocabulary, term)
+        while position < len(self._vocabulary) and self._vocabulary[position].startswith(term):
+            yield self._vocabulary[position]
+            position += 1
+
+    def _rank(self, terms, limit):
+        """Ids of the best matches of terms, best first."""
+        with self._lock:
+            self._ensure_built()
+            scores = None
+            for term in terms:
+                term_scores = defaultdict(float)
+                for token in self._expand(term):
+                    factor = 1.0 if token == term else self.PREFIX_PENALTY
+                    for product_id, weight in self._postings[token].items():
+                        term_scores[product_id] += weight * factor
+                if scores is None:
+                    scores = term_scores
+                else:
+                    scores = {pid: score + term_scores[pid] for pid, score in scores.items() if pid in term_scores}
+                if not scores:
+                    return []
+            return heapq.nlargest(limit, scores, key=lambda pid: (scores[pid], pid))
+
+    def search(self, query, limit=SEARCH_RESULT_LIMIT):
+        terms = tokenize(query)
+        if not terms:
+            return []
+        ranked = self._rank(terms, limit)
+        products = Product.objects.in_bulk(ranked)
+        return [products[pid] for pid in ranked if pid in products]
+
+    async def asearch(self, query, limit=SEARCH_RESULT_LIMIT):
+        terms = tokenize(query)
+        if not terms:
+            return []
+        if not self._built:
+            # The first build reads the whole catalog: keep it off the event loop
+            await sync_to_async(self._ensure_built)()
+        ranked = self._rank(terms, limit)
+        products = await Product.objects.ain_bulk(ranked)
+        return [products[pid] for pid in ranked if pid in products]
+
+    def index_product(self, product):
+        def apply():
+            with self._lock:
+                if self._built:
+                    self._remove(product.pk)
+                    self._add(product.pk, product.name, product.description)
+        # Only publish committed rows
+        transaction.on_commit(apply)
+
+    def index_products(self, products):
+        rows = [(product.pk, product.name, product.description) for product in products if product.pk is not None]
+
+        def apply():
+            with self._lock:
+                if self._built:
+                    for product_id, name, description in rows:
+                        self._remove(product_id)
+                        self._add(product_id, name, description)
+        transaction.on_commit(apply)
+
+    def remove_product(self, product_id):
+        def apply():
+            with self._lock:
+                if self._built:
+                    self._remove(product_id)
+        transaction.on_commit(apply)
+
+
+_postgres_backend = PostgresSearchBackend()
+_inverted_index_backend = InvertedIndexSearchBackend()
+
+
+def get_search_backend():
+    """Return the search backend matching the default database."""
+    if connection.vendor == 'postgresql':
+        return _postgres_backend
+    return _inverted_index_backend
+
+
+def ensure_search_index(sender, using='default', **kwargs):
+    """post_migrate hook creating the GIN index on PostgreSQL."""
+    if connections[using].vendor == 'postgresql':
+        _postgres_backend.ensure_index(using=using)
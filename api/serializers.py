@@ -1,34 +1,129 @@
 # serializers.py
 from rest_framework import serializers
-from .models import Category, Product, Order, OrderItem, Review
+from drf_yasg.utils import swagger_serializer_method
+from datetime import timedelta
+from django.db import models, transaction
+from django.utils import timezone
+from .authentication import get_cached_user, get_cached_users
+from .fieldsets import DynamicFieldsMixin, join_path
+from .models import Category, Product, ProductStats, Order, OrderItem, Review, StockReservation, ArchivedOrder, ArchivedOrderItem
+from .pagination import CATEGORY_PRODUCT_PREVIEW_SIZE
+from .stats import SUMMARY_FIELDS, review_summary
 
-class ProductSerializer(serializers.ModelSerializer):
+SALES_REPORT_DEFAULT_DAYS = 30
+SALES_REPORT_MAX_DAYS = 3660
+
+# Lines of one checkout: each is a conditional UPDATE inside the order's transaction
+CHECKOUT_MAX_LINES = 100
+
+class ImageVariantsField(serializers.Field):
+    """
+    Read-only representation of Product.image_variants: the original's
+    dimensions, then for each variant its dimensions and the absolute URL of
+    every format, e.g. {"thumbnail": {"width": 200, "height": 150, "webp": ..., "jpeg": ...}}.
+    Empty until the variants of the current image have been generated.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        storage = Product._meta.get_field('image').storage
+        request = self.context.get('request')
+        result = {}
+        for variant, entry in value.items():
+            result[variant] = {}
+            for key, item in entry.items():
+                if key in ('width', 'height'):
+                    result[variant][key] = item
+                else:
+                    url = storage.url(item)
+                    result[variant][key] = request.build_absolute_uri(url) if request is not None else url
+        return result
+
+
+class ProductSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     """
     Serializer for the Product model.
     Includes a nested CategorySerializer to display category details.
     """
+    image_variants = ImageVariantsField()  # Thumbnail / medium / large, WebP and JPEG
+
     class Meta:
         model = Product
-        fields = ['id', 'name', 'description', 'price', 'stock', 'image', 'date_time_added', 'updated_at']
+        fields = ['id', 'name', 'description', 'price', 'stock', 'image', 'image_variants', 'date_time_added', 'updated_at']
 
+    def update(self, instance, validated_data):
+        # Lock the row so no cart reserves while we check; save() then writes the current reserved back
+        with transaction.atomic():
+            instance.reserved = Product.objects.select_for_update().values_list('reserved', flat=True).get(pk=instance.pk)
+            if validated_data.get('stock', instance.stock) < instance.reserved:
+                raise serializers.ValidationError(
+                    {'stock': [f'Cannot be below the {instance.reserved} units held in carts.']}
+                )
+            return super().update(instance, validated_data)
 
-class CategorySerializer(serializers.ModelSerializer):
-    products = ProductSerializer(many=True, read_only=True)  # 🔹 Include products in category
+
+class ReviewSummarySerializer(serializers.ModelSerializer):
+    """
+    A product's review count, mean rating and 1-5 star histogram, read from
+    its maintained ProductStats row instead of aggregating its reviews.
+    """
+    class Meta:
+        model = ProductStats
+        fields = SUMMARY_FIELDS
+
+    def to_representation(self, instance):
+        return review_summary(super().to_representation(instance))
+
+
+class ProductDetailSerializer(ProductSerializer):
+    """
+    ProductSerializer plus the review summary, for product detail only:
+    lists and embedded products stay flat.
+    """
+    review_summary = ReviewSummarySerializer(source='stats', read_only=True)
+
+    class Meta(ProductSerializer.Meta):
+        fields = ProductSerializer.Meta.fields + ['review_summary']
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        if 'review_summary' in data and data['review_summary'] is None:
+            data['review_summary'] = review_summary(None)  # No stats row yet: no reviews
+        return data
+
+
+class CategorySerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    products = serializers.SerializerMethodField()  # 🔹 Bounded preview of the category's products
 
     """
     Serializer for the Category model.
-    Serializes the 'id', 'name', and 'description' fields.
+    Serializes the 'id', 'name', and 'description' fields, plus a preview of
+    at most CATEGORY_PRODUCT_PREVIEW_SIZE products. The complete list is
+    paginated under /categories/{id}/products/.
     """
     class Meta:
         model = Category
         fields = ['id', 'name', 'description', 'products']
 
+    @swagger_serializer_method(serializer_or_field=ProductSerializer(many=True))
+    def get_products(self, obj):
+        # Use the slice prefetched by CategoryViewSet when available
+        products = getattr(obj, 'preview_products', None)
+        if products is None:
+            products = obj.products.order_by('-date_time_added', '-id')[:CATEGORY_PRODUCT_PREVIEW_SIZE]
+        context = dict(self.context, field_path=join_path(self.field_path, 'products'))
+        return ProductSerializer(products, many=True, context=context).data
+
 
 
-class OrderItemSerializer(serializers.ModelSerializer):
+class OrderItemSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     """
     Serializer for the OrderItem model.
     Includes a nested ProductSerializer to display product details.
+    Like every serializer here, it honours ?fields= and ?expand= (see api/fieldsets.py).
     """
     product = ProductSerializer(read_only=True)
 
@@ -36,28 +131,192 @@ class OrderItemSerializer(serializers.ModelSerializer):
         model = OrderItem
         fields = ['order', 'product', 'quantity', 'price']
 
-class OrderSerializer(serializers.ModelSerializer):
+class CachedUsernameField(serializers.StringRelatedField):
+    """
+    The username of a related user, read from the user cache shared with
+    CachedJWTAuthentication. Only the foreign key column is loaded, so
+    listing orders or reviews needs no join with auth_user.
+    """
+
+    def use_pk_only_optimization(self):
+        return True
+
+    def prime(self, instances):
+        """Load the users of a whole page at once (see CachedUsersListSerializer)."""
+        attname = f'{self.source_attrs[-1]}_id'
+        pks = {getattr(instance, attname) for instance in instances} - self._usernames.keys()
+        if pks:
+            self._usernames.update((pk, str(user)) for pk, user in get_cached_users(pks).items())
+
+    @property
+    def _usernames(self):
+        return self.__dict__.setdefault('_usernames_memo', {})
+
+    def to_representation(self, value):
+        if value.pk not in self._usernames:
+            self._usernames[value.pk] = str(get_cached_user(value.pk))
+        return self._usernames[value.pk]
+
+
+class CachedUsersListSerializer(serializers.ListSerializer):
+    """List serializer priming the CachedUsernameFields of its rows with one batched lookup."""
+
+    def to_representation(self, data):
+        rows = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+        for field in self.child.fields.values():
+            if isinstance(field, CachedUsernameField):
+                field.prime(rows)
+        return super().to_representation(rows)
+
+
+class OrderSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     """
     Serializer for the Order model.
-    - Uses StringRelatedField for the user to return the username.
+    - Uses CachedUsernameField for the user to return the username.
     - Uses OrderItemSerializer as a nested serializer to display order items.
     """
-    user = serializers.StringRelatedField()
-    products = OrderItemSerializer(many=True)
+    user = CachedUsernameField()
+    products = OrderItemSerializer(source='orderitem_set', many=True)  # The order's items, not the bare M2M products
 
     class Meta:
         model = Order
         fields = ['id', 'user', 'products', 'total_price', 'status', 'order_date']
+        list_serializer_class = CachedUsersListSerializer
+
+class ArchivedOrderItemSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    """An archived order item, in the shape of OrderItemSerializer."""
+    product = ProductSerializer(read_only=True)
+
+    class Meta:
+        model = ArchivedOrderItem
+        fields = ['order', 'product', 'quantity', 'price']
+
+class ArchivedOrderSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    """An archived order (api/archive.py), in the shape of OrderSerializer."""
+    user = CachedUsernameField()
+    products = ArchivedOrderItemSerializer(source='items', many=True, read_only=True)
+
+    class Meta:
+        model = ArchivedOrder
+        fields = ['id', 'user', 'products', 'total_price', 'status', 'order_date']
+        list_serializer_class = CachedUsersListSerializer
 
-class ReviewSerializer(serializers.ModelSerializer):
+class ReviewSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     """
     Serializer for the Review model.
-    - Uses StringRelatedField for the user to return the username.
+    - Uses CachedUsernameField for the user to return the username.
     - Uses ProductSerializer as a nested serializer to display product details.
+    - Takes the reviewed product as product_id; the author is the current user.
     """
-    user = serializers.StringRelatedField()
+    user = CachedUsernameField()
     product = ProductSerializer(read_only=True)
+    product_id = serializers.PrimaryKeyRelatedField(source='product', queryset=Product.objects.all(), write_only=True)
 
     class Meta:
         model = Review
-        fields = ['id', 'user', 'product', 'rating', 'comment', 'created_at']
+        fields = ['id', 'user', 'product', 'product_id', 'rating', 'comment', 'created_at']
+        list_serializer_class = CachedUsersListSerializer
+
+
+class ProductReviewSerializer(ReviewSerializer):
+    """A review in its product's feed, without the product it belongs to."""
+
+    class Meta(ReviewSerializer.Meta):
+        fields = ['id', 'user', 'rating', 'comment', 'created_at']
+
+
+class ReviewFeedQuerySerializer(serializers.Serializer):
+    """Filters of a product's review feed."""
+    rating = serializers.IntegerField(min_value=1, max_value=5, required=False)
+
+
+class CheckoutItemSerializer(serializers.Serializer):
+    """
+    A single cart line: which product and how many units.
+    """
+    product_id = serializers.IntegerField(min_value=1)
+    quantity = serializers.IntegerField(min_value=1, max_value=1000)
+
+
+class CheckoutSerializer(serializers.Serializer):
+    """
+    Serializer for the checkout request.
+    Only products and quantities are accepted; prices and the total are
+    computed on the server.
+    """
+    items = CheckoutItemSerializer(many=True, allow_empty=False, max_length=CHECKOUT_MAX_LINES)
+
+
+class ReservationSerializer(serializers.ModelSerializer):
+    """
+    A cart hold: units of a product kept for the current user until expires_at.
+    """
+    class Meta:
+        model = StockReservation
+        fields = ['product', 'quantity', 'expires_at']
+
+
+class AvailabilityQuerySerializer(serializers.Serializer):
+    """Products whose availability is asked for."""
+    id = serializers.ListField(child=serializers.IntegerField(min_value=1), min_length=1, max_length=100)  # Repeatable
+
+
+class AvailabilitySerializer(serializers.Serializer):
+    """Units in stock, held by carts, and still available to order."""
+    id = serializers.IntegerField()
+    stock = serializers.IntegerField()
+    reserved = serializers.IntegerField()
+    available = serializers.IntegerField()
+
+
+class SalesReportQuerySerializer(serializers.Serializer):
+    """
+    Query parameters shared by the sales reports.
+    The date range defaults to the last SALES_REPORT_DEFAULT_DAYS days; both ends are included.
+    """
+    group = serializers.ChoiceField(choices=['product', 'category'], default='product')
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+    status = serializers.MultipleChoiceField(choices=Order.STATUS_CHOICES, required=False)  # Repeatable
+
+    def validate(self, attrs):
+        attrs.setdefault('end', timezone.localdate())
+        attrs.setdefault('start', attrs['end'] - timedelta(days=SALES_REPORT_DEFAULT_DAYS - 1))
+        if attrs['start'] > attrs['end']:
+            raise serializers.ValidationError({'start': ['Must not be after end.']})
+        if (attrs['end'] - attrs['start']).days >= SALES_REPORT_MAX_DAYS:
+            raise serializers.ValidationError({'start': [f'The range is limited to {SALES_REPORT_MAX_DAYS} days.']})
+        return attrs
+
+
+class SalesSeriesQuerySerializer(SalesReportQuerySerializer):
+    """Time series report: optionally restricted to some products or categories."""
+    id = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False)  # Repeatable
+    interval = serializers.ChoiceField(choices=['day', 'week', 'month'], default='day')
+
+
+class TopSalesQuerySerializer(SalesReportQuerySerializer):
+    """Top-N report: the metric to rank by and how many rows to return."""
+    metric = serializers.ChoiceField(choices=['revenue', 'units', 'line_count'], default='revenue')
+    limit = serializers.IntegerField(min_value=1, max_value=100, default=10)
+
+
+class SalesFiguresSerializer(serializers.Serializer):
+    """
+    Aggregated sales figures. line_count counts order lines: an order with
+    three lines of a category counts three times in its report.
+    """
+    revenue = serializers.DecimalField(max_digits=14, decimal_places=2)
+    units = serializers.IntegerField()
+    line_count = serializers.IntegerField()
+
+
+class SalesPeriodSerializer(SalesFiguresSerializer):
+    """One point of a sales time series; period is the first day of the day, week or month."""
+    period = serializers.DateField()
+
+
+class TopSalesSerializer(SalesFiguresSerializer):
+    """One product or category of a top-N sales report."""
+    id = serializers.IntegerField()
+    name = serializers.CharField()
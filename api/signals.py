@@ -1,18 +1,128 @@
 # signals.py
-from django.db.models.signals import post_save, post_delete
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_save, post_delete, pre_delete, pre_save
 from django.dispatch import receiver
-from django.core.cache import cache
-from .models import Product
-from .cach_keys import POPULAR_PRODUCTS_KEY_CACHE_KEY
+from .authentication import forget_user
+from .models import Category, Product, ProductStats, Order, OrderItem, Review
+from .invalidation import mark_dirty, object_tag, tags_for_instance
+from .reservations import release
+from .images import delete_variants, schedule_variants
+from .search import get_search_backend
+from .rollups import order_item_sales_changed, order_status_changed, product_categories_changed
+from .stats import order_item_changed, review_changed
+
+CACHED_MODELS = (Category, Product, Order, OrderItem, Review)
+
+def invalidate_cached_responses(sender, instance, using, **kwargs):
+    """ Queue the cache tags of a saved or deleted object for invalidation on commit """
+    mark_dirty(tags_for_instance(instance), using=using)
+
+for model in CACHED_MODELS:
+    post_save.connect(invalidate_cached_responses, sender=model, dispatch_uid=f'invalidate_save_{model._meta.model_name}')
+    post_delete.connect(invalidate_cached_responses, sender=model, dispatch_uid=f'invalidate_delete_{model._meta.model_name}')
+
+@receiver(pre_save, sender=Product)
+def remember_product_category(sender, instance, **kwargs):
+    """ Capture the stored category so the category it left is invalidated too, and notice a new image """
+    instance._old_category_id = None
+    instance._image_changed = bool(instance.image)
+    if not instance._state.adding and instance.pk is not None:
+        old = Product.objects.filter(pk=instance.pk).values_list('category_id', 'image', 'image_variants').first()
+        if old is None:
+            return
+        old_category_id, old_image, old_variants = old
+        if old_category_id != instance.category_id:
+            instance._old_category_id = old_category_id
+        instance._image_changed = (old_image or '') != (instance.image.name or '')
+        if instance._image_changed:
+            # The variants belong to the previous image: serve the original until new ones are ready
+            instance.image_variants = {}
+            delete_variants(old_variants)
 
 @receiver(post_save, sender=Product)
-def clear_cache_on_product_save(sender, instance, created, **kwargs):
-    """ Clear cache when a product is added or updated """
-    cache.delete(POPULAR_PRODUCTS_KEY_CACHE_KEY)  # Use the cache key defined in your viewset
-    print("Cache cleared due to product save")
+def update_product_indexes_on_save(sender, instance, created, **kwargs):
+    """ Keep the search index and popularity counters in step with a product """
+    get_search_backend().index_product(instance)
+    if instance.image and getattr(instance, '_image_changed', False):
+        schedule_variants(instance)
+    if created:
+        ProductStats.objects.get_or_create(product=instance)  # Every product is ranked, even before its first sale
+    elif getattr(instance, '_old_category_id', None) is not None:
+        product_categories_changed({instance.pk: (instance._old_category_id, instance.category_id)})
 
 @receiver(post_delete, sender=Product)
-def clear_cache_on_product_delete(sender, instance, **kwargs):
-    """ Clear cache when a product is deleted """
-    cache.delete(POPULAR_PRODUCTS_KEY_CACHE_KEY)  # Use the cache key defined in your viewset
-    print("Cache cleared due to product delete")
+def update_product_indexes_on_delete(sender, instance, **kwargs):
+    """ Drop a deleted product from the search index, and its image variants from storage """
+    get_search_backend().remove_product(instance.pk)
+    delete_variants(instance.image_variants)
+
+@receiver(pre_save, sender=Order)
+def remember_order_status(sender, instance, **kwargs):
+    """ Capture the stored status so a status change can move the order's sales rollups """
+    instance._old_status = None
+    if not instance._state.adding and instance.pk is not None:
+        instance._old_status = Order.objects.filter(pk=instance.pk).values_list('status', flat=True).first()
+
+@receiver(post_save, sender=Order)
+def update_rollups_on_order_save(sender, instance, created, **kwargs):
+    """ Move the order's sales to its new status """
+    old_status = getattr(instance, '_old_status', None)
+    if not created and old_status is not None:
+        order_status_changed(instance.pk, instance.order_date, old_status, instance.status)
+
+@receiver(pre_save, sender=OrderItem)
+def remember_order_item(sender, instance, **kwargs):
+    """ Capture the stored product/quantity so an update can move the right amount """
+    instance._stats_old = instance._sales_old = None
+    if not instance._state.adding and instance.pk is not None:
+        old = OrderItem.objects.filter(pk=instance.pk).values_list('product_id', 'quantity', 'order_id', 'price').first()
+        if old is not None:
+            instance._stats_old = old[:2]
+            instance._sales_old = (old[2], old[0], old[1], old[3])
+            if old[2] != instance.order_id:
+                mark_dirty({object_tag(Order, old[2])}, using=kwargs.get('using'))
+
+@receiver(post_save, sender=OrderItem)
+def update_stats_on_order_item_save(sender, instance, created, **kwargs):
+    """ Add the order item to its product's sales counters and the daily sales rollups """
+    old = None if created else getattr(instance, '_stats_old', None)
+    order_item_changed(old, (instance.product_id, instance.quantity))
+    old = None if created else getattr(instance, '_sales_old', None)
+    order_item_sales_changed(old, (instance.order_id, instance.product_id, instance.quantity, instance.price))
+
+@receiver(post_delete, sender=OrderItem)
+def update_stats_on_order_item_delete(sender, instance, **kwargs):
+    """ Remove the order item from its product's sales counters and the daily sales rollups """
+    order_item_changed((instance.product_id, instance.quantity), None)
+    order_item_sales_changed((instance.order_id, instance.product_id, instance.quantity, instance.price), None)
+
+@receiver(pre_save, sender=Review)
+def remember_review(sender, instance, **kwargs):
+    """ Capture the stored product/rating so an update can move the right amount """
+    instance._stats_old = None
+    if not instance._state.adding and instance.pk is not None:
+        instance._stats_old = Review.objects.filter(pk=instance.pk).values_list('product_id', 'rating').first()
+
+@receiver(post_save, sender=Review)
+def update_stats_on_review_save(sender, instance, created, **kwargs):
+    """ Add the review to its product's rating counters """
+    old = None if created else getattr(instance, '_stats_old', None)
+    review_changed(old, (instance.product_id, instance.rating))
+
+@receiver(post_delete, sender=Review)
+def update_stats_on_review_delete(sender, instance, **kwargs):
+    """ Remove the review from its product's rating counters """
+    review_changed((instance.product_id, instance.rating), None)
+
+def forget_cached_user(sender, instance, **kwargs):
+    """ Drop a saved or deleted user from the authentication cache """
+    forget_user(instance.pk)
+
+post_save.connect(forget_cached_user, sender=get_user_model(), dispatch_uid='forget_cached_user_save')
+post_delete.connect(forget_cached_user, sender=get_user_model(), dispatch_uid='forget_cached_user_delete')
+
+def release_user_reservations(sender, instance, **kwargs):
+    """ Give back the units held by a user's cart before the cascade deletes the holds """
+    release(instance)
+
+pre_delete.connect(release_user_reservations, sender=get_user_model(), dispatch_uid='release_user_reservations')
@@ -0,0 +1,141 @@
+# stats.py
+from django.db import transaction
+from django.db.models import Case, Count, F, FloatField, Sum, Value, When
+from django.db.models.functions import Cast
+
+from .models import ArchivedOrderItem, OrderItem, Product, ProductStats, Review
+
+STARS = range(1, 6)
+STAR_FIELDS = [f'rating_{stars}' for stars in STARS]
+STATS_FIELDS = ['units_sold', 'order_count', 'rating_sum', 'rating_count', 'rating_avg', *STAR_FIELDS]
+
+# Columns of a product's review summary
+SUMMARY_FIELDS = ['rating_count', 'rating_avg', *STAR_FIELDS]
+
+
+def _rating_avg():
+    """Expression recomputing rating_avg from the stored sum and count."""
+    return Case(
+        When(rating_count=0, then=Value(0.0)),
+        default=Cast(F('rating_sum'), FloatField()) / F('rating_count'),
+        output_field=FloatField(),
+    )
+
+
+def apply_stats_delta(product_id, **deltas):
+    """
+    Atomically add deltas (e.g. units_sold=2, order_count=1) to a product's
+    counters with a single UPDATE ... SET x = x + n.
+
+    The row is created on the first positive change. Negative changes on a
+    missing row are ignored: they come from cascading deletes of the product.
+    """
+    deltas = {field: delta for field, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    changes = {field: F(field) + delta for field, delta in deltas.items()}
+    rating_changed = 'rating_sum' in deltas or 'rating_count' in deltas
+
+    with transaction.atomic():
+        stats = ProductStats.objects.filter(product_id=product_id)
+        if not stats.update(**changes):
+            if any(delta < 0 for delta in deltas.values()):
+                return
+            ProductStats.objects.get_or_create(product_id=product_id)
+            stats.update(**changes)
+        if rating_changed:
+            stats.update(rating_avg=_rating_avg())
+
+
+def order_item_changed(old, new):
+    """
+    Move a single OrderItem's contribution between products.
+    old and new are (product_id, quantity) tuples, or None when the row is
+    created or deleted.
+    """
+    if old == new:
+        return
+    if old is not None:
+        apply_stats_delta(old[0], units_sold=-old[1], order_count=-1)
+    if new is not None:
+        apply_stats_delta(new[0], units_sold=new[1], order_count=1)
+
+
+def _star_delta(rating, sign):
+    """The histogram change of adding (sign=1) or removing (sign=-1) a review; ratings outside 1-5 have no bucket."""
+    return {f'rating_{rating}': sign} if rating in STARS else {}
+
+
+def review_changed(old, new):
+    """Same as order_item_changed for (product_id, rating) review tuples."""
+    if old == new:
+        return
+    if old is not None:
+        apply_stats_delta(old[0], rating_sum=-old[1], rating_count=-1, **_star_delta(old[1], -1))
+    if new is not None:
+        apply_stats_delta(new[0], rating_sum=new[1], rating_count=1, **_star_delta(new[1], 1))
+
+
+def review_summary(values):
+    """
+    The review summary of a product from the SUMMARY_FIELDS of its counters
+    (a dict, or None when it has none): count, mean and star histogram.
+    """
+    values = values or {}
+    return {
+        'count': values.get('rating_count', 0),
+        'average': round(values.get('rating_avg', 0), 2),
+        'histogram': {str(stars): values.get(f'rating_{stars}', 0) for stars in STARS},
+    }
+
+
+def compute_product_stats(start_id, end_id):
+    """
+    Recompute the counters for products with start_id <= id < end_id from
+    the OrderItem (hot and archived) and Review tables, using grouped aggregates.
+    """
+    stats = {
+        product_id: ProductStats(product_id=product_id)
+        for product_id in Product.objects.filter(id__gte=start_id, id__lt=end_id).values_list('id', flat=True)
+    }
+    for model in (OrderItem, ArchivedOrderItem):
+        sales = (
+            model.objects.filter(product_id__gte=start_id, product_id__lt=end_id)
+            .values('product_id')
+            .annotate(units=Sum('quantity'), orders=Count('id'))
+        )
+        for row in sales:
+            if row['product_id'] in stats:
+                stats[row['product_id']].units_sold += row['units']
+                stats[row['product_id']].order_count += row['orders']
+    ratings = (
+        Review.objects.filter(product_id__gte=start_id, product_id__lt=end_id)
+        .values('product_id')
+        .annotate(total=Sum('rating'), reviews=Count('id'))
+    )
+    for row in ratings:
+        if row['product_id'] in stats:
+            item = stats[row['product_id']]
+            item.rating_sum = row['total']
+            item.rating_count = row['reviews']
+            item.rating_avg = row['total'] / row['reviews']
+    stars = (
+        Review.objects.filter(product_id__gte=start_id, product_id__lt=end_id, rating__in=STARS)
+        .values('product_id', 'rating')
+        .annotate(reviews=Count('id'))
+    )
+    for row in stars:
+        if row['product_id'] in stats:
+            setattr(stats[row['product_id']], f"rating_{row['rating']}", row['reviews'])
+    return list(stats.values())
+
+
+def save_product_stats(stats, batch_size=1000):
+    """Upsert recomputed counters."""
+    ProductStats.objects.bulk_create(
+        stats,
+        batch_size=batch_size,
+        update_conflicts=True,
+        unique_fields=['product'],
+        update_fields=STATS_FIELDS,
+    )
@@ -0,0 +1,168 @@
+# synthetic.py
+"""
+Reproducible synthetic datasets for benchmarks and load tests.
+
+The same seed always produces the same catalog and history on an empty
+database. Rows are written with bulk_create, a batch per transaction, so
+large datasets load in minutes rather than hours; bulk inserts skip the
+model signals, so the generate_synthetic_data command rebuilds the derived
+tables (counters, rollups, search index) afterwards.
+
+Popularity follows a Zipf-like law, as in real shops: a few products make
+most of the orders and reviews, which is what caches and indexes see in
+production.
+"""
+import random
+from datetime import timedelta
+from decimal import Decimal
+from itertools import accumulate
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Category, Order, OrderItem, Product, Review
+
+# Named dataset sizes; any count can still be overridden on the command line
+SCALES = {
+    'tiny': {'categories': 5, 'products': 60, 'users': 30, 'orders': 120, 'reviews': 150},
+    'small': {'categories': 20, 'products': 2000, 'users': 1000, 'orders': 10000, 'reviews': 10000},
+    'medium': {'categories': 100, 'products': 20000, 'users': 20000, 'orders': 200000, 'reviews': 100000},
+    'large': {'categories': 500, 'products': 200000, 'users': 200000, 'orders': 2000000, 'reviews': 1000000},
+}
+
+STATUS_WEIGHTS = {'Delivered': 70, 'Shipped': 15, 'Pending': 10, 'Cancelled': 5}
+
+WORDS = [
+    'smart', 'wireless', 'organic', 'compact', 'premium', 'portable', 'classic', 'ultra', 'eco', 'pro',
+    'speaker', 'lamp', 'jacket', 'kettle', 'backpack', 'monitor', 'blender', 'headphones', 'sneakers', 'tent',
+]
+
+# Orders are spread over this many days before now
+HISTORY_DAYS = 365
+
+
+def _batches(count, batch_size):
+    for start in range(0, count, batch_size):
+        yield start, min(start + batch_size, count)
+
+
+def _text(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words))
+
+
+def _moment(rng, now):
+    return now - timedelta(seconds=rng.randrange(HISTORY_DAYS * 86400))
+
+
+def generate_dataset(categories, products, users, orders, reviews, seed=0, max_items=5, batch_size=5000, log=None):
+    """
+    Insert the given numbers of categories, products, users, orders (with
+    1 to max_items OrderItems each) and reviews. Returns the number of rows
+    written per model. log, when given, is called with a progress line per model.
+    """
+    rng = random.Random(seed)
+    now = timezone.now()
+    log = log or (lambda message: None)
+    counts = {}
+
+    offset = Category.objects.count()
+    category_ids = [
+        category.pk for category in Category.objects.bulk_create(
+            [Category(name=f'Synthetic {offset + i}', description=_text(rng, 8)) for i in range(categories)],
+            batch_size=batch_size,
+        )
+    ]
+    counts['categories'] = len(category_ids)
+    log(f"{len(category_ids)} categories")
+
+    product_ids, prices = [], []
+    for start, end in _batches(products, batch_size):
+        rows = [
+            Product(
+                name=f'{_text(rng, 2).title()} {start + i}',
+                description=_text(rng, rng.randint(10, 60)),
+                price=Decimal(rng.randint(199, 99999)) / 100,
+                stock=rng.randint(100, 10000),
+                category_id=rng.choice(category_ids),
+            )
+            for i in range(end - start)
+        ]
+        with transaction.atomic():
+            Product.objects.bulk_create(rows, batch_size=batch_size)
+        product_ids.extend(product.pk for product in rows)
+        prices.extend(product.price for product in rows)
+    counts['products'] = len(product_ids)
+    log(f"{len(product_ids)} products")
+
+    offset = User.objects.count()
+    user_ids = []
+    for start, end in _batches(users, batch_size):
+        rows = [User(username=f'synthetic{offset + i}', password='!') for i in range(start, end)]  # Unusable password
+        with transaction.atomic():
+            User.objects.bulk_create(rows, batch_size=batch_size)
+        user_ids.extend(user.pk for user in rows)
+    counts['users'] = len(user_ids)
+    log(f"{len(user_ids)} users")
+
+    # Zipf-like popularity: the product of rank r is picked with weight 1 / r
+    ranking = product_ids[:]
+    rng.shuffle(ranking)
+    weights = list(accumulate(1 / rank for rank in range(1, len(ranking) + 1)))
+    index_of = {product_id: index for index, product_id in enumerate(product_ids)}
+    statuses, status_weights = list(STATUS_WEIGHTS), list(STATUS_WEIGHTS.values())
+
+    counts['orders'] = counts['order_items'] = 0
+    for start, end in _batches(orders if product_ids and user_ids else 0, batch_size):
+        new_orders, lines = [], []
+        for _ in range(end - start):
+            basket = set(rng.choices(ranking, cum_weights=weights, k=rng.randint(1, max_items)))
+            items = [(product_id, rng.randint(1, 3)) for product_id in sorted(basket)]
+            total = sum(prices[index_of[product_id]] * quantity for product_id, quantity in items)
+            new_orders.append(Order(
+                user_id=rng.choice(user_ids), total_price=total,
+                status=rng.choices(statuses, weights=status_weights)[0], order_date=_moment(rng, now),
+            ))
+            lines.append(items)
+        with transaction.atomic():
+            dates = [order.order_date for order in new_orders]
+            Order.objects.bulk_create(new_orders, batch_size=batch_size)
+            # order_date is auto_now_add: put the generated dates back
+            for order, order_date in zip(new_orders, dates):
+                order.order_date = order_date
+            Order.objects.bulk_update(new_orders, ['order_date'], batch_size=batch_size)
+            order_items = OrderItem.objects.bulk_create(
+                [
+                    OrderItem(order_id=order.pk, product_id=product_id, quantity=quantity,
+                              price=prices[index_of[product_id]])
+                    for order, items in zip(new_orders, lines)
+                    for product_id, quantity in items
+                ],
+                batch_size=batch_size,
+            )
+        counts['orders'] += len(new_orders)
+        counts['order_items'] += len(order_items)
+    log(f"{counts['orders']} orders, {counts['order_items']} order items")
+
+    counts['reviews'] = 0
+    reviewed = set()
+    for start, end in _batches(reviews if product_ids and user_ids else 0, batch_size):
+        new_reviews = []
+        for _ in range(end - start):
+            key = (rng.choice(user_ids), rng.choices(ranking, cum_weights=weights)[0])
+            if key in reviewed:
+                continue  # One review per user and product
+            reviewed.add(key)
+            new_reviews.append(Review(
+                user_id=key[0], product_id=key[1], rating=rng.choices(range(1, 6), weights=[5, 5, 10, 30, 50])[0],
+                comment=_text(rng, rng.randint(0, 30)), created_at=_moment(rng, now),
+            ))
+        with transaction.atomic():
+            dates = [review.created_at for review in new_reviews]
+            Review.objects.bulk_create(new_reviews, batch_size=batch_size)
+            for review, created_at in zip(new_reviews, dates):
+                review.created_at = created_at
+            Review.objects.bulk_update(new_reviews, ['created_at'], batch_size=batch_size)
+        counts['reviews'] += len(new_reviews)
+    log(f"{counts['reviews']} reviews")
+    return counts
@@ -1,13 +1,55 @@
-from rest_framework.test import TestCase
-from rest_framework import status
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from base64 import b64encode
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.http import HttpResponse
+from django.test import AsyncRequestFactory, RequestFactory, SimpleTestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+from rest_framework.test import APITestCase as TestCase
+from rest_framework.throttling import SimpleRateThrottle
 from rest_framework_simplejwt.tokens import RefreshToken
-from .models import Category, Product, Order, Review
+
+from . import admin as api_admin
+from . import async_views, benchmarks, caching, metrics, recommendations, schema
+from .authentication import get_cached_user, user_cache_key
+from .checkout import place_order
+from .fast_serializers import get_values_serializer
+from .models import (
+    ArchivedOrder, ArchivedOrderItem, Category, CategoryDailySales, Order, OrderItem, Product, ProductDailySales,
+    ProductNeighbor, ProductStats, Review, StockReservation,
+)
+from .renderers import FastJSONRenderer
+from .reservations import release_expired
+from .routers import PRIMARY_COOKIE, PrimaryPinningMiddleware, PrimaryReplicaRouter, use_primary
+from .search import get_search_backend
+from .serializers import CHECKOUT_MAX_LINES, CategorySerializer, ProductSerializer
+from .throttling import AnonRateThrottle
 
 class APITestCases(TestCase):
     
     def setUp(self):
         """Set up test user and initial data."""
+        cache.clear()
         self.user = User.objects.create_user(username='testuser', password='testpass')
         self.category = Category.objects.create(name='Electronics')
         self.product = Product.objects.create(name='Laptop', category=self.category, price=1000.00, stock=10)
@@ -21,37 +63,1353 @@ class APITestCases(TestCase):
     
     def test_get_categories(self):
         """Test retrieving category list."""
-        response = self.client.get('/categories/')
+        response = self.client.get('/api/categories/')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
     
     def test_get_products(self):
         """Test retrieving product list."""
-        response = self.client.get('/products/')
+        response = self.client.get('/api/products/')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
     
     def test_create_order(self):
-        """Test creating an order."""
+        """Test creating an order through checkout, priced on the server."""
         data = {
-            "user": self.user.id,
-            "total_price": 500.00,
-            "status": "pending"
+            "items": [{"product_id": self.product.id, "quantity": 2}]
         }
-        response = self.client.post('/orders/', data, format='json')
+        response = self.client.post('/api/orders/checkout/', data, format='json')
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual((response.data['user'], response.data['status']), ('testuser', 'Pending'))
+        self.assertEqual(response.data['total_price'], '2000.00')
     
     def test_create_review(self):
-        """Test creating a product review."""
+        """Test creating a product review as the current user."""
         data = {
-            "user": self.user.id,
-            "product": self.product.id,
+            "product_id": self.product.id,
             "rating": 4,
             "comment": "Good quality!"
         }
-        response = self.client.post('/reviews/', data, format='json')
+        response = self.client.post('/api/reviews/', data, format='json')
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual((response.data['user'], response.data['product']['id']), ('testuser', self.product.id))
     
     def test_invalid_token_access(self):
-        """Test accessing an endpoint without authentication."""
+        """Test that a bad token and anonymous writes are refused."""
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer not-a-token')
+        response = self.client.get('/api/orders/')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
         self.client.credentials()  # Remove auth headers
-        response = self.client.get('/orders/')
+        response = self.client.post('/api/reviews/', {"product_id": self.product.id, "rating": 4}, format='json')
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class PaginationTests(TestCase):
+
+    def setUp(self):
+        """Create enough products to span several pages."""
+        cache.clear()
+        self.category = Category.objects.create(name='Books')
+        self.products = [
+            Product.objects.create(name=f'Book {i}', description='', category=self.category, price=10, stock=1)
+            for i in range(7)
+        ]
+
+    def collect(self, url):
+        """Follow next links until the last page and return the ids seen."""
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            ids.extend(item['id'] for item in response.data['results'])
+            url = response.data['next']
+        return ids
+
+    def test_product_pages_cover_catalog_once(self):
+        """Walking the cursor returns every product once, newest first, even across timestamp ties."""
+        Product.objects.filter(id__in=[p.id for p in self.products[1:5]]).update(
+            date_time_added=self.products[0].date_time_added
+        )
+        ids = self.collect('/api/products/?page_size=3')
+        self.assertEqual(ids, list(Product.objects.order_by('-date_time_added', '-id').values_list('id', flat=True)))
+        self.assertEqual(len(ids), 7)
+
+    def test_previous_link_returns_prior_page(self):
+        """The previous link of the second page yields the first page again."""
+        first = self.client.get('/api/products/?page_size=3').data
+        second = self.client.get(first['next']).data
+        back = self.client.get(second['previous']).data
+        self.assertEqual([p['id'] for p in back['results']], [p['id'] for p in first['results']])
+
+    def test_invalid_cursor(self):
+        """A garbage cursor is rejected with 404."""
+        response = self.client.get('/api/products/?cursor=garbage')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_tampered_cursor_values(self):
+        """A well-formed cursor holding values its ordering fields can't take is a 404, not a server error."""
+        for position in (['not-a-date', 'x'], [{}, 1], [None, 1], ['2024-01-01T00:00:00Z', [1]]):
+            cursor = b64encode(json.dumps({'p': position}).encode()).decode()
+            response = self.client.get('/api/products/', {'cursor': cursor})
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND, position)
+        cursor = b64encode(json.dumps({'p': ['x']}).encode()).decode()
+        self.assertEqual(self.client.get('/api/categories/', {'cursor': cursor}).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_category_embeds_bounded_preview(self):
+        """Category listings embed a capped slice and paginate the rest."""
+        response = self.client.get('/api/categories/')
+        category = response.data['results'][0]
+        self.assertEqual(len(category['products']), 5)
+        ids = self.collect(f'/api/categories/{self.category.id}/products/?page_size=4')
+        self.assertEqual(len(ids), 7)
+
+    def test_category_products_of_non_numeric_id(self):
+        """A category id that is not a number is a 404, not a server error."""
+        response = self.client.get('/api/categories/abc/products/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class SearchTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        get_search_backend().reset()
+        self.category = Category.objects.create(name='Electronics')
+        self.laptop = Product.objects.create(
+            name='Gaming Laptop', description='Fast laptop with a backlit keyboard', category=self.category, price=1500, stock=3
+        )
+        self.keyboard = Product.objects.create(
+            name='Mechanical Keyboard', description='Works with any laptop', category=self.category, price=90, stock=10
+        )
+
+    def search(self, query):
+        response = self.client.get('/api/products/search/', {'query': query})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [item['id'] for item in response.data]
+
+    def test_name_matches_rank_first(self):
+        """A match in the name outranks a match in the description."""
+        self.assertEqual(self.search('laptop'), [self.laptop.id, self.keyboard.id])
+        self.assertEqual(self.search('keyboard'), [self.keyboard.id, self.laptop.id])
+
+    def test_prefix_and_all_terms(self):
+        """Terms match as prefixes and all of them must match."""
+        self.assertEqual(self.search('mech lap'), [self.keyboard.id])
+        self.assertEqual(self.search('tablet'), [])
+
+    def test_index_follows_writes(self):
+        """Committed saves and deletes are reflected in the index."""
+        self.search('laptop')  # Build the index
+        with self.captureOnCommitCallbacks(execute=True):
+            self.laptop.name = 'Ultrabook'
+            self.laptop.description = 'Thin and light'
+            self.laptop.save()
+        self.assertEqual(self.search('ultra'), [self.laptop.id])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.keyboard.delete()
+        self.assertEqual(self.search('laptop'), [])
+
+
+class ProductStatsTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='buyer', password='testpass')
+        self.category = Category.objects.create(name='Kitchen')
+        self.kettle = Product.objects.create(name='Kettle', description='', category=self.category, price=30, stock=50)
+        self.toaster = Product.objects.create(name='Toaster', description='', category=self.category, price=40, stock=50)
+        self.order = Order.objects.create(user=self.user, total_price=0)
+
+    def test_counters_follow_order_items_and_reviews(self):
+        """Creating, changing and deleting rows moves the counters."""
+        item = OrderItem.objects.create(order=self.order, product=self.kettle, quantity=2, price=30)
+        Review.objects.create(user=self.user, product=self.kettle, rating=4)
+        review = Review.objects.create(user=self.user, product=self.kettle, rating=1)
+        stats = ProductStats.objects.get(product=self.kettle)
+        self.assertEqual((stats.units_sold, stats.order_count), (2, 1))
+        self.assertEqual((stats.rating_sum, stats.rating_count, stats.rating_avg), (5, 2, 2.5))
+
+        item.product = self.toaster
+        item.quantity = 3
+        item.save()
+        review.delete()
+        kettle, toaster = ProductStats.objects.get(product=self.kettle), ProductStats.objects.get(product=self.toaster)
+        self.assertEqual((kettle.units_sold, kettle.order_count, kettle.rating_avg), (0, 0, 4.0))
+        self.assertEqual((toaster.units_sold, toaster.order_count), (3, 1))
+
+    def test_popular_reads_counters(self):
+        """The popular endpoint ranks by maintained order count."""
+        OrderItem.objects.create(order=self.order, product=self.toaster, quantity=1, price=40)
+        response = self.client.get('/api/products/popular/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([p['id'] for p in response.data], [self.toaster.id, self.kettle.id])
+
+    def test_rebuild_command_repairs_drift(self):
+        """The management command recomputes counters from scratch."""
+        OrderItem.objects.create(order=self.order, product=self.kettle, quantity=5, price=30)
+        ProductStats.objects.filter(product=self.kettle).update(units_sold=99, order_count=7)
+        ProductStats.objects.filter(product=self.toaster).delete()
+        call_command('rebuild_product_stats', stdout=StringIO())
+        stats = ProductStats.objects.get(product=self.kettle)
+        self.assertEqual((stats.units_sold, stats.order_count), (5, 1))
+        self.assertTrue(ProductStats.objects.filter(product=self.toaster).exists())
+
+
+class CachingTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_miss_computes_once_and_caches(self):
+        """A miss computes the value and later calls are served from cache."""
+        calls = []
+        compute = lambda: calls.append(1) or 'value'
+        self.assertEqual(caching.get_or_refresh('k', compute, timeout=60), 'value')
+        self.assertEqual(caching.get_or_refresh('k', compute, timeout=60), 'value')
+        self.assertEqual(len(calls), 1)
+
+    def test_miss_waits_for_lock_holder(self):
+        """Without the lock, a miss waits for the holder instead of recomputing."""
+        token = caching._acquire('k')
+        threading.Timer(0.1, lambda: caching._recompute('k', lambda: 'theirs', 60, 60, token)).start()
+        self.assertEqual(caching.get_or_refresh('k', lambda: 'mine', timeout=60), 'theirs')
+
+    def test_stale_value_served_while_refreshing(self):
+        """A stale value is returned at once and refreshed in the background."""
+        cache.set('k', {'value': 'old', 'fresh_until': time.time() - 1}, 60)
+        self.assertEqual(caching.get_or_refresh('k', lambda: 'new', timeout=60), 'old')
+        deadline = time.monotonic() + 2
+        while cache.get('k')['value'] != 'new' and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(cache.get('k')['value'], 'new')
+        self.assertIsNone(cache.get('k:lock'))
+
+    def test_jittered_timeout_bounds(self):
+        """Jitter stays within the configured fraction of the timeout."""
+        values = {caching.jittered(1000) for _ in range(50)}
+        self.assertTrue(all(900 <= v <= 1100 for v in values))
+        self.assertGreater(len(values), 1)
+
+
+class InvalidationTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name='Garden')
+        self.product = Product.objects.create(name='Rake', description='', category=self.category, price=15, stock=4)
+
+    def test_detail_cached_until_commit(self):
+        """A cached detail response is replaced once the write commits."""
+        url = f'/api/products/{self.product.id}/'
+        self.assertEqual(self.client.get(url).data['name'], 'Rake')
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.filter(pk=self.product.pk).update(name='Shovel')  # No signal: cache keeps serving
+            self.assertEqual(self.client.get(url).data['name'], 'Rake')
+            self.product.refresh_from_db()
+            self.product.save()
+            self.assertEqual(self.client.get(url).data['name'], 'Rake')  # Not committed yet
+        self.assertEqual(self.client.get(url).data['name'], 'Shovel')
+
+    def test_hosts_do_not_share_cached_responses(self):
+        """The links of a cached page point at the host it is requested from."""
+        for i in range(3):
+            Product.objects.create(name=f'Pot {i}', description='', category=self.category, price=5, stock=1)
+        self.assertTrue(self.client.get('/api/products/?page_size=2').data['next'].startswith('http://testserver/'))
+        response = self.client.get('/api/products/?page_size=2', HTTP_HOST='localhost')
+        self.assertTrue(response.data['next'].startswith('http://localhost/'))
+
+    def test_product_write_invalidates_category_preview(self):
+        """Categories embedding a product are invalidated with it."""
+        self.client.get('/api/categories/')
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(name='Hose', description='', category=self.category, price=25, stock=2)
+        names = [p['name'] for p in self.client.get('/api/categories/').data['results'][0]['products']]
+        self.assertIn('Hose', names)
+
+    def test_transaction_flushes_tags_once(self):
+        """Many writes in one transaction invalidate in a single cache write."""
+        with mock.patch('api.invalidation.invalidate_tags') as invalidate:
+            with self.captureOnCommitCallbacks(execute=True):
+                with transaction.atomic():
+                    for i in range(20):
+                        Product.objects.create(name=f'Seed {i}', description='', category=self.category, price=1, stock=1)
+        invalidate.assert_called_once()
+        self.assertIn('product', invalidate.call_args[0][0])
+
+
+class QueryPlanTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name='Toys')
+        self.product = Product.objects.create(name='Kite', description='', category=self.category, price=12, stock=9)
+
+    def add_orders(self, count):
+        for i in range(count):
+            user = User.objects.create(username=f'user{User.objects.count()}')
+            order = Order.objects.create(user=user, total_price=24)
+            OrderItem.objects.create(order=order, product=self.product, quantity=2, price=12)
+            Review.objects.create(user=user, product=self.product, rating=5)
+
+    def count_queries(self, url):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(queries), response
+
+    def test_constant_queries_per_page(self):
+        """Query counts do not grow with the number of rows on the page."""
+        for url in ['/api/orders/', '/api/reviews/', '/api/order-items/']:
+            self.add_orders(2)
+            small, _ = self.count_queries(url)
+            self.add_orders(8)
+            large, response = self.count_queries(url)
+            self.assertEqual(small, large, url)
+            self.assertGreaterEqual(len(response.data['results']), 10)
+
+    def test_order_lists_its_items(self):
+        """Orders embed their order items with the nested product."""
+        self.add_orders(1)
+        _, response = self.count_queries('/api/orders/')
+        item = response.data['results'][0]['products'][0]
+        self.assertEqual((item['quantity'], item['product']['name']), (2, 'Kite'))
+        self.assertEqual(response.data['results'][0]['user'], 'user0')
+
+
+class SparseFieldsetTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name='Toys')
+        self.product = Product.objects.create(name='Kite', description='', category=self.category, price=12, stock=9)
+        user = User.objects.create(username='flyer')
+        order = Order.objects.create(user=user, total_price=24)
+        OrderItem.objects.create(order=order, product=self.product, quantity=2, price=12)
+        Review.objects.create(user=user, product=self.product, rating=5)
+
+    def sql(self, url):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.json(), ' '.join(query['sql'] for query in queries)
+
+    def test_fields_prune_response_and_columns(self):
+        """?fields= keeps only the listed fields and reads only their columns."""
+        data, sql = self.sql('/api/products/?fields=id,name')
+        self.assertEqual(data['results'], [{'id': self.product.id, 'name': 'Kite'}])
+        self.assertNotIn('description', sql)
+        self.assertEqual(self.sql('/api/products/popular/?fields=name')[0], [{'name': 'Kite'}])
+        category, _ = self.sql('/api/categories/?fields=name,products.price')
+        self.assertEqual(category['results'], [{'name': 'Toys', 'products': [{'price': '12.00'}]}])
+
+    def test_unexpanded_relations_skip_joins(self):
+        """With ?expand=, relations not listed are primary keys read without a join."""
+        data, sql = self.sql('/api/reviews/?expand=')
+        self.assertEqual(data['results'][0]['product'], self.product.id)
+        self.assertNotIn('JOIN "api_product"', sql)
+
+        data, sql = self.sql('/api/reviews/?fields=rating,product.name&expand=product')
+        self.assertEqual(data['results'][0], {'rating': 5, 'product': {'name': 'Kite'}})
+        self.assertNotIn('description', sql)
+
+        data, sql = self.sql('/api/orders/?fields=id,products.quantity')
+        self.assertEqual(data['results'][0]['products'], [{'quantity': 2}])
+        self.assertNotIn('"api_product"', sql)
+
+
+class CheckoutTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='shopper')
+        self.client.force_authenticate(self.user)
+        self.category = Category.objects.create(name='Audio')
+        self.speaker = Product.objects.create(name='Speaker', description='', category=self.category, price='49.99', stock=5)
+        self.cable = Product.objects.create(name='Cable', description='', category=self.category, price='5.00', stock=1)
+
+    def checkout(self, items):
+        return self.client.post('/api/orders/checkout/', {'items': items}, format='json')
+
+    def test_checkout_prices_on_server_and_takes_stock(self):
+        """The order total and item prices come from the catalog."""
+        response = self.checkout([
+            {'product_id': self.speaker.id, 'quantity': 1},
+            {'product_id': self.cable.id, 'quantity': 1},
+            {'product_id': self.speaker.id, 'quantity': 1},
+        ])
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['total_price'], '104.98')
+        self.assertEqual(sorted(item['quantity'] for item in response.data['products']), [1, 2])
+        self.speaker.refresh_from_db()
+        self.assertEqual(self.speaker.stock, 3)
+        self.assertEqual(ProductStats.objects.get(product=self.speaker).units_sold, 2)
+
+    def test_insufficient_stock_rolls_back_whole_cart(self):
+        """One short product fails the checkout and leaves all stock untouched."""
+        response = self.checkout([
+            {'product_id': self.speaker.id, 'quantity': 2},
+            {'product_id': self.cable.id, 'quantity': 2},
+        ])
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.speaker.refresh_from_db()
+        self.assertEqual(self.speaker.stock, 5)
+        self.assertFalse(Order.objects.exists())
+
+    def test_unknown_product_and_anonymous(self):
+        """Unknown products are a validation error; anonymous users cannot check out."""
+        self.assertEqual(self.checkout([{'product_id': 999, 'quantity': 1}]).status_code, status.HTTP_400_BAD_REQUEST)
+        self.client.force_authenticate(None)
+        self.assertEqual(self.checkout([{'product_id': self.cable.id, 'quantity': 1}]).status_code,
+                         status.HTTP_401_UNAUTHORIZED)
+
+    def test_cart_lines_are_capped(self):
+        """A cart of more than CHECKOUT_MAX_LINES lines is rejected before any stock is taken."""
+        lines = [{'product_id': self.speaker.id, 'quantity': 1}] * (CHECKOUT_MAX_LINES + 1)
+        self.assertEqual(self.checkout(lines).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Order.objects.exists())
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Concurrent writers need a server database')
+class ConcurrentCheckoutTests(TransactionTestCase):
+
+    def test_no_overselling_under_concurrency(self):
+        """Many threads buying the same product never sell more than the stock."""
+        call_command('stress_checkout', threads=8, attempts=10, stock=25, stdout=StringIO())
+
+
+class BulkImportExportTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create(username='admin', is_staff=True)
+        self.client.force_authenticate(self.admin)
+        self.category = Category.objects.create(name='Office')
+        self.stapler = Product.objects.create(name='Stapler', description='', category=self.category, price=8, stock=3)
+
+    def upload(self, name, content):
+        upload = SimpleUploadedFile(name, content.encode('utf-8'))
+        return self.client.post('/api/products/import/', {'file': upload}, format='multipart')
+
+    def test_csv_import_creates_updates_and_reports(self):
+        """Rows are created or updated in batches and bad rows are reported."""
+        response = self.upload('catalog.csv', (
+            'id,name,description,price,stock,category\n'
+            f'{self.stapler.id},Heavy Stapler,,9.50,4,Office\n'
+            ',Pen,Blue ink,1.20,100,Stationery\n'
+            ',Broken,,abc,1,Office\n'
+        ))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((response.data['created'], response.data['updated'], response.data['failed']), (1, 1, 1))
+        self.assertEqual(response.data['errors'][0]['line'], 4)
+        self.stapler.refresh_from_db()
+        self.assertEqual((self.stapler.name, str(self.stapler.price)), ('Heavy Stapler', '9.50'))
+        pen = Product.objects.get(name='Pen')
+        self.assertEqual(pen.category.name, 'Stationery')
+        self.assertTrue(ProductStats.objects.filter(product=pen).exists())
+
+    def test_malformed_values_and_encoding_are_row_errors(self):
+        """Wrong types, non-finite prices and undecodable bytes are reported, never a 500."""
+        response = self.upload('catalog.jsonl', '\n'.join([
+            json.dumps({'name': 5, 'price': '1', 'stock': 1, 'category': 'Office'}),
+            json.dumps({'name': 'Pen', 'price': 'NaN', 'stock': 1, 'category': 'Office'}),
+            '{"name": "Pen", "price": Infinity, "stock": 1, "category": "Office"}',
+            json.dumps({'name': 'Pen', 'price': '1', 'stock': 1e300, 'category': 'Office'}),
+            json.dumps({'name': 'Pen', 'price': '1.20', 'stock': 5, 'category': 'Office'}),
+        ]) + '\n')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((response.data['created'], response.data['failed']), (1, 4))
+        self.assertEqual([error['line'] for error in response.data['errors']], [1, 2, 3, 4])
+
+        for name in ('latin1.jsonl', 'latin1.csv'):
+            header = 'id,name,description,price,stock,category\n' if name.endswith('.csv') else ''
+            upload = SimpleUploadedFile(name, (header + 'caf\xe9').encode('latin-1'))
+            response = self.client.post('/api/products/import/', {'file': upload}, format='multipart')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertIn('UTF-8', response.data['errors'][0]['error'])
+
+    def test_import_invalidates_cached_detail_once(self):
+        """The cached detail of an updated product is replaced after the import."""
+        url = f'/api/products/{self.stapler.id}/'
+        self.client.get(url)
+        self.upload('catalog.jsonl', json.dumps(
+            {'id': self.stapler.id, 'name': 'Renamed', 'price': '8', 'stock': 3, 'category': 'Office'}
+        ) + '\n')
+        self.assertEqual(self.client.get(url).data['name'], 'Renamed')
+
+    def test_streaming_export(self):
+        """Exports stream one JSON object per row."""
+        response = self.client.get('/api/products/export/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(rows, [{
+            'id': self.stapler.id, 'name': 'Stapler', 'description': '', 'price': '8.00', 'stock': 3,
+            'category': 'Office', 'date_time_added': rows[0]['date_time_added'], 'updated_at': rows[0]['updated_at'],
+        }])
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get('/api/orders/export/').status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class ConditionalGetTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name='Outdoor')
+        self.tent = Product.objects.create(name='Tent', description='', category=self.category, price=120, stock=2)
+
+    def test_etag_revalidation(self):
+        """A matching If-None-Match gets 304 without queries until the product changes."""
+        url = f'/api/products/{self.tent.id}/'
+        first = self.client.get(url)
+        etag = first['ETag']
+        self.assertTrue(first.has_header('Last-Modified'))
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tent.stock = 1
+            self.tent.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_if_modified_since_on_lists(self):
+        """Lists honour If-Modified-Since and differ in ETag per page."""
+        first = self.client.get('/api/categories/')
+        response = self.client.get('/api/categories/', HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        other_page = self.client.get('/api/categories/?page_size=1')
+        self.assertNotEqual(other_page['ETag'], first['ETag'])
+
+
+class FastSerializationTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(name='Kitchen')
+        self.kettle = Product.objects.create(
+            name='Kettle \u2028 "ünïcode"', description='', category=category, price='19.9', stock=4,
+            image='products/kettle.jpg',
+        )
+        self.pan = Product.objects.create(name='Pan', description='Cast iron', category=category, price=45, stock=0)
+
+    def test_values_serializer_matches_model_serializer(self):
+        """The .values() fast path renders the same bytes as ProductSerializer + JSONRenderer."""
+        request = APIRequestFactory().get('/api/products/', HTTP_HOST='localhost')
+        queryset = Product.objects.order_by('id')
+        fast = get_values_serializer(ProductSerializer)
+        expected = JSONRenderer().render(ProductSerializer(queryset, many=True, context={'request': request}).data)
+        self.assertEqual(FastJSONRenderer().render(fast.serialize(queryset.values(*fast.columns), {'request': request})), expected)
+        self.assertEqual(FastJSONRenderer().render(fast.serialize(queryset, {'request': request})), expected)
+
+    def test_list_uses_values_path(self):
+        """Product lists are served from .values() rows and still paginate."""
+        with mock.patch.object(Product, '__init__', side_effect=AssertionError("model instantiated")):
+            response = self.client.get('/api/products/?page_size=1')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'][0]['id'], self.pan.id)
+        response = self.client.get(response.data['next'])
+        self.assertEqual(response.data['results'][0]['price'], '19.90')
+        self.assertIn('\\u2028', response.content.decode())
+
+    def test_nested_serializers_are_not_compiled(self):
+        """Serializers with nested or computed fields keep the regular path."""
+        self.assertIsNone(get_values_serializer(CategorySerializer))
+
+
+def make_image(width, height, fmt='PNG', mode='RGBA'):
+    buffer = BytesIO()
+    Image.new(mode, (width, height), (200, 30, 30, 128) if mode == 'RGBA' else (200, 30, 30)).save(buffer, fmt)
+    return buffer.getvalue()
+
+
+class ImageVariantTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        overrides = override_settings(MEDIA_ROOT=self.media_root, PRODUCT_IMAGE_WORKERS=0)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.category = Category.objects.create(name='Art')
+
+    def create_product(self, content, name='poster.png'):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Product.objects.create(
+                name='Poster', description='', category=self.category, price=10, stock=1,
+                image=SimpleUploadedFile(name, content),
+            )
+
+    def test_variants_generated_on_upload(self):
+        """Uploads get resized WebP and JPEG variants, exposed with dimensions and URLs."""
+        product = self.create_product(make_image(1600, 800))
+        product.refresh_from_db()
+        self.assertEqual(product.image_variants['original'], {'width': 1600, 'height': 800})
+        self.assertEqual(
+            {name: (v['width'], v['height']) for name, v in product.image_variants.items() if name != 'original'},
+            {'thumbnail': (200, 100), 'medium': (600, 300), 'large': (1200, 600)},
+        )
+        with Image.open(os.path.join(self.media_root, product.image_variants['thumbnail']['webp'])) as image:
+            self.assertEqual((image.format, image.size), ('WEBP', (200, 100)))
+
+        data = self.client.get(f'/api/products/{product.id}/').data
+        self.assertTrue(data['image_variants']['medium']['jpeg'].startswith('http://testserver/media/product_images/variants/'))
+        listed = self.client.get('/api/products/').data['results'][0]
+        self.assertEqual(listed['image_variants'], data['image_variants'])
+
+    def test_small_images_are_not_upscaled(self):
+        """Variants never exceed the original's size."""
+        product = self.create_product(make_image(120, 90, 'JPEG', 'RGB'), 'small.jpg')
+        product.refresh_from_db()
+        self.assertEqual((product.image_variants['large']['width'], product.image_variants['large']['height']), (120, 90))
+
+    def test_replacing_image_drops_old_variants(self):
+        """A new image clears the stale variants and deletes their files."""
+        product = self.create_product(make_image(400, 400))
+        product.refresh_from_db()
+        old_file = os.path.join(self.media_root, product.image_variants['thumbnail']['webp'])
+        self.assertTrue(os.path.exists(old_file))
+        with self.captureOnCommitCallbacks(execute=True):
+            product.image = SimpleUploadedFile('second.png', make_image(300, 600))
+            product.save()
+        product.refresh_from_db()
+        self.assertFalse(os.path.exists(old_file))
+        self.assertEqual(product.image_variants['thumbnail']['height'], 200)
+
+    def test_backfill_command(self):
+        """The backfill command processes images that have no variants yet."""
+        product = self.create_product(make_image(300, 300))
+        Product.objects.filter(pk=product.pk).update(image_variants={})
+        out = StringIO()
+        call_command('generate_image_variants', workers=1, stdout=out)
+        self.assertIn('Generated variants for 1 of 1 products', out.getvalue())
+        product.refresh_from_db()
+        self.assertIn('thumbnail', product.image_variants)
+
+
+class AsyncCatalogTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name='Garden')
+        self.products = [
+            Product.objects.create(name=f'Hose {i}', description='green garden hose', category=self.category,
+                                   price='12.50', stock=i)
+            for i in range(3)
+        ]
+        self.factory = AsyncRequestFactory()
+
+    def call(self, view, path, **kwargs):
+        return async_to_sync(view)(self.factory.get(path, headers=kwargs.pop('headers', None)), **kwargs)
+
+    def assertSameAsSync(self, view, path, **kwargs):
+        expected = self.client.get(path)
+        cache.clear()  # Compute the async response from the database, not from the viewset's entry
+        response = self.call(view, path, **kwargs)
+        self.assertEqual(response.status_code, expected.status_code)
+        self.assertEqual(response.content, expected.content)
+        return response
+
+    def test_async_reads_match_viewsets(self):
+        """The async views return the bytes the viewsets return."""
+        first = self.assertSameAsSync(async_views.product_list, '/api/products/?page_size=2')
+        self.assertSameAsSync(async_views.product_list, json.loads(first.content)['next'].replace('http://testserver', ''))
+        self.assertSameAsSync(async_views.product_detail, f'/api/products/{self.products[0].id}/', pk=str(self.products[0].id))
+        self.assertSameAsSync(async_views.product_detail, '/api/products/999999/', pk='999999')
+        self.assertSameAsSync(async_views.category_list, '/api/categories/')
+        self.assertSameAsSync(async_views.search_products, '/api/products/search/?query=hose&limit=2')
+        self.assertSameAsSync(async_views.popular_products, '/api/products/popular/')
+
+    def test_async_conditional_get_shares_etags(self):
+        """ETags from the viewset revalidate against the async view and vice versa."""
+        path = f'/api/products/{self.products[1].id}/'
+        etag = self.client.get(path)['ETag']
+        response = self.call(async_views.product_detail, path, pk=str(self.products[1].id),
+                             headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_writes_fall_through_to_viewset(self):
+        """Non-GET requests on an async URL are handled by the DRF view."""
+        from .urls import router
+        sync_view = next(pattern.callback for pattern in router.urls if pattern.name == 'product-popular-products')
+        view = async_views.with_sync_fallback(async_views.popular_products, sync_view)
+        response = async_to_sync(view)(self.factory.post('/api/products/popular/'))
+        self.assertEqual(response.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
+
+
+class ThrottlingTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.now = 1_200_000.0  # Start of a one-minute window
+        self.throttle_class = type('TestThrottle', (AnonRateThrottle,), {'rate': '4/min', 'timer': lambda _: self.now})
+        self.request = APIRequestFactory().get('/api/products/', REMOTE_ADDR='10.1.2.3')
+        self.request.user = None
+
+    def hit(self):
+        throttle = self.throttle_class()
+        return throttle.allow_request(self.request, None), throttle
+
+    def test_limits_and_slides(self):
+        """The limit holds within a window and frees up as the previous window slides out."""
+        self.assertEqual([self.hit()[0] for _ in range(5)], [True, True, True, True, False])
+        allowed, throttle = self.hit()
+        self.assertFalse(allowed)
+        self.assertGreater(throttle.wait(), 0)
+        self.now += 60  # Next window: all 4 previous requests still weigh in fully
+        self.assertFalse(self.hit()[0])
+        self.now += 30  # Half of the previous window has slid out: 2 requests left
+        self.assertEqual([self.hit()[0] for _ in range(3)], [True, True, False])
+
+    def test_state_is_two_counters(self):
+        """The cache holds one integer per window, however many requests were made."""
+        for _ in range(3):
+            self.hit()
+        _, throttle = self.hit()
+        window = int(self.now // 60)
+        self.assertEqual(cache.get(f'{throttle.key}:{window}'), 4)
+
+    def test_scoped_rates_per_viewset(self):
+        """Viewsets are throttled with the rate of their throttle_scope."""
+        with mock.patch.dict(SimpleRateThrottle.THROTTLE_RATES, {'catalog': '2/min', 'anon': '1000/day'}):
+            codes = [self.client.get('/api/categories/').status_code for _ in range(3)]
+            self.assertEqual(codes, [200, 200, 429])
+            self.assertEqual(self.client.get('/api/reviews/').status_code, status.HTTP_200_OK)
+
+
+class CachedAuthenticationTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='carol')
+        category = Category.objects.create(name='Toys')
+        product = Product.objects.create(name='Kite', description='', category=category, price=15, stock=3)
+        Order.objects.create(user=self.user, total_price=15)
+        Review.objects.create(user=self.user, product=product, rating=4, comment='Flies well')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+
+    def auth_user_queries(self, path):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response, [q['sql'] for q in queries.captured_queries if 'auth_user' in q['sql']]
+
+    def test_authenticated_reads_skip_auth_user(self):
+        """Once cached, the token's user and rendered usernames cost no auth_user query."""
+        self.auth_user_queries('/api/orders/')
+        response, queries = self.auth_user_queries('/api/reviews/?page_size=5')
+        self.assertEqual(queries, [])
+        self.assertEqual(response.data['results'][0]['user'], 'carol')
+        response, queries = self.auth_user_queries('/api/orders/?page_size=5')
+        self.assertEqual(queries, [])
+        self.assertEqual(response.data['results'][0]['user'], 'carol')
+
+    def test_deactivation_and_rename_invalidate(self):
+        """Saving the user drops the cached copy."""
+        self.client.get('/api/orders/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        self.assertEqual(self.client.get('/api/orders/?page_size=2').status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_cache_holds_no_password_hash(self):
+        """Only a few fields and a digest of the hash are cached, never the model or the hash itself."""
+        self.user.set_password('s3cret-pass')
+        self.user.save()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+        self.assertEqual(self.client.get('/api/orders/').status_code, status.HTTP_200_OK)
+        entry = cache.get(user_cache_key(self.user.pk))
+        self.assertIsInstance(entry, dict)
+        self.assertNotIn(self.user.password, entry.values())
+        self.assertEqual(get_cached_user(self.user.pk).username, 'carol')
+
+
+@override_settings(DATABASE_REPLICAS=['replica_1', 'replica_2'], DATABASE_REPLICA_LAG=5)
+class ReplicaRoutingTests(SimpleTestCase):
+
+    def setUp(self):
+        self.router = PrimaryReplicaRouter()
+        self.factory = RequestFactory()
+
+    def route_during(self, request):
+        seen = []
+
+        def get_response(request):
+            seen.append(self.router.db_for_read(Product))
+            return HttpResponse()
+        response = PrimaryPinningMiddleware(get_response)(request)
+        return seen[0], response
+
+    def test_reads_go_to_replicas_and_writes_to_primary(self):
+        """Safe reads are spread over the replicas; writes and pinned reads use the primary."""
+        self.assertIn(self.router.db_for_read(Product), {'replica_1', 'replica_2'})
+        self.assertEqual(self.router.db_for_write(Product), 'default')
+        with use_primary():
+            self.assertEqual(self.router.db_for_read(Product), 'default')
+        self.assertFalse(self.router.allow_migrate('replica_1', 'api'))
+
+    def test_read_after_write_is_pinned(self):
+        """A write pins its own reads and, through a cookie, the client's next reads."""
+        database, response = self.route_during(self.factory.post('/api/orders/checkout/'))
+        self.assertEqual(database, 'default')
+        self.assertEqual(response.cookies[PRIMARY_COOKIE]['max-age'], 5)
+
+        request = self.factory.get('/api/orders/')
+        request.COOKIES[PRIMARY_COOKIE] = '1'
+        self.assertEqual(self.route_during(request)[0], 'default')
+        self.assertNotEqual(self.route_during(self.factory.get('/api/orders/'))[0], 'default')
+
+    def test_refresh_after_invalidation_reads_the_primary(self):
+        """A background refresh right after a write reads the primary, not a replica that may lag."""
+        key = 'replica_test:refresh'
+        self.addCleanup(cache.delete_many, [key, f'{key}:lock'])
+        cache.set(key, {'value': 'old', 'fresh_until': time.time() - 1, 'versions': {}}, 60)
+        caching.invalidate_tags({'product'})
+        compute = lambda: self.router.db_for_read(Product)
+        self.assertEqual(caching.get_or_refresh(key, compute, timeout=60, tags=['product']), 'old')
+        deadline = time.monotonic() + 2
+        while cache.get(key)['value'] == 'old' and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(cache.get(key)['value'], 'default')
+
+
+class SalesRollupTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='shopper')
+        self.staff = User.objects.create(username='finance', is_staff=True)
+        self.kitchen = Category.objects.create(name='Kitchen')
+        self.garden = Category.objects.create(name='Garden')
+        self.kettle = Product.objects.create(name='Kettle', description='', category=self.kitchen, price='30.00', stock=50)
+        self.hose = Product.objects.create(name='Hose', description='', category=self.garden, price='12.50', stock=50)
+        self.today = timezone.localdate()
+
+    def rollups(self, model=CategoryDailySales):
+        return sorted(model.objects.values_list(
+            'product_id' if model is ProductDailySales else 'category_id', 'status', 'revenue', 'units', 'line_count'
+        ))
+
+    def test_rollups_follow_orders(self):
+        """Checkouts, status changes, item changes and category moves keep the rollups exact."""
+        order = place_order(self.user, [(self.kettle.id, 2), (self.hose.id, 1)])
+        place_order(self.user, [(self.kettle.id, 1)])
+        self.assertEqual(self.rollups(ProductDailySales), [
+            (self.kettle.id, 'Pending', Decimal('90.00'), 3, 2), (self.hose.id, 'Pending', Decimal('12.50'), 1, 1),
+        ])
+
+        order.status = 'Shipped'
+        order.save()
+        item = OrderItem.objects.get(order=order, product=self.hose)
+        item.quantity = 4
+        item.save()
+        self.assertEqual(self.rollups(), [
+            (self.kitchen.id, 'Pending', Decimal('30.00'), 1, 1), (self.kitchen.id, 'Shipped', Decimal('60.00'), 2, 1),
+            (self.garden.id, 'Shipped', Decimal('50.00'), 4, 1),
+        ])
+
+        self.hose.category = self.kitchen
+        self.hose.save()
+        order.delete()
+        self.assertEqual(self.rollups(), [(self.kitchen.id, 'Pending', Decimal('30.00'), 1, 1)])
+
+    def test_reports_read_only_rollups(self):
+        """The reports answer from the rollup tables and are staff only."""
+        place_order(self.user, [(self.kettle.id, 2), (self.hose.id, 3)])
+        self.assertEqual(self.client.get('/api/reports/sales/').status_code, status.HTTP_401_UNAUTHORIZED)
+        self.client.force_authenticate(self.staff)
+
+        with CaptureQueriesContext(connection) as queries:
+            series = self.client.get('/api/reports/sales/', {'group': 'category', 'id': [self.garden.id]})
+            top = self.client.get('/api/reports/sales/top/', {'metric': 'units', 'status': ['Pending', 'Shipped']})
+        self.assertFalse([q for q in queries if 'api_order' in q['sql']])
+        self.assertEqual(series.json(), [
+            {'revenue': '37.50', 'units': 3, 'line_count': 1, 'period': self.today.isoformat()},
+        ])
+        self.assertEqual([(row['name'], row['units']) for row in top.json()], [('Hose', 3), ('Kettle', 2)])
+        self.assertEqual(self.client.get('/api/reports/sales/', {'start': '2030-01-02', 'end': '2030-01-01'}).status_code,
+                         status.HTTP_400_BAD_REQUEST)
+
+    def test_rebuild_command_matches_incremental(self):
+        """Rebuilding from order history reproduces the incrementally maintained rows."""
+        place_order(self.user, [(self.kettle.id, 2), (self.hose.id, 1)])
+        order = place_order(self.user, [(self.hose.id, 5)])
+        Order.objects.filter(pk=order.pk).update(status='Cancelled')  # Bypasses the signals
+        CategoryDailySales.objects.update(units=99)
+        call_command('rebuild_sales_rollups', stdout=StringIO())
+        self.assertEqual(self.rollups(), [
+            (self.kitchen.id, 'Pending', Decimal('60.00'), 2, 1),
+            (self.garden.id, 'Cancelled', Decimal('62.50'), 5, 1), (self.garden.id, 'Pending', Decimal('12.50'), 1, 1),
+        ])
+        self.assertEqual(len(self.rollups(ProductDailySales)), 3)
+
+
+class RecommendationTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        overrides = override_settings(MEDIA_ROOT=media_root)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.user = User.objects.create(username='shopper')
+        category = Category.objects.create(name='Outdoor')
+        self.tent, self.stove, self.lamp, self.rope = (
+            Product.objects.create(name=name, description='', category=category, price=10, stock=100)
+            for name in ('Tent', 'Stove', 'Lamp', 'Rope')
+        )
+
+    def buy(self, *baskets):
+        for basket in baskets:
+            place_order(self.user, [(product.id, 1) for product in basket])
+        # Old enough to be settled
+        Order.objects.update(order_date=timezone.now() - timedelta(minutes=5))
+
+    def neighbors(self, product):
+        return list(ProductNeighbor.objects.filter(product=product).order_by('rank').values_list('neighbor__name', 'orders'))
+
+    def test_build_and_related_endpoint(self):
+        """Neighbours are ranked by co-occurrence and served by /related/."""
+        self.buy([self.tent, self.stove], [self.tent, self.stove, self.lamp], [self.tent, self.lamp], [self.rope])
+        call_command('build_recommendations', stdout=StringIO())
+        self.assertEqual(self.neighbors(self.stove), [('Tent', 2), ('Lamp', 1)])
+        self.assertEqual(self.neighbors(self.rope), [])
+
+        response = self.client.get(f'/api/products/{self.lamp.id}/related/?limit=1')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([product['name'] for product in response.data], ['Tent'])
+        self.assertEqual(self.client.get('/api/products/999/related/').status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.get('/api/products/abc/related/').status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_incremental_build_matches_full_build(self):
+        """Folding in new orders gives the touched products the same neighbours as a full rebuild."""
+        self.buy([self.tent, self.stove], [self.tent, self.lamp])
+        recommendations.build_recommendations()
+        self.buy([self.stove, self.lamp], [self.stove, self.lamp], [self.rope, self.tent])
+        summary = recommendations.build_recommendations(incremental=True)
+        self.assertEqual((summary['incremental'], summary['order_items']), (True, 6))
+        incremental = {product.name: self.neighbors(product) for product in (self.stove, self.lamp, self.rope)}
+
+        recommendations.build_recommendations()
+        self.assertEqual({product.name: self.neighbors(product) for product in (self.stove, self.lamp, self.rope)},
+                         incremental)
+        self.assertEqual(incremental['Stove'], [('Lamp', 2), ('Tent', 1)])
+
+    def test_python_fallback_matches_sparse_build(self):
+        """Without NumPy/SciPy the pure Python build stores the same neighbours."""
+        self.buy([self.tent, self.stove, self.lamp], [self.tent, self.stove], [self.lamp, self.rope])
+        recommendations.build_recommendations()
+        expected = list(ProductNeighbor.objects.order_by('product', 'rank').values_list('product', 'neighbor', 'orders'))
+        with mock.patch.object(recommendations, 'np', None):
+            recommendations.build_recommendations(incremental=True)
+        self.assertEqual(
+            list(ProductNeighbor.objects.order_by('product', 'rank').values_list('product', 'neighbor', 'orders')), expected
+        )
+
+
+class ReservationTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='holder')
+        self.other = User.objects.create(username='rival')
+        self.client.force_authenticate(self.user)
+        category = Category.objects.create(name='Tickets')
+        self.ticket = Product.objects.create(name='Ticket', description='', category=category, price='20.00', stock=3)
+
+    def hold(self, quantity, user=None):
+        self.client.force_authenticate(user or self.user)
+        return self.client.post('/api/cart/', {'product_id': self.ticket.id, 'quantity': quantity}, format='json')
+
+    def available(self):
+        response = self.client.get(f'/api/products/availability/?id={self.ticket.id}')
+        return response.data[0]['available']
+
+    def test_holds_keep_units_from_other_carts(self):
+        """Held units can't be held or bought by another user, and the holder's checkout consumes them."""
+        self.assertEqual(self.hold(2).status_code, status.HTTP_200_OK)
+        self.assertEqual(self.available(), 1)
+        self.assertEqual(self.hold(2, self.other).status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(
+            self.client.post('/api/orders/checkout/', {'items': [{'product_id': self.ticket.id, 'quantity': 2}]},
+                             format='json').status_code,
+            status.HTTP_409_CONFLICT,
+        )
+
+        self.assertEqual(self.hold(1).status_code, status.HTTP_200_OK)  # Shrinking a hold gives units back
+        self.assertEqual(self.available(), 2)
+        place_order(self.user, [(self.ticket.id, 2)])  # Its own hold plus one free unit
+        self.ticket.refresh_from_db()
+        self.assertEqual((self.ticket.stock, self.ticket.reserved), (1, 0))
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_release_and_expiry(self):
+        """Released and expired holds give their units back; the sweeper works in batches."""
+        self.hold(1)
+        self.hold(1, self.other)
+        self.assertEqual([hold['quantity'] for hold in self.client.get('/api/cart/').data], [1])
+        self.assertEqual(self.client.delete(f'/api/cart/{self.ticket.id}/').status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self.client.delete(f'/api/cart/{self.ticket.id}/').status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.available(), 2)
+
+        self.hold(1)
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(self.client.get('/api/cart/').data, [])
+        self.assertEqual(release_expired(batch_size=1), 1)
+        call_command('release_expired_reservations', stdout=StringIO())
+        self.ticket.refresh_from_db()
+        self.assertEqual((self.ticket.reserved, StockReservation.objects.count()), (0, 0))
+
+        self.hold(3, self.other)
+        self.other.delete()
+        self.assertEqual(self.available(), 3)
+
+    def test_stock_edits_keep_held_units(self):
+        """Neither a product update nor an import takes the stock below the units held in carts."""
+        self.hold(2)
+        self.client.force_authenticate(User.objects.create(username='staff', is_staff=True))
+        url = f'/api/products/{self.ticket.id}/'
+        self.assertEqual(self.client.patch(url, {'stock': 1}, format='json').status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.patch(url, {'stock': 2}, format='json').status_code, status.HTTP_200_OK)
+
+        upload = SimpleUploadedFile('stock.csv', (
+            'id,name,description,price,stock,category\n'
+            f'{self.ticket.id},Ticket,,20.00,1,Tickets\n'
+        ).encode('utf-8'))
+        response = self.client.post('/api/products/import/', {'file': upload}, format='multipart')
+        self.assertEqual((response.data['updated'], response.data['failed']), (0, 1))
+        self.ticket.refresh_from_db()
+        self.assertEqual((self.ticket.stock, self.ticket.reserved), (2, 2))
+
+
+class ReviewSummaryTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name='Books')
+        self.book = Product.objects.create(name='Novel', description='', category=self.category, price='9.99', stock=10)
+        self.users = [User.objects.create(username=f'reader{i}') for i in range(4)]
+        self.reviews = [
+            Review.objects.create(user=user, product=self.book, rating=rating, comment='')
+            for user, rating in zip(self.users, (5, 4, 5, 1))
+        ]
+
+    def test_detail_summary_is_maintained(self):
+        """Product detail carries count, mean and histogram, kept current (and recached) on review writes."""
+        summary = self.client.get(f'/api/products/{self.book.id}/').data['review_summary']
+        self.assertEqual(summary, {'count': 4, 'average': 3.75, 'histogram': {'1': 1, '2': 0, '3': 0, '4': 1, '5': 2}})
+        self.assertNotIn('review_summary', self.client.get('/api/products/').data['results'][0])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.reviews[3].rating = 3
+            self.reviews[3].save()
+            self.reviews[0].delete()
+        summary = self.client.get(f'/api/products/{self.book.id}/').data['review_summary']
+        self.assertEqual(summary, {'count': 3, 'average': 4.0, 'histogram': {'1': 0, '2': 0, '3': 1, '4': 1, '5': 1}})
+
+        ProductStats.objects.update(rating_5=0)
+        call_command('rebuild_product_stats', stdout=StringIO())
+        self.assertEqual(ProductStats.objects.get(product=self.book).rating_5, 1)
+
+        other = Product.objects.create(name='Atlas', description='', category=self.category, price='30.00', stock=1)
+        self.assertEqual(self.client.get(f'/api/products/{other.id}/').data['review_summary']['count'], 0)
+        response = async_to_sync(async_views.product_detail)(
+            AsyncRequestFactory().get(f'/api/products/{self.book.id}/'), pk=str(self.book.id)
+        )
+        self.assertEqual(json.loads(response.content), json.loads(self.client.get(f'/api/products/{self.book.id}/').content))
+
+    def test_review_feed(self):
+        """The feed pages a product's reviews newest first, optionally for one rating."""
+        response = self.client.get(f'/api/products/{self.book.id}/reviews/?page_size=3')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([review['id'] for review in response.data['results']],
+                         [review.id for review in reversed(self.reviews)][:3])
+        self.assertNotIn('product', response.data['results'][0])
+        self.assertEqual(response.data['results'][0]['user'], 'reader3')
+        self.assertIsNotNone(response.data['next'])
+
+        response = self.client.get(f'/api/products/{self.book.id}/reviews/?rating=5')
+        self.assertEqual([review['rating'] for review in response.data['results']], [5, 5])
+        self.assertEqual(self.client.get(f'/api/products/{self.book.id}/reviews/?rating=9').status_code,
+                         status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get('/api/products/999/reviews/').status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.get('/api/products/abc/reviews/').status_code, status.HTTP_404_NOT_FOUND)
+
+
+class BenchmarkBudgetTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        media_root = tempfile.mkdtemp()  # The recommendations build saves its state there
+        cls.addClassCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        with override_settings(MEDIA_ROOT=media_root):
+            call_command('generate_synthetic_data', scale='tiny', stdout=StringIO())
+
+    def setUp(self):
+        cache.clear()
+
+    def test_every_route_is_benchmarked(self):
+        """Each route of api/urls.py has a benchmark and a budget, or a reason not to."""
+        from .urls import router, urlpatterns
+        names = {getattr(pattern, 'name', None) for pattern in [*router.urls, *urlpatterns]} - {None}
+        routes = {route.name for route in benchmarks.ROUTES}
+        self.assertEqual(names, routes | set(benchmarks.UNBENCHMARKED))
+        self.assertEqual(routes, set(benchmarks.BUDGETS))
+
+    def test_routes_within_budgets(self):
+        """No route fails or runs more SQL queries than its budget on the synthetic dataset."""
+        # Latency is gated by bench_endpoints --check: a few timings on a shared runner are noise
+        for result in benchmarks.run_benchmarks(iterations=5):
+            with self.subTest(route=result.name, path=result.path):
+                self.assertEqual(benchmarks.over_budget(result, latency_factor=float('inf')), [])
+
+    def test_generator_is_reproducible(self):
+        """The same seed generates the same catalog and history."""
+        def generate():
+            first = Product.objects.order_by('-id').values_list('id', flat=True).first()
+            call_command('generate_synthetic_data', categories=2, products=10, users=3, orders=8, reviews=5, seed=7,
+                         skip_rebuild=True, stdout=StringIO())
+            products = Product.objects.filter(id__gt=first).order_by('id')
+            items = OrderItem.objects.filter(product__in=products).order_by('id')
+            return (list(products.values_list('price', 'stock', 'description')),
+                    [(item.product.price, item.quantity) for item in items])
+
+        self.assertEqual(generate(), generate())
+
+
+class MetricsTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.metrics_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.metrics_dir, ignore_errors=True)
+        overrides = override_settings(METRICS_DIR=self.metrics_dir, METRICS_TOKEN='scrape-me')
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        patcher = mock.patch.object(metrics, 'registry', metrics.Registry())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        category = Category.objects.create(name='Garden')
+        Product.objects.create(name='Rake', description='', category=category, price='15.00', stock=4)
+
+    def scrape(self):
+        response = self.client.get('/api/metrics/', HTTP_AUTHORIZATION='Bearer scrape-me')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        return response.content.decode()
+
+    def test_requests_queries_and_cache_are_exposed(self):
+        """Routes, query counts and cache hits show up in the Prometheus exposition, for the scraper or staff only."""
+        self.client.get('/api/products/popular/')
+        self.client.get('/api/products/popular/')
+        self.client.get('/api/products/')
+        text = self.scrape()
+        self.assertIn('lux_http_requests_total{method="GET",route="product-popular-products",status="200"} 2', text)
+        self.assertIn('lux_cache_requests_total{cache="popular_products",result="miss"} 1', text)
+        self.assertIn('lux_cache_requests_total{cache="popular_products",result="hit"} 1', text)
+        self.assertIn('lux_db_queries_per_request_bucket{route="product-list",le="1"} 1', text)
+        self.assertIn('lux_http_request_duration_seconds_count{route="product-list"} 1', text)
+        self.assertIn('# TYPE lux_http_response_size_bytes histogram', text)
+
+        self.assertEqual(self.client.get('/api/metrics/').status_code, status.HTTP_401_UNAUTHORIZED)
+        self.client.force_authenticate(User.objects.create(username='ops', is_staff=True))
+        self.assertEqual(self.client.get('/api/metrics/').status_code, status.HTTP_200_OK)
+
+    def test_worker_snapshots_are_added_up(self):
+        """Totals written by other workers are merged into the exposition."""
+        other = metrics.Registry()
+        other.inc('lux_http_requests_total', {'route': 'product-list', 'method': 'GET', 'status': '200'}, 41)
+        with open(os.path.join(self.metrics_dir, 'worker-999999.json'), 'w') as file:
+            json.dump(other.snapshot(), file)
+        self.client.get('/api/products/')
+        self.assertIn('lux_http_requests_total{method="GET",route="product-list",status="200"} 42', self.scrape())
+
+    def test_snapshots_of_gone_workers_expire(self):
+        """A snapshot no longer rewritten by its worker is left out of the totals and deleted."""
+        other = metrics.Registry()
+        other.inc('lux_http_requests_total', {'route': 'product-list', 'method': 'GET', 'status': '200'}, 41)
+        path = os.path.join(self.metrics_dir, 'worker-999999-0123456789ab.json')
+        with open(path, 'w') as file:
+            json.dump(other.snapshot(), file)
+        gone = time.time() - (metrics.SNAPSHOT_EXPIRY_FLUSHES + 1) * settings.METRICS_FLUSH_SECONDS
+        os.utime(path, (gone, gone))
+        self.client.get('/api/products/')
+        self.assertIn('lux_http_requests_total{method="GET",route="product-list",status="200"} 1', self.scrape())
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(len(os.listdir(self.metrics_dir)), 1)  # This worker's own snapshot
+
+    def test_slow_requests_are_logged_with_their_sql(self):
+        """A request over SLOW_REQUEST_SECONDS is counted and logged with its statements."""
+        with override_settings(SLOW_REQUEST_SECONDS=0), self.assertLogs('api.metrics', 'WARNING') as logs:
+            self.client.get('/api/products/')
+        self.assertIn('product-list', logs.output[0])
+        self.assertIn('api_product', logs.output[0])
+        self.assertIn('lux_slow_requests_total{route="product-list"} 1', self.scrape())
+
+
+class PrecomputedSchemaTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.schema_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.schema_dir, ignore_errors=True)
+        overrides = override_settings(SCHEMA_DIR=self.schema_dir)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        patcher = mock.patch.object(schema, '_documents', {})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_schema_is_generated_once_and_revalidated(self):
+        """The first hit writes the versioned files; later hits and revalidations never regenerate."""
+        with mock.patch.object(schema, 'generate_schema', wraps=schema.generate_schema) as generate:
+            first = self.client.get('/api/docs/?format=openapi')
+            self.assertEqual(first.status_code, status.HTTP_200_OK)
+            self.assertIn('/products/', json.loads(first.content)['paths'])
+            self.assertEqual(self.client.get('/api/redoc/?format=openapi').content, first.content)
+            not_modified = self.client.get('/api/docs/?format=openapi', HTTP_IF_NONE_MATCH=first['ETag'])
+            yaml = self.client.get('/api/docs/?format=.yaml')
+            page = self.client.get('/api/docs/')
+        self.assertEqual(generate.call_count, 1)
+        self.assertEqual(not_modified.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(yaml['Content-Type'], 'application/yaml; charset=utf-8')
+        self.assertNotEqual(yaml['ETag'], first['ETag'])
+        self.assertContains(page, 'E-Commerce API')
+        with open(schema.schema_path('json'), 'rb') as file:
+            self.assertEqual(file.read(), first.content)
+
+    def test_build_time_schema_is_served(self):
+        """Files written by generate_openapi_schema are served as they are."""
+        call_command('generate_openapi_schema', stdout=StringIO())
+        with open(schema.schema_path('json'), 'wb') as file:
+            file.write(b'{"swagger": "2.0", "paths": {}}')
+        with mock.patch.object(schema, 'generate_schema') as generate:
+            response = self.client.get('/api/docs/?format=openapi')
+        generate.assert_not_called()
+        self.assertEqual(response.content, b'{"swagger": "2.0", "paths": {}}')
+
+
+class AdminTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(User.objects.create_superuser(username='admin', password='x'))
+        self.shopper = User.objects.create(username='shopper')
+        self.kitchen = Category.objects.create(name='Kitchen')
+        self.kettle = Product.objects.create(name='Kettle', description='', category=self.kitchen, price='30.00', stock=50)
+
+    def add_orders(self, count):
+        for _ in range(count):
+            order = place_order(self.shopper, [(self.kettle.id, 1)])
+            Review.objects.create(user=User.objects.create(username=f'reviewer{order.id}'), product=self.kettle, rating=4)
+
+    def changelist_queries(self):
+        counts = {}
+        for model in ('category', 'product', 'order', 'orderitem', 'review'):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(f'/admin/api/{model}/')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            counts[model] = len(queries)
+        return counts
+
+    def test_changelists_do_not_grow_with_rows(self):
+        """Listing more rows costs no more queries: related rows are joined, not read per row."""
+        self.add_orders(2)
+        before = self.changelist_queries()
+        self.add_orders(8)
+        self.assertEqual(self.changelist_queries(), before)
+
+        response = self.client.get('/admin/autocomplete/', {
+            'app_label': 'api', 'model_name': 'orderitem', 'field_name': 'product', 'term': 'kettle',
+        })
+        self.assertEqual([result['text'] for result in response.json()['results']], ['Kettle'])
+        self.assertContains(self.client.get('/admin/api/order/', {'q': 'shopper'}), 'shopper')
+        order = Order.objects.first()
+        self.assertContains(self.client.get(f'/admin/api/order/{order.id}/change/'), 'Kettle')
+
+    def test_status_action_moves_rollups_in_batches(self):
+        """Bulk status changes update the orders batch by batch and move their sales rollups."""
+        self.add_orders(3)
+        ids = list(Order.objects.values_list('id', flat=True))
+        with mock.patch.object(api_admin, 'ACTION_BATCH_SIZE', 2):
+            response = self.client.post('/admin/api/order/', {'action': 'mark_shipped', '_selected_action': ids})
+        self.assertEqual(response.status_code, status.HTTP_302_FOUND)
+        self.assertEqual(set(Order.objects.values_list('status', flat=True)), {'Shipped'})
+        self.assertEqual(list(ProductDailySales.objects.values_list('status', 'units', 'line_count')), [('Shipped', 3, 3)])
+
+    def test_stock_action_keeps_held_units(self):
+        """Removing stock never goes below the units held in carts."""
+        Product.objects.filter(pk=self.kettle.pk).update(stock=15, reserved=8)
+        for _ in range(2):
+            self.client.post('/admin/api/product/', {'action': 'remove_10_from_stock', '_selected_action': [self.kettle.pk]})
+        self.assertEqual(Product.objects.values_list('stock', flat=True).get(pk=self.kettle.pk), 8)
+
+    def test_large_tables_use_the_estimate(self):
+        """Past the threshold the changelist trusts the planner's estimate instead of COUNT(*)."""
+        queryset = Product.objects.order_by('pk')
+        with mock.patch.object(api_admin, 'estimated_count', return_value=5000000):
+            self.assertEqual(api_admin.EstimatedCountPaginator(queryset, 50).count, 5000000)
+        with mock.patch.object(api_admin, 'estimated_count', return_value=40):
+            self.assertEqual(api_admin.EstimatedCountPaginator(queryset, 50).count, 1)
+        self.assertIsNone(api_admin.estimated_count(Product.objects.filter(stock__gt=0)))  # Filtered: counted exactly
+
+
+class OrderArchiveTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='shopper')
+        self.kitchen = Category.objects.create(name='Kitchen')
+        self.kettle = Product.objects.create(name='Kettle', description='', category=self.kitchen, price='30.00', stock=50)
+        self.orders = []
+        for days_ago, status_ in ((800, 'Delivered'), (700, 'Cancelled'), (600, 'Pending'), (5, 'Delivered')):
+            order = place_order(self.user, [(self.kettle.id, 1)])
+            order.status = status_
+            order.save()
+            Order.objects.filter(pk=order.pk).update(order_date=timezone.now() - timedelta(days=days_ago))
+            self.orders.append(order)
+
+    def counters(self):
+        return (
+            list(ProductStats.objects.values_list('product_id', 'units_sold', 'order_count')),
+            sorted(ProductDailySales.objects.values_list('status', 'units', 'line_count')),
+        )
+
+    def test_old_completed_orders_move_in_batches(self):
+        """Old Delivered/Cancelled orders move with their items; counters, rollups and their rebuilds keep them."""
+        ProductDailySales.objects.all().delete()
+        call_command('rebuild_sales_rollups', stdout=StringIO())
+        before = self.counters()
+        call_command('archive_orders', '--older-than-days', '365', '--batch-size', '1', stdout=StringIO())
+
+        archived_ids = [self.orders[0].id, self.orders[1].id]
+        self.assertEqual(sorted(ArchivedOrder.objects.values_list('id', flat=True)), archived_ids)
+        self.assertEqual(ArchivedOrderItem.objects.filter(order_id__in=archived_ids).count(), 2)
+        self.assertEqual(sorted(Order.objects.values_list('id', flat=True)), [self.orders[2].id, self.orders[3].id])
+        self.assertEqual(self.counters(), before)
+
+        call_command('rebuild_product_stats', stdout=StringIO())
+        ProductDailySales.objects.all().delete()
+        call_command('rebuild_sales_rollups', stdout=StringIO())
+        self.assertEqual(self.counters(), before)
+
+    def test_history_spans_hot_and_archived_orders(self):
+        """A user's history pages through recent and archived orders alike, and archived ids still resolve."""
+        call_command('archive_orders', stdout=StringIO())
+        self.client.force_authenticate(self.user)
+        ids, url = [], '/api/orders/history/?page_size=1'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            ids += [order['id'] for order in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(ids, [order.id for order in reversed(self.orders)])
+
+        response = self.client.get(f'/api/orders/{self.orders[0].id}/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['status'], 'Delivered')
+        self.assertEqual(response.data['products'][0]['product']['name'], 'Kettle')
+        self.assertEqual(self.client.get('/api/orders/abc/').status_code, status.HTTP_404_NOT_FOUND)
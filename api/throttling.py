@@ -0,0 +1,79 @@
+# throttling.py
+import math
+
+from rest_framework import throttling
+
+
+class SlidingWindowRateThrottle(throttling.SimpleRateThrottle):
+    """
+    Rate throttle keeping two counters per client instead of a timestamp list.
+
+    Requests are counted in fixed windows of the rate's duration. The number
+    of requests in the last `duration` seconds is estimated by weighting the
+    previous window's count by the part of it still inside the sliding window:
+
+        estimate = previous * (1 - elapsed / duration) + current
+
+    Each request reads both counters with one get_many() and bumps the
+    current one with an atomic cache incr(), so memory and work per request
+    stay constant whatever the configured rate. DRF's SimpleRateThrottle
+    stores, rewrites and re-pickles a list of one timestamp per request.
+
+    incr() and add() are atomic on Redis (and Memcached and the per-process
+    locmem cache), which exact limits across workers require. FileBasedCache
+    implements them as a read then a write: concurrent requests of a client
+    may be counted once, letting a burst slightly past the limit.
+    """
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        self.now = self.timer()
+        window = math.floor(self.now / self.duration)
+        self.elapsed = self.now - window * self.duration
+        current_key, previous_key = f'{self.key}:{window}', f'{self.key}:{window - 1}'
+        counts = self.cache.get_many([current_key, previous_key])
+        self.current = counts.get(current_key, 0)
+        self.previous = counts.get(previous_key, 0)
+
+        if self.previous * (1 - self.elapsed / self.duration) + self.current >= self.num_requests:
+            return self.throttle_failure()
+        self._hit(current_key)
+        return True
+
+    def _hit(self, key):
+        try:
+            self.cache.incr(key)
+        except ValueError:
+            # First request of the window. add() is atomic on Redis, so of two racing first requests one
+            # creates the counter and the other increments it. The counter must outlive the next window.
+            if not self.cache.add(key, 1, 2 * self.duration):
+                self.cache.incr(key)
+
+    def wait(self):
+        """Seconds until the estimate drops below the limit again."""
+        remaining = self.duration - self.elapsed
+        if self.current < self.num_requests and self.previous:
+            # The previous window slides out at previous / duration requests per second
+            delay = self.duration * (1 - (self.num_requests - self.current) / self.previous) - self.elapsed
+            if delay <= remaining:
+                return max(delay, 0)
+        # The current window alone is at the limit: wait for part of it to slide out
+        return remaining + max(self.duration * (1 - self.num_requests / max(self.current, 1)), 0)
+
+
+class AnonRateThrottle(throttling.AnonRateThrottle, SlidingWindowRateThrottle):
+    """Limits anonymous clients per IP address, using the 'anon' rate."""
+
+
+class UserRateThrottle(throttling.UserRateThrottle, SlidingWindowRateThrottle):
+    """Limits each user (or anonymous IP address), using the 'user' rate."""
+
+
+class ScopedRateThrottle(throttling.ScopedRateThrottle, SlidingWindowRateThrottle):
+    """Limits each user per view.throttle_scope, using that scope's rate."""
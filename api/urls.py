@@ -2,23 +2,14 @@
 
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from rest_framework.routers import DefaultRouter
-from drf_yasg.views import get_schema_view
-from drf_yasg import openapi
-from django.urls import path, include
-from .views import CategoryViewSet, ProductViewSet, OrderViewSet, OrderItemViewSet, ReviewViewSet
+from django.conf import settings
+from django.urls import path, re_path, include
+from . import async_views
+from .schema import get_precomputed_schema_view
+from .views import CategoryViewSet, ProductViewSet, OrderViewSet, OrderItemViewSet, ReviewViewSet, SalesReportViewSet, CartViewSet, MetricsView
 
-# Swagger documentation setup
-schema_view = get_schema_view(
-   openapi.Info(
-      title="E-Commerce API",
-      default_version='v1',
-      description="E-commerce platform API documentation",
-      terms_of_service="https://www.google.com/policies/terms/",
-      contact=openapi.Contact(email="contact@ecommerce.local"),
-      license=openapi.License(name="BSD License"),
-   ),
-   public=True,
-)
+# Swagger documentation setup: the schema is generated once per code version (api/schema.py)
+schema_view = get_precomputed_schema_view()
 
 # Create a router and register the viewsets
 router = DefaultRouter()
@@ -27,6 +18,27 @@ router.register(r'products', ProductViewSet)  # Handles CRUD for products
 router.register(r'orders', OrderViewSet)  # Handles order management
 router.register(r'order-items', OrderItemViewSet)  # Handles order item details
 router.register(r'reviews', ReviewViewSet)  # Handles product reviews
+router.register(r'cart', CartViewSet, basename='cart')  # The current user's stock holds
+router.register(r'reports/sales', SalesReportViewSet, basename='sales-report')  # Sales reports from the rollups
+
+# Under ASGI (lux/asgi.py) the hot catalog reads are served by async views.
+# Other methods on the same URLs still reach the viewsets.
+async_catalog_urlpatterns = []
+if settings.ASYNC_CATALOG_READS:
+    router_views = {pattern.name: pattern.callback for pattern in router.urls}
+    async_catalog_urlpatterns = [
+        # Named like the routes they stand in for, so metrics label them the same
+        path('categories/', async_views.with_sync_fallback(async_views.category_list, router_views['category-list']),
+             name='category-list'),
+        path('products/', async_views.with_sync_fallback(async_views.product_list, router_views['product-list']),
+             name='product-list'),
+        path('products/popular/', async_views.with_sync_fallback(
+            async_views.popular_products, router_views['product-popular-products']), name='product-popular-products'),
+        path('products/search/', async_views.with_sync_fallback(
+            async_views.search_products, router_views['product-search-products']), name='product-search-products'),
+        re_path(r'^products/(?P<pk>[^/.]+)/$', async_views.with_sync_fallback(
+            async_views.product_detail, router_views['product-detail']), name='product-detail'),
+    ]
 
 # Define URL patterns for authentication, API endpoints, and documentation
 urlpatterns = [
@@ -38,6 +50,10 @@ urlpatterns = [
     path('docs/', schema_view.with_ui('swagger', cache_timeout=0), name='swagger-docs'),  # Swagger UI
     path('redoc/', schema_view.with_ui('redoc', cache_timeout=0), name='redoc-docs'),  # Redoc UI
     
+    # Prometheus metrics (api/metrics.py)
+    path('metrics/', MetricsView.as_view(), name='metrics'),
+
     # Include API routes from the router
+    *async_catalog_urlpatterns,
     path('', include(router.urls)),
 ]
\ No newline at end of file
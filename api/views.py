@@ -1,93 +1,418 @@
-from rest_framework import viewsets
-from rest_framework.permissions import IsAuthenticatedOrReadOnly
+from drf_yasg.utils import swagger_auto_schema
+from rest_framework import status, viewsets
+from rest_framework.permissions import BasePermission, IsAdminUser, IsAuthenticated, IsAuthenticatedOrReadOnly
+from rest_framework.views import APIView
+from rest_framework.parsers import MultiPartParser
 from rest_framework.decorators import action
+from rest_framework.generics import get_object_or_404
 from rest_framework.response import Response
-from django.core.cache import cache
-from django.db.models import Count, Avg, Q
-from .models import Category, Product, Order, OrderItem, Review
-from .serializers import CategorySerializer, ProductSerializer, OrderSerializer, OrderItemSerializer, ReviewSerializer
+from django.db.models import Prefetch
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.utils import timezone
+from .models import Category, Product, ProductStats, Order, OrderItem, Review, StockReservation, ArchivedOrder
+from .serializers import CategorySerializer, ProductSerializer, OrderSerializer, OrderItemSerializer, ReviewSerializer, CheckoutSerializer
+from .serializers import ProductDetailSerializer, ProductReviewSerializer, ReviewFeedQuerySerializer
+from .serializers import AvailabilityQuerySerializer, AvailabilitySerializer, CheckoutItemSerializer, ReservationSerializer
+from .serializers import ArchivedOrderSerializer
+from .serializers import SalesPeriodSerializer, SalesSeriesQuerySerializer, TopSalesQuerySerializer, TopSalesSerializer
 from .cach_keys import POPULAR_PRODUCTS_KEY_CACHE_KEY
+from .authentication import MetricsTokenAuthentication
+from .bulk import FORMATS, export_rows, guess_format, import_products, iter_records, text_stream
+from .caching import get_or_refresh
+from .checkout import place_order
+from .invalidation import CATALOG_TAG, POPULAR_TAG
+from .metrics import collect, flush, render
+from .fast_serializers import get_values_serializer
+from .fieldsets import select_fields
+from .mixins import CachedResponseMixin, QueryPlanMixin, ValuesListMixin
+from .query_plan import get_query_plan
+from .reservations import availability, release, reserve
+from .recommendations import RELATED_TAG, TOP_K, related_products
+from .rollups import sales_series, top_sales
+from .search import SEARCH_RESULT_LIMIT, get_search_backend
+from .pagination import (
+    CATEGORY_PRODUCT_PREVIEW_SIZE,
+    CategoryCursorPagination,
+    OrderCursorPagination,
+    OrderItemCursorPagination,
+    ProductCursorPagination,
+    ReviewCursorPagination,
+    ordering_columns,
+)
 
-class CategoryViewSet(viewsets.ModelViewSet):
+POPULAR_PRODUCTS_TIMEOUT = 3600
+RELATED_PRODUCTS_TIMEOUT = 3600
+RELATED_PRODUCTS_DEFAULT_LIMIT = 10
+
+
+def compute_popular_products(request):
+    """The 10 most popular products, serialized."""
+    # Read the top 10 straight off the popularity index of the maintained counters
+    # (units sold, order count and rating are updated by signals on OrderItem/Review writes)
+    top = ProductStats.objects.select_related('product').order_by(
+        '-order_count', '-rating_avg', '-product'
+    )[:10]
+    products = [stats.product for stats in top]
+    return get_values_serializer(ProductSerializer).serialize(products, {"request": request})
+
+
+def compute_related_products(request, product_id):
+    """The stored neighbours of a product, serialized."""
+    return get_values_serializer(ProductSerializer).serialize(related_products(product_id), {"request": request})
+
+
+def export_response(kind, request):
+    """Stream an export without building it in memory."""
+    fmt = request.GET.get('file_format', 'jsonl')
+    if fmt not in FORMATS:
+        return Response({'file_format': [f'Must be one of {", ".join(FORMATS)}.']}, status=status.HTTP_400_BAD_REQUEST)
+    content_type = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    response = StreamingHttpResponse(export_rows(kind, fmt), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{kind}.{fmt}"'
+    return response
+
+
+class CategoryViewSet(CachedResponseMixin, QueryPlanMixin, viewsets.ModelViewSet):
     """
     API endpoint that allows categories to be viewed or edited.
     """
-    queryset = Category.objects.prefetch_related('products').all()  # Optimize query to get category and related products
-                                                                    # loads categories and the producuts from database
-                                                                    # usually if you just say .all() it will return catagories and catagory.products.all 
-                                                                    # would make a seperate query to database. Now it loads data about products as well 
-                                                                    # so a second query does not need to be made
+    queryset = Category.objects.prefetch_related(
+        Prefetch(
+            'products',
+            queryset=Product.objects.order_by('-date_time_added', '-id')[:CATEGORY_PRODUCT_PREVIEW_SIZE],
+            to_attr='preview_products',
+        )
+    ).all()  # Prefetch only a bounded slice of products per category (one windowed query per page)
+             # instead of every product of every category. The full list of a category's
+             # products is paginated by the products action below.
     serializer_class = CategorySerializer
+    pagination_class = CategoryCursorPagination
+    throttle_scope = 'catalog'
+    cache_list_tags = ['category']
+    cache_detail_tags = ['category:{pk}', CATALOG_TAG]
+    conditional_get = True  # ETag / Last-Modified revalidation for polling clients
 
     # permission_classes = [IsAuthenticatedOrReadOnly]
 
+    @action(detail=True, methods=['GET'], url_path='products')
+    def products(self, request, pk=None):
+        """List the products of a category, newest first, one cursor page at a time."""
+        category = get_object_or_404(Category.objects.only('id'), pk=pk)
+        context = {"request": request}
+        queryset = get_query_plan(ProductSerializer(context=context)).apply(
+            Product.objects.filter(category=category), also=ordering_columns(ProductCursorPagination)
+        )
+        paginator = ProductCursorPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        serializer = ProductSerializer(page, many=True, context=context)
+        return paginator.get_paginated_response(serializer.data)
+
 
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(CachedResponseMixin, QueryPlanMixin, ValuesListMixin, viewsets.ModelViewSet):
     """
     API endpoint that allows products to be viewed or edited.
     """
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
+    pagination_class = ProductCursorPagination
+    throttle_scope = 'catalog'
+    cache_list_tags = ['product']
+    cache_detail_tags = ['product:{pk}', CATALOG_TAG]
+    conditional_get = True  # ETag / Last-Modified revalidation for polling clients
     # permission_classes = [IsAuthenticatedOrReadOnly]
 
+    def get_serializer_class(self):
+        # Product detail adds the review summary
+        if self.action == 'retrieve':
+            return ProductDetailSerializer
+        return super().get_serializer_class()
+
     @action(detail=False, methods=['GET'], url_path='popular')
     def popular_products(self, request):
-        cache_key = POPULAR_PRODUCTS_KEY_CACHE_KEY
-
-        # Check if popular products are cached
-        cached_data = cache.get(cache_key)
-        if not cached_data:
-            # Annotate each product with total sales (from OrderItem) and average review rating
-            products = Product.objects.annotate(
-                total_sales=Count('orderitem'),  # Count how many times a product has been ordered (via OrderItem)
-                avg_rating=Avg('reviews__rating')  # Average review rating for the product
-            ).order_by('-total_sales', '-avg_rating')[:10]  # Sort by total_sales first, then avg_rating
-            
-            # Serialize and cache the result
-            cached_data = ProductSerializer(products, many=True, context={"request": request}).data
-            cache.set(cache_key, cached_data, timeout=3600)  # Cache for 1 hour
-        
-        return Response(cached_data)
+        # Cached for about an hour in the shared cache; only one process recomputes it
+        # and the stale list keeps being served while it does
+        data = get_or_refresh(
+            POPULAR_PRODUCTS_KEY_CACHE_KEY, lambda: compute_popular_products(request),
+            timeout=POPULAR_PRODUCTS_TIMEOUT, tags=[POPULAR_TAG],
+        )
+        return Response(select_fields(data, request))
+
+    @action(detail=True, methods=['GET'], url_path='related')
+    def related(self, request, pk=None):
+        """
+        Products frequently bought together with this one, best first (?limit=, at most 20).
+        Read from the neighbours stored by the build_recommendations command.
+        """
+        product = get_object_or_404(Product.objects.only('id'), pk=pk)
+        try:
+            limit = min(max(int(request.GET.get('limit', RELATED_PRODUCTS_DEFAULT_LIMIT)), 1), TOP_K)
+        except ValueError:
+            limit = RELATED_PRODUCTS_DEFAULT_LIMIT
+        # Every limit shares one cached list; any product write or rebuild makes it stale
+        data = get_or_refresh(
+            f'related_products:{product.pk}', lambda: compute_related_products(request, product.pk),
+            timeout=RELATED_PRODUCTS_TIMEOUT, tags=['product', RELATED_TAG],
+        )
+        return Response(select_fields(data[:limit], request))
+
+    @swagger_auto_schema(query_serializer=ReviewFeedQuerySerializer, responses={200: ProductReviewSerializer(many=True)})
+    @action(detail=True, methods=['GET'], url_path='reviews', pagination_class=ReviewCursorPagination)
+    def reviews(self, request, pk=None):
+        """
+        The reviews of a product, newest first, one cursor page at a time (?rating= keeps one star rating).
+        Read from the (product, created_at, id) index; the rating breakdown is in the product's review_summary.
+        """
+        product = get_object_or_404(Product.objects.only('id'), pk=pk)
+        query = ReviewFeedQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        context = {"request": request}
+        queryset = Review.objects.filter(product=product)
+        if 'rating' in query.validated_data:
+            queryset = queryset.filter(rating=query.validated_data['rating'])
+        queryset = get_query_plan(ProductReviewSerializer(context=context)).apply(
+            queryset, also=ordering_columns(ReviewCursorPagination)
+        )
+        paginator = ReviewCursorPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        return paginator.get_paginated_response(ProductReviewSerializer(page, many=True, context=context).data)
+
+    @swagger_auto_schema(query_serializer=AvailabilityQuerySerializer, responses={200: AvailabilitySerializer(many=True)})
+    @action(detail=False, methods=['GET'], url_path='availability')
+    def availability(self, request):
+        """
+        Stock, units held by carts, and units still available for ?id=1&id=2...
+        Never cached: it changes with every cart.
+        """
+        query = AvailabilityQuerySerializer(data={'id': request.query_params.getlist('id')})
+        query.is_valid(raise_exception=True)
+        return Response(AvailabilitySerializer(availability(query.validated_data['id']), many=True).data)
+
+    @action(detail=False, methods=['POST'], url_path='import', permission_classes=[IsAdminUser],
+            parser_classes=[MultiPartParser])
+    def bulk_import(self, request):
+        """
+        Create or update products from an uploaded JSONL or CSV 'file'.
+        Rows are parsed as a stream and written in batches; the response
+        summarizes what was created, updated and rejected.
+        """
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'file': ['No file was submitted.']}, status=status.HTTP_400_BAD_REQUEST)
+        fmt = request.data.get('file_format') or guess_format(upload.name)
+        if fmt not in FORMATS:
+            return Response({'file_format': [f'Must be one of {", ".join(FORMATS)}.']}, status=status.HTTP_400_BAD_REQUEST)
+        summary = import_products(iter_records(text_stream(upload), fmt))
+        return Response(summary)
+
+    @action(detail=False, methods=['GET'], url_path='export', permission_classes=[IsAdminUser])
+    def export_products(self, request):
+        """Stream every product as JSONL (default) or CSV (?file_format=csv)."""
+        return export_response('products', request)
 
     @action(detail=False, methods=['GET'], url_path='search')
     def search_products(self, request):
         query = request.GET.get('query', '')
         
         if query:
-            # Search products using case-insensitive matching for title and description
-            products = Product.objects.filter(
-                Q(name__icontains=query) | Q(description__icontains=query)
-            )
+            try:
+                limit = min(int(request.GET.get('limit', SEARCH_RESULT_LIMIT)), SEARCH_RESULT_LIMIT)
+            except ValueError:
+                limit = SEARCH_RESULT_LIMIT
+            # Ranked full-text search (PostgreSQL tsvector/GIN, or the in-process inverted index elsewhere)
+            products = get_search_backend().search(query, limit=max(limit, 1))
             # Serialize the results
-            serializer = ProductSerializer(products, many=True, context={"request": request})
-            return Response(serializer.data)
+            data = get_values_serializer(ProductSerializer).serialize(products, {"request": request})
+            return Response(select_fields(data, request))
         else:
             return Response([], status=200)  # Return an empty list if no query is provided
 
 
 
-class OrderViewSet(viewsets.ModelViewSet):
+class OrderViewSet(CachedResponseMixin, QueryPlanMixin, viewsets.ModelViewSet):
     """
     API endpoint that allows orders to be viewed or edited.
     """
     queryset = Order.objects.all()
     serializer_class = OrderSerializer
+    pagination_class = OrderCursorPagination
+    throttle_scope = 'orders'
+    cache_list_tags = ['order', 'product']
+    cache_detail_tags = ['order:{pk}', 'product']
     permission_classes = [IsAuthenticatedOrReadOnly]
 
+    @action(detail=False, methods=['POST'], url_path='checkout', permission_classes=[IsAuthenticated],
+            serializer_class=CheckoutSerializer, throttle_scope='checkout')
+    def checkout(self, request):
+        """
+        Place an order for the current user from a cart of product ids and quantities.
+        Stock is taken atomically and prices come from the catalog; answers 409 when
+        a product does not have enough stock left.
+        """
+        serializer = CheckoutSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        items = [(item['product_id'], item['quantity']) for item in serializer.validated_data['items']]
+        order = place_order(request.user, items)
+        context = self.get_serializer_context()
+        # Read back with the lines and their products joined, not a query per line
+        order = get_query_plan(OrderSerializer(context=context)).apply(Order.objects.all()).get(pk=order.pk)
+        return Response(OrderSerializer(order, context=context).data, status=status.HTTP_201_CREATED)
+
 
-class OrderItemViewSet(viewsets.ModelViewSet):
+    def retrieve(self, request, *args, **kwargs):
+        """An order by id, read from the archive (api/archive.py) once it has been moved there."""
+        try:
+            return super().retrieve(request, *args, **kwargs)
+        except Http404:
+            context = self.get_serializer_context()
+            queryset = get_query_plan(ArchivedOrderSerializer(context=context)).apply(ArchivedOrder.objects.all())
+            archived = get_object_or_404(queryset, pk=kwargs[self.lookup_field])
+            return Response(ArchivedOrderSerializer(archived, context=context).data)
+
+    @swagger_auto_schema(responses={200: OrderSerializer(many=True)})
+    @action(detail=False, methods=['GET'], url_path='history', permission_classes=[IsAuthenticated],
+            pagination_class=OrderCursorPagination)
+    def history(self, request):
+        """
+        The current user's orders, newest first, one cursor page at a time: recent and
+        archived orders alike. Each table contributes a page read from its (user, order_date, id) index.
+        """
+        context = self.get_serializer_context()
+        serializer_classes = {Order: OrderSerializer, ArchivedOrder: ArchivedOrderSerializer}
+        querysets = [
+            get_query_plan(serializer_class(context=context)).apply(
+                model.objects.filter(user=request.user), also=ordering_columns(OrderCursorPagination)
+            )
+            for model, serializer_class in serializer_classes.items()
+        ]
+        paginator = OrderCursorPagination()
+        page = paginator.paginate_querysets(querysets, request, view=self)
+        data = {}
+        for model, serializer_class in serializer_classes.items():
+            rows = [row for row in page if type(row) is model]
+            data[model] = dict(zip([row.pk for row in rows], serializer_class(rows, many=True, context=context).data))
+        return paginator.get_paginated_response([data[type(row)][row.pk] for row in page])
+
+    @action(detail=False, methods=['GET'], url_path='export', permission_classes=[IsAdminUser])
+    def export_orders(self, request):
+        """Stream every order as JSONL (default) or CSV (?file_format=csv)."""
+        return export_response('orders', request)
+
+
+class OrderItemViewSet(CachedResponseMixin, QueryPlanMixin, viewsets.ModelViewSet):
     """
     API endpoint that allows order items to be viewed or edited.
     """
     queryset = OrderItem.objects.all()
     serializer_class = OrderItemSerializer
+    pagination_class = OrderItemCursorPagination
+    throttle_scope = 'orders'
+    cache_list_tags = ['orderitem', 'product']
+    cache_detail_tags = ['orderitem:{pk}', 'product']
     permission_classes = [IsAuthenticatedOrReadOnly]
 
+    @action(detail=False, methods=['GET'], url_path='export', permission_classes=[IsAdminUser])
+    def export_order_items(self, request):
+        """Stream every order item as JSONL (default) or CSV (?file_format=csv)."""
+        return export_response('order-items', request)
+
 
-class ReviewViewSet(viewsets.ModelViewSet):
+class ReviewViewSet(CachedResponseMixin, QueryPlanMixin, viewsets.ModelViewSet):
     """
     API endpoint that allows reviews to be viewed or edited.
     """
     queryset = Review.objects.all()
     serializer_class = ReviewSerializer
-    permission_classes = [IsAuthenticatedOrReadOnly]
\ No newline at end of file
+    pagination_class = ReviewCursorPagination
+    throttle_scope = 'reviews'
+    cache_list_tags = ['review', 'product']
+    cache_detail_tags = ['review:{pk}', 'product']
+    permission_classes = [IsAuthenticatedOrReadOnly]
+
+    def perform_create(self, serializer):
+        serializer.save(user=self.request.user)
+
+
+class SalesReportViewSet(viewsets.ViewSet):
+    """
+    Read-only sales reports for staff, served from the daily rollup tables
+    (api/rollups.py) instead of aggregating order history.
+    """
+    permission_classes = [IsAdminUser]
+    throttle_scope = 'reports'
+
+    @swagger_auto_schema(query_serializer=SalesSeriesQuerySerializer, responses={200: SalesPeriodSerializer(many=True)})
+    def list(self, request):
+        """Revenue, units and order lines per day, week or month, for some or all products or categories."""
+        query = SalesSeriesQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+        rows = sales_series(params['group'], params['start'], params['end'], ids=params.get('id'),
+                            statuses=params.get('status'), interval=params['interval'])
+        return Response(SalesPeriodSerializer(rows, many=True).data)
+
+    @swagger_auto_schema(query_serializer=TopSalesQuerySerializer, responses={200: TopSalesSerializer(many=True)})
+    @action(detail=False, methods=['GET'], url_path='top')
+    def top(self, request):
+        """The best-selling products or categories of the period by revenue, units or order lines."""
+        query = TopSalesQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+        rows = top_sales(params['group'], params['start'], params['end'], metric=params['metric'],
+                         statuses=params.get('status'), limit=params['limit'])
+        return Response(TopSalesSerializer(rows, many=True).data)
+
+
+class CartViewSet(viewsets.ViewSet):
+    """
+    The current user's stock holds (api/reservations.py). Holding a product
+    keeps its units out of other carts until the hold expires, is released,
+    or is consumed by checkout.
+    """
+    permission_classes = [IsAuthenticated]
+    throttle_scope = 'orders'
+    lookup_value_regex = r'\d+'  # The product id
+
+    @swagger_auto_schema(responses={200: ReservationSerializer(many=True)})
+    def list(self, request):
+        """The user's active holds."""
+        holds = StockReservation.objects.filter(user=request.user, expires_at__gt=timezone.now()).order_by('product_id')
+        return Response(ReservationSerializer(holds, many=True).data)
+
+    @swagger_auto_schema(request_body=CheckoutItemSerializer, responses={200: ReservationSerializer})
+    def create(self, request):
+        """
+        Hold quantity units of product_id, replacing any previous hold on it,
+        for STOCK_RESERVATION_TTL seconds. Answers 409 when not enough units are available.
+        """
+        serializer = CheckoutItemSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        hold = reserve(request.user, serializer.validated_data['product_id'], serializer.validated_data['quantity'])
+        return Response(ReservationSerializer(hold).data)
+
+    def destroy(self, request, pk=None):
+        """Release the hold on product pk."""
+        if not release(request.user, [pk]):
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class IsMetricsScraper(BasePermission):
+    """Requests authenticated by MetricsTokenAuthentication."""
+
+    def has_permission(self, request, view):
+        return request.auth == 'metrics'
+
+
+class MetricsView(APIView):
+    """
+    Runtime metrics of the whole deployment (api/metrics.py) in the Prometheus
+    text format, for the scraper (bearer METRICS_TOKEN) or staff.
+    """
+    authentication_classes = [MetricsTokenAuthentication, *APIView.authentication_classes]
+    permission_classes = [IsMetricsScraper | IsAdminUser]
+    throttle_classes = ()  # Scraped every few seconds
+    swagger_schema = None
+
+    def get(self, request):
+        flush()
+        return HttpResponse(render(collect()), content_type='text/plain; version=0.0.4; charset=utf-8')
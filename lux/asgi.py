@@ -12,5 +12,6 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'lux.settings')
+os.environ.setdefault('ASYNC_CATALOG_READS', '1')  # Catalog reads use the async views (api/async_views.py)
 
 application = get_asgi_application()
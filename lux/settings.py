@@ -55,6 +55,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.metrics.MetricsMiddleware',  # Latency, SQL and cache metrics, served at /api/metrics/
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -62,6 +63,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'api.routers.PrimaryPinningMiddleware',  # Read-after-write on the primary when replicas are configured
 ]
 
 ROOT_URLCONF = 'lux.urls'
@@ -88,28 +90,107 @@ WSGI_APPLICATION = 'lux.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.postgresql_psycopg2',
-        'NAME': os.getenv('DB_NAME'),
-        'USER': os.getenv('DB_USER'),
-        'PASSWORD': os.getenv('DB_PASSWORD'),
-        'HOST': os.getenv('DB_HOST'),
-        'PORT': '5432',
+DB_ENGINE = os.getenv('DB_ENGINE', 'postgresql')  # Options: 'postgresql', 'sqlite' (local runs)
+
+if DB_ENGINE == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.getenv('DB_NAME', os.path.join(BASE_DIR, 'db.sqlite3')),
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql_psycopg2',
+            'NAME': os.getenv('DB_NAME'),
+            'USER': os.getenv('DB_USER'),
+            'PASSWORD': os.getenv('DB_PASSWORD'),
+            'HOST': os.getenv('DB_HOST'),
+            'PORT': '5432',
+            # Keep connections open across requests instead of reconnecting each time,
+            # and check them before reuse so a dropped connection is replaced transparently
+            'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', '60')),
+            'CONN_HEALTH_CHECKS': True,
+        }
+    }
+
+# Read replicas: comma-separated hosts (PostgreSQL) or database files (SQLite).
+# Safe reads are spread over them by api.routers.PrimaryReplicaRouter; writes,
+# transactions and read-after-write stay on 'default'.
+DATABASE_REPLICAS = []
+for index, location in enumerate(filter(None, os.getenv('DB_REPLICAS', '').split(',')), start=1):
+    alias = f'replica_{index}'
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        ('NAME' if DB_ENGINE == 'sqlite' else 'HOST'): location.strip(),
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['api.routers.PrimaryReplicaRouter']
+
+# Seconds a client's reads stay on the primary after it wrote (upper bound of the replication lag)
+DATABASE_REPLICA_LAG = int(os.getenv('DB_REPLICA_LAG', '5'))
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# The cache must be shared by all gunicorn workers so that invalidation and the
+# single-flight recomputation in api/caching.py apply to the whole deployment.
+# Redis is the production backend: its add() and incr() are atomic. The file
+# backend implements them as a read then a write, so on it single-flight is
+# best-effort (two workers may both recompute a key) and the rate throttles of
+# api/throttling.py may undercount concurrent requests; use it for development only.
+
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'file')  # Options: 'file', 'redis', 'locmem'
+
+if CACHE_BACKEND == 'redis':
+    # Requires the redis package
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('CACHE_LOCATION', 'redis://127.0.0.1:6379/1'),
+        }
+    }
+elif CACHE_BACKEND == 'locmem':
+    # Per-process only: suitable for a single worker or tests
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+else:
+    # Shared by every worker on the host through the filesystem
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.getenv('CACHE_LOCATION', os.path.join(BASE_DIR, '.cache')),
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
     }
-}
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'api.authentication.CachedJWTAuthentication',  # JWT with the user read from the cache
+    ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.FastJSONRenderer',  # orjson when installed, same output as JSONRenderer
+        'rest_framework.renderers.BrowsableAPIRenderer',
     ],
+    # Sliding-window counters (api/throttling.py): constant cost per request at any rate
     'DEFAULT_THROTTLE_CLASSES': [
-        'rest_framework.throttling.AnonRateThrottle',  # Limit for anonymous users
-        'rest_framework.throttling.UserRateThrottle',  # Limit for authenticated users
+        'api.throttling.AnonRateThrottle',  # Limit for anonymous users
+        'api.throttling.UserRateThrottle',  # Limit for authenticated users
+        'api.throttling.ScopedRateThrottle',  # Per-viewset limits, see throttle_scope in api/views.py
     ],
     'DEFAULT_THROTTLE_RATES': {
         'anon': '10/day',   # Anonymous users can make 10 requests per day
         'user': '100/day',   # Authenticated users can make 100 requests per day
+        'catalog': '600/min',  # Categories and products
+        'orders': '120/min',  # Orders and order items
+        'reviews': '120/min',
+        'checkout': '20/min',
+        'reports': '60/min',  # Sales reports, read from the rollup tables
     }
 }
 
@@ -183,6 +264,37 @@ else:
     AZURE_CONTAINER = 'your-container-name'
     """
 
+# Serve the hot catalog reads (product list/detail/search/popular, category list)
+# with the async views of api/async_views.py. lux/asgi.py turns this on; under
+# WSGI the DRF viewsets serve everything.
+ASYNC_CATALOG_READS = os.getenv('ASYNC_CATALOG_READS', '0') == '1'
+
+# Threads generating product image variants after upload (api/images.py).
+# 0 generates them inline when the upload commits.
+PRODUCT_IMAGE_WORKERS = int(os.getenv('PRODUCT_IMAGE_WORKERS', '2'))
+
+# Seconds a cart holds its units (api/reservations.py). Expired holds are
+# released by the release_expired_reservations command; run it every minute.
+STOCK_RESERVATION_TTL = int(os.getenv('STOCK_RESERVATION_TTL', '900'))
+
+# Delivered and Cancelled orders older than this are moved to the archive
+# tables by the archive_orders command (api/archive.py).
+ORDER_ARCHIVE_AFTER_DAYS = int(os.getenv('ORDER_ARCHIVE_AFTER_DAYS', '365'))
+
+# Runtime metrics (api/metrics.py). Each worker writes its totals to METRICS_DIR
+# so /api/metrics/ covers every worker; an empty METRICS_DIR keeps them per process.
+METRICS_DIR = os.getenv('METRICS_DIR', os.path.join(BASE_DIR, '.metrics'))
+METRICS_FLUSH_SECONDS = float(os.getenv('METRICS_FLUSH_SECONDS', '5'))
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')  # Bearer token of the Prometheus scraper; staff can always read
+SLOW_REQUEST_SECONDS = float(os.getenv('SLOW_REQUEST_SECONDS', '1'))  # Logged with their worst SQL
+
+# Precomputed OpenAPI schemas (api/schema.py), one JSON and one YAML file per
+# code version; generate them at build time with generate_openapi_schema.
+SCHEMA_DIR = os.getenv('SCHEMA_DIR', os.path.join(BASE_DIR, '.schema'))
+
+# Multiplier of the latency budgets of api/benchmarks.py checked by bench_endpoints --check, for slower machines
+BENCHMARK_LATENCY_FACTOR = float(os.getenv('BENCHMARK_LATENCY_FACTOR', '1'))
+
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/5.1/howto/static-files/
 